@@ -0,0 +1,119 @@
+import numpy as np
+from bar_store import KST_OFFSET
+
+# 키움증권데이터가져오기.py 의 tick_ranges (1, 3, 5, 30분) 와 같은 타임프레임, 초 단위
+TIMEFRAMES = [60, 180, 300, 1800]
+
+# KRX 정규장 (점심시간 없이 연속), KST 자정부터의 초
+SESSION_OPEN = 9 * 3600
+SESSION_CLOSE = 15 * 3600 + 30 * 60
+
+
+def bucket_start(ts, timeframe):
+    # KST 자정 기준으로 구간 시작 시각 (09:00 개장과도 맞음)
+    return ts - (ts + KST_OFFSET) % timeframe
+
+
+def resample_bars(rows, timeframe, start=None):
+    # 분봉 (ts, open, high, low, close, volume) -> timeframe 봉 목록, 정렬된 입력 가정
+    # 구간은 실시간 BarAggregator 와 같은 bucket_start (15:30 종가 단일가 봉도 따로 한 구간)
+    # start: 입력이 빠짐없이 담고 있는 첫 시각. 이보다 먼저 시작하는 구간은 일부만 있으므로 만들지 않는다
+    # 구간 경계를 한 번에 구해서 reduceat 으로 고가/저가/거래량을 집계한다
+    if not len(rows):
+        return []
+    data = np.array(rows, dtype=np.float64)   # None (거래량 없음) -> NaN
+    buckets = bucket_start(data[:, 0].astype(np.int64), timeframe)
+    if start is not None:
+        keep = buckets >= start
+        data, buckets = data[keep], buckets[keep]
+        if not len(data):
+            return []
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(data)] - 1
+    opens = data[starts, 1]
+    highs = np.maximum.reduceat(data[:, 2], starts)
+    lows = np.minimum.reduceat(data[:, 3], starts)
+    closes = data[ends, 4]
+    volumes = np.add.reduceat(np.nan_to_num(data[:, 5]), starts)
+    return [(int(ts), int(o), int(h), int(l), int(c), int(v))
+            for ts, o, h, l, c, v in zip(buckets[starts], opens, highs, lows, closes, volumes)]
+
+
+class BarAggregator:
+    # 체결 시간 (FID 20) 기준으로 여러 타임프레임의 OHLCV 봉을 동시에 만든다.
+    # 구간이 끝나고 grace 초가 지나면 (모든 종목 중 가장 늦은 체결 시간 기준) 봉을 한 번만 내보낸다.
+    # grace 안에 늦게 들어온 체결은 원래 구간에 반영하고, 그 이후에 온 체결은 버리고 late 로 센다.
+
+    def __init__(self, timeframes=TIMEFRAMES, on_bar=None, grace=2):
+        self.timeframes = list(timeframes)
+        self.on_bar = on_bar
+        self.grace = grace
+        self.watermark = None
+        # timeframe -> {구간 시작: {code: [open, high, low, close, volume, 첫 체결 시각, 마지막 체결 시각]}}
+        self.open_bars = {tf: {} for tf in self.timeframes}
+        # timeframe -> 이미 내보낸 마지막 구간 시작
+        self.closed_until = {tf: None for tf in self.timeframes}
+        self.late = 0
+
+    def add_tick(self, code, ts, price, volume=0):
+        volume = abs(volume)
+        for tf in self.timeframes:
+            start = bucket_start(ts, tf)
+            closed = self.closed_until[tf]
+            if closed is not None and start <= closed:
+                self.late += 1
+                continue
+            buckets = self.open_bars[tf]
+            bars = buckets.get(start)
+            if bars is None:
+                bars = buckets[start] = {}
+            bar = bars.get(code)
+            if bar is None:
+                bars[code] = [price, price, price, price, volume, ts, ts]
+            else:
+                if price > bar[1]:
+                    bar[1] = price
+                if price < bar[2]:
+                    bar[2] = price
+                # 순서가 뒤바뀐 체결도 시가/종가는 체결 시간 기준으로
+                if ts >= bar[6]:
+                    bar[3] = price
+                    bar[6] = ts
+                elif ts < bar[5]:
+                    bar[0] = price
+                    bar[5] = ts
+                bar[4] += volume
+
+        if self.watermark is None or ts > self.watermark:
+            self.watermark = ts
+            self.advance(ts)
+
+    def advance(self, now_ts):
+        # now_ts 기준으로 끝난 구간의 봉을 내보낸다 (체결이 없는 시간에도 타이머로 호출 가능)
+        for tf in self.timeframes:
+            buckets = self.open_bars[tf]
+            while buckets:
+                start = min(buckets)
+                if start + tf + self.grace > now_ts:
+                    break
+                self._emit(tf, start, buckets.pop(start))
+
+    def flush(self):
+        # 장 종료/프로그램 종료 시 남은 봉을 모두 내보낸다
+        for tf in self.timeframes:
+            buckets = self.open_bars[tf]
+            for start in sorted(buckets):
+                self._emit(tf, start, buckets.pop(start))
+
+    def new_day(self):
+        # 날짜가 바뀌면 남은 봉을 내보내고 워터마크/내보낸 구간을 지운다 (전날 기준으로 늦은 체결 판정하지 않도록)
+        self.flush()
+        self.watermark = None
+        self.closed_until = {tf: None for tf in self.timeframes}
+
+    def _emit(self, tf, start, bars):
+        self.closed_until[tf] = start
+        if self.on_bar is None:
+            return
+        for code, bar in bars.items():
+            self.on_bar(code, tf, start, bar[0], bar[1], bar[2], bar[3], bar[4])
@@ -0,0 +1,716 @@
+import os
+import re
+import sqlite3
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+
+# 모든 종목/타임프레임의 봉을 하나의 테이블에 저장하는 저장소
+BAR_STORE_PATH = 'bars.db'
+
+# 한국 거래소 시간 (UTC+9, 서머타임 없음)
+KST = timezone(timedelta(hours=9))
+KST_OFFSET = 9 * 3600
+
+# timeframe 은 초 단위. 0 은 시간 기준이 아닌 틱 묶음 봉 (실시간 기록기의 예전 방식)
+TICK_BAR = 0
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+FEATURE_COLUMNS = ['symbol', 'timeframe', 'day', 'bars', 'prev_close', 'gap', 'first_open', 'first_close',
+                   'second_open', 'second_close', 'second_low', 'bullish_run', 'one_price', 'high', 'low',
+                   'volume', 'vwap']
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS bars (
+        symbol TEXT NOT NULL,
+        timeframe INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        open INTEGER,
+        high INTEGER,
+        low INTEGER,
+        close INTEGER,
+        volume INTEGER,
+        PRIMARY KEY (symbol, timeframe, ts)
+    ) WITHOUT ROWID;
+
+    -- 여러 종목을 시간 범위로 훑는 쿼리용 커버링 인덱스
+    CREATE INDEX IF NOT EXISTS idx_bars_timeframe_ts
+        ON bars (timeframe, ts, symbol, open, high, low, close, volume);
+
+    CREATE TABLE IF NOT EXISTS ticks (
+        symbol TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        price INTEGER,
+        volume INTEGER,
+        PRIMARY KEY (symbol, ts, seq)
+    ) WITHOUT ROWID;
+
+    -- 분봉 백필 진행 상황 (중단된 작업을 이어서 하기 위함)
+    CREATE TABLE IF NOT EXISTS backfill_progress (
+        job TEXT NOT NULL,
+        code TEXT NOT NULL,
+        timeframe INTEGER NOT NULL,
+        completed_at INTEGER NOT NULL,
+        PRIMARY KEY (job, code, timeframe)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS tracked_stocks (
+        cond_name TEXT NOT NULL,
+        code TEXT NOT NULL,
+        first_seen INTEGER NOT NULL,
+        PRIMARY KEY (cond_name, code, first_seen)
+    ) WITHOUT ROWID;
+
+    -- 예전 날짜별 DB 파일 (YYYYMMDD_조건식) 에 테이블이 있던 종목
+    -- (tracked_stocks 에 없거나 다른 조건식으로 기록된 종목도 있어서 그 파일의 차트 목록을 그대로 찾기 위함)
+    CREATE TABLE IF NOT EXISTS legacy_symbols (
+        db_name TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        PRIMARY KEY (db_name, symbol)
+    ) WITHOUT ROWID;
+
+    -- 조건검색 편입(I)/이탈(D) 이벤트 기록 (추가만 함), 같은 초의 이벤트는 seq 로 구분
+    -- price 는 이벤트 시점의 현재가, 그때 몰랐으면 구독 후 첫 체결가로 채움 (끝내 모르면 NULL)
+    CREATE TABLE IF NOT EXISTS condition_events (
+        cond_name TEXT NOT NULL,
+        code TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        price INTEGER,
+        PRIMARY KEY (cond_name, code, ts, seq)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_condition_events_code_ts ON condition_events (code, ts);
+    CREATE INDEX IF NOT EXISTS idx_condition_events_ts ON condition_events (ts);
+
+    -- (종목, 타임프레임, 날짜) 별 장 초반 특징 (session_features.py 가 봉을 쓸 때 같이 갱신)
+    -- day 는 KST 자정 epoch, first_/second_ 는 첫째/둘째 봉, bullish_run 은 둘째 봉부터 이어진 양봉 수,
+    -- one_price 는 그 마지막 양봉 종가, high/low/volume/vwap 은 첫 한 시간
+    CREATE TABLE IF NOT EXISTS session_features (
+        symbol TEXT NOT NULL,
+        timeframe INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        bars INTEGER,
+        prev_close INTEGER,
+        gap REAL,
+        first_open INTEGER,
+        first_close INTEGER,
+        second_open INTEGER,
+        second_close INTEGER,
+        second_low INTEGER,
+        bullish_run INTEGER,
+        one_price INTEGER,
+        high INTEGER,
+        low INTEGER,
+        volume INTEGER,
+        vwap REAL,
+        PRIMARY KEY (symbol, timeframe, day)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_session_features_day ON session_features (timeframe, day, symbol);
+
+    -- 외부 (yfinance) 에서 받은 일봉 (수정주가라 실시간 기록 봉과 섞지 않음), ts 는 KST 자정
+    CREATE TABLE IF NOT EXISTS daily_history (
+        symbol TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume INTEGER,
+        PRIMARY KEY (symbol, ts)
+    ) WITHOUT ROWID;
+
+    -- 이미 받아 본 [start, end) 구간 (휴장일처럼 봉이 없는 날을 다시 받지 않기 위함)
+    CREATE TABLE IF NOT EXISTS daily_coverage (
+        symbol TEXT NOT NULL,
+        start INTEGER NOT NULL,
+        end INTEGER NOT NULL,
+        PRIMARY KEY (symbol, start, end)
+    ) WITHOUT ROWID;
+
+    -- 종목별 yfinance 시장 접미어 (.KS / .KQ)
+    CREATE TABLE IF NOT EXISTS ticker_suffix (
+        symbol TEXT PRIMARY KEY,
+        suffix TEXT NOT NULL
+    );
+'''
+
+
+def to_epoch(value):
+    # 'YYYY-MM-DD HH:MM:SS', 'YYYYMMDDHHMMSS' 문자열 또는 naive KST datetime -> epoch 초
+    if isinstance(value, str):
+        value = value.strip()
+        fmt = '%Y%m%d%H%M%S' if value.isdigit() else '%Y-%m-%d %H:%M:%S'
+        value = datetime.strptime(value, fmt)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=KST)
+    return int(value.timestamp())
+
+
+def from_epoch(ts):
+    return datetime.fromtimestamp(ts, KST).replace(tzinfo=None)
+
+
+def to_datetime_index(ts):
+    # epoch 초 Series/배열 -> naive KST DatetimeIndex (차트/분석용)
+    return pd.to_datetime(pd.Series(ts).to_numpy() + KST_OFFSET, unit='s')
+
+
+def frame_rows(df, columns):
+    # DataFrame -> sqlite3 에 바로 넣을 수 있는 파이썬 값 튜플 (numpy 정수/NaN 변환)
+    df = df[columns].astype(object)
+    return df.where(df.notna(), None).itertuples(index=False, name=None)
+
+
+def hhmmss_to_epoch(time_str, day_start):
+    # 체결 시간 (FID 20, 'HHMMSS') -> epoch 초, datetime 객체를 만들지 않는다
+    return day_start + int(time_str[0:2]) * 3600 + int(time_str[2:4]) * 60 + int(time_str[4:6])
+
+
+def kst_day_start(ts):
+    # epoch 초 -> 그 시각이 속한 KST 날짜의 자정 (epoch 초)
+    ts = int(ts)
+    return ts - (ts + KST_OFFSET) % 86400
+
+
+def day_range(date_str):
+    # 'YYYYMMDD' 또는 'YYYY-MM-DD' 하루의 [시작, 끝) epoch 초
+    start = to_epoch(datetime.strptime(date_str.replace('-', ''), '%Y%m%d'))
+    return start, start + 24 * 3600
+
+
+def timeframe_label(timeframe):
+    if timeframe == TICK_BAR:
+        return '틱'
+    if timeframe < 60:
+        return f'{timeframe}초'
+    return f'{timeframe // 60}분'
+
+
+def parse_db_name(db_name):
+    # 'YYYYMMDD_<조건식>.db' -> ('YYYYMMDD', '<조건식>')
+    name = os.path.splitext(os.path.basename(db_name))[0]
+    match = re.match(r'(\d{8})_(.+)$', name)
+    if not match:
+        raise ValueError(f"Filename does not contain a valid date: {db_name}")
+    return match.group(1), match.group(2)
+
+
+class BarStore:
+    def __init__(self, db_path=BAR_STORE_PATH):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.create_schema()
+
+    def create_schema(self):
+        self.conn.executescript(SCHEMA)
+        self._migrate_condition_events()
+        self.conn.commit()
+
+    def _migrate_condition_events(self):
+        # seq 가 없던 condition_events (PRIMARY KEY 에 type) 를 새 구조로 옮긴다
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(condition_events)')]
+        if 'seq' in columns:
+            return
+        self.conn.executescript('''
+            ALTER TABLE condition_events RENAME TO condition_events_old;
+            DROP INDEX IF EXISTS idx_condition_events_code_ts;
+            DROP INDEX IF EXISTS idx_condition_events_ts;
+        ''')
+        self.conn.executescript(SCHEMA)
+        self.conn.execute('''
+            INSERT INTO condition_events (cond_name, code, ts, seq, type, price)
+            SELECT cond_name, code, ts, ROW_NUMBER() OVER (PARTITION BY cond_name, code, ts ORDER BY type DESC) - 1,
+                   type, price
+            FROM condition_events_old
+        ''')
+        self.conn.execute('DROP TABLE condition_events_old')
+
+    def set_wal_mode(self):
+        # 기록 스레드와 조회가 서로 막지 않도록 WAL, fsync 는 체크포인트 때만
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
+    def write_bars(self, rows, commit=True):
+        # rows: (symbol, timeframe, ts, open, high, low, close, volume)
+        self.conn.executemany('''
+            INSERT OR REPLACE INTO bars (symbol, timeframe, ts, open, high, low, close, volume)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        if commit:
+            self.conn.commit()
+
+    def upsert_bars(self, symbol, timeframe, rows, commit=True):
+        # rows: (ts, open, high, low, close, volume)
+        self.write_bars(((symbol, timeframe) + tuple(row) for row in rows), commit)
+
+    def write_ticks(self, rows, commit=True):
+        # rows: (symbol, ts, seq, price, volume)
+        self.conn.executemany('''
+            INSERT OR REPLACE INTO ticks (symbol, ts, seq, price, volume)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+        if commit:
+            self.conn.commit()
+
+    def insert_ticks(self, symbol, rows, commit=True):
+        # rows: (ts, seq, price, volume)
+        self.write_ticks(((symbol,) + tuple(row) for row in rows), commit)
+
+    def upsert_tracked_stocks(self, rows, commit=True):
+        # rows: (cond_name, code, first_seen epoch)
+        self.conn.executemany('''
+            INSERT OR IGNORE INTO tracked_stocks (cond_name, code, first_seen)
+            VALUES (?, ?, ?)
+        ''', rows)
+        if commit:
+            self.conn.commit()
+
+    def write_condition_events(self, rows, commit=True):
+        # rows: (cond_name, code, ts, seq, type, price)
+        # 이미 있는 이벤트를 다시 쓰면 비어 있던 price 만 채운다
+        self.conn.executemany('''
+            INSERT INTO condition_events (cond_name, code, ts, seq, type, price)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (cond_name, code, ts, seq) DO UPDATE SET price = COALESCE(condition_events.price, excluded.price)
+        ''', rows)
+        if commit:
+            self.conn.commit()
+
+    def last_bar_times(self, timeframe, symbols=None):
+        # 종목별 마지막으로 저장된 봉의 ts (PRIMARY KEY 로 종목마다 한 번에 찾음)
+        query = 'SELECT symbol, MAX(ts) FROM bars WHERE timeframe = ?'
+        params = [timeframe]
+        if symbols is not None:
+            symbols = list(symbols)
+            query += f" AND symbol IN ({','.join('?' * len(symbols))})"
+            params.extend(symbols)
+        return dict(self.conn.execute(query + ' GROUP BY symbol', params).fetchall())
+
+    def bar_rows(self, symbol, timeframe, start=None):
+        # 한 종목의 봉을 (ts, open, high, low, close, volume) 튜플로 (리샘플링용)
+        query = 'SELECT ts, open, high, low, close, volume FROM bars WHERE symbol = ? AND timeframe = ?'
+        params = [symbol, timeframe]
+        if start is not None:
+            query += ' AND ts >= ?'
+            params.append(start)
+        return self.conn.execute(query + ' ORDER BY ts', params).fetchall()
+
+    def bar_day_counts(self, timeframe):
+        # KST 날짜 (자정 epoch) 별 (봉 수, 마지막 ts, 가격/거래량 합계) (내보내기 캐시가 바뀐 날만 다시 만들 때 사용)
+        # INSERT OR REPLACE 로 같은 봉을 고쳐 쓰면 봉 수/마지막 ts 는 그대로이므로 합계로 내용 변경을 잡는다
+        rows = self.conn.execute('''
+            SELECT (ts + ?) / 86400 AS day, COUNT(*), MAX(ts),
+                   SUM(open), SUM(high), SUM(low), SUM(close), TOTAL(volume), COUNT(volume) FROM bars
+            WHERE timeframe = ? GROUP BY day ORDER BY day
+        ''', (KST_OFFSET, timeframe))
+        return {row[0] * 86400 - KST_OFFSET: (row[1], row[2], list(row[3:])) for row in rows}
+
+    def bar_range_rows(self, timeframe, start, end, symbols=None):
+        # [start, end) 종목들의 봉을 (symbol, ts, open, high, low, close, volume) 튜플로, 종목/시간 순
+        query = 'SELECT symbol, ts, open, high, low, close, volume FROM bars WHERE timeframe = ? AND ts >= ? AND ts < ?'
+        params = [timeframe, start, end]
+        if symbols is not None:
+            symbols = list(symbols)
+            query += f" AND symbol IN ({','.join('?' * len(symbols))})"
+            params.extend(symbols)
+        return self.conn.execute(query + ' ORDER BY symbol, ts', params).fetchall()
+
+    def previous_closes(self, timeframe, before, symbols):
+        # 종목별 before 이전 마지막 봉의 종가 (PRIMARY KEY 로 종목마다 한 번에 찾음)
+        symbols = list(symbols)
+        rows = self.conn.execute(f'''
+            SELECT b.symbol, b.close FROM bars b
+            JOIN (SELECT symbol, MAX(ts) AS ts FROM bars
+                  WHERE timeframe = ? AND ts < ? AND symbol IN ({','.join('?' * len(symbols))})
+                  GROUP BY symbol) last
+              ON last.symbol = b.symbol AND last.ts = b.ts
+            WHERE b.timeframe = ?
+        ''', [timeframe, before] + symbols + [timeframe])
+        return dict(rows.fetchall())
+
+    def write_session_features(self, rows, commit=True):
+        # rows: session_features 컬럼 순서의 튜플
+        self.conn.executemany(f'''
+            INSERT OR REPLACE INTO session_features ({', '.join(FEATURE_COLUMNS)})
+            VALUES ({', '.join('?' * len(FEATURE_COLUMNS))})
+        ''', rows)
+        if commit:
+            self.conn.commit()
+
+    def session_day_keys(self, timeframe, session_end, start=None, end=None):
+        # 장 시작 ~ session_end (KST 자정 기준 초) 사이에 봉이 있는 (종목, 날짜) 목록 (특징 다시 만들기용)
+        query = 'SELECT DISTINCT symbol, (ts + ?) / 86400 FROM bars WHERE timeframe = ? AND (ts + ?) % 86400 < ?'
+        params = [KST_OFFSET, timeframe, KST_OFFSET, session_end]
+        if start is not None:
+            query += ' AND ts >= ?'
+            params.append(start)
+        if end is not None:
+            query += ' AND ts < ?'
+            params.append(end)
+        return [(symbol, day * 86400 - KST_OFFSET) for symbol, day in self.conn.execute(query, params)]
+
+    def fetch_session_features(self, timeframe, start, end, symbols=None, cond_name=None):
+        # [start, end) 날짜의 특징 행. cond_name 이 있으면 그날 그 조건식에 편입된 종목만
+        params = []
+        join = ''
+        if cond_name is not None:
+            join = '''JOIN (SELECT DISTINCT code, (first_seen + ?) / 86400 * 86400 - ? AS day FROM tracked_stocks
+                             WHERE cond_name = ? AND first_seen >= ? AND first_seen < ?) t
+                     ON t.code = f.symbol AND t.day = f.day'''
+            params = [KST_OFFSET, KST_OFFSET, cond_name, start, end]
+        where = 'f.timeframe = ? AND f.day >= ? AND f.day < ?'
+        params += [timeframe, start, end]
+        if symbols is not None:
+            symbols = list(symbols)
+            where += f" AND f.symbol IN ({','.join('?' * len(symbols))})"
+            params.extend(symbols)
+        query = f'''
+            SELECT {', '.join('f.' + column for column in FEATURE_COLUMNS)}
+            FROM session_features f {join}
+            WHERE {where}
+            ORDER BY f.symbol, f.day
+        '''
+        df = pd.read_sql_query(query, self.conn, params=params)
+        df['date'] = to_datetime_index(df.pop('day'))
+        return df
+
+    def tracked_codes(self, cond_name, start, end):
+        rows = self.conn.execute('''
+            SELECT DISTINCT code FROM tracked_stocks
+            WHERE cond_name = ? AND first_seen >= ? AND first_seen < ? ORDER BY code
+        ''', (cond_name, start, end))
+        return [code for code, in rows]
+
+    def add_legacy_symbols(self, db_name, symbols, commit=True):
+        self.conn.executemany('INSERT OR IGNORE INTO legacy_symbols (db_name, symbol) VALUES (?, ?)',
+                              ((db_name, symbol) for symbol in symbols))
+        if commit:
+            self.conn.commit()
+
+    def legacy_symbols(self, db_name):
+        rows = self.conn.execute('SELECT symbol FROM legacy_symbols WHERE db_name = ? ORDER BY symbol', (db_name,))
+        return [symbol for symbol, in rows]
+
+    def chart_symbols(self, cond_name, db_name, start, end):
+        # 그날 조건식에 편입된 종목 + 예전 날짜별 DB 파일 (db_name) 에 테이블이 있던 종목 (차트/분석 대상)
+        name = os.path.splitext(os.path.basename(db_name))[0]
+        return sorted(set(self.tracked_codes(cond_name, start, end)) | set(self.legacy_symbols(name)))
+
+    def bar_symbols(self, start, end):
+        # [start, end) 에 봉이 있는 종목 (타임프레임 무관)
+        rows = self.conn.execute('SELECT DISTINCT symbol FROM bars WHERE ts >= ? AND ts < ? ORDER BY symbol', (start, end))
+        return [symbol for symbol, in rows]
+
+    def completed_backfill(self, job):
+        rows = self.conn.execute('SELECT code, timeframe FROM backfill_progress WHERE job = ?', (job,))
+        return set(rows.fetchall())
+
+    def mark_backfill_done(self, job, code, timeframe, commit=True):
+        self.conn.execute('''
+            INSERT OR REPLACE INTO backfill_progress (job, code, timeframe, completed_at)
+            VALUES (?, ?, ?, strftime('%s', 'now'))
+        ''', (job, code, timeframe))
+        if commit:
+            self.conn.commit()
+
+    def tracked_days(self, cond_name, start=None, end=None):
+        # 조건식에 편입 종목이 있었던 날 (KST 자정 epoch) 목록
+        query = 'SELECT DISTINCT (first_seen + ?) / 86400 FROM tracked_stocks WHERE cond_name = ?'
+        params = [KST_OFFSET, cond_name]
+        if start is not None:
+            query += ' AND first_seen >= ?'
+            params.append(start)
+        if end is not None:
+            query += ' AND first_seen < ?'
+            params.append(end)
+        rows = self.conn.execute(query + ' ORDER BY 1', params).fetchall()
+        return [day * 86400 - KST_OFFSET for day, in rows]
+
+    def _tracked_join(self, cond_name, tracked_range):
+        # cond_name/tracked_range 가 주어지면 해당 조건식에 그 기간 편입된 종목으로 한정한다.
+        if cond_name is None:
+            return '', []
+        sql = 'JOIN (SELECT DISTINCT code FROM tracked_stocks WHERE cond_name = ?'
+        params = [cond_name]
+        if tracked_range is not None:
+            sql += ' AND first_seen >= ? AND first_seen < ?'
+            params.extend(tracked_range)
+        return sql + ') t ON t.code = b.symbol', params
+
+    def fetch_bars(self, timeframe, start=None, end=None, symbols=None, cond_name=None, tracked_range=None):
+        # 한 번의 쿼리로 여러 종목의 봉을 가져온다.
+        join, params = self._tracked_join(cond_name, tracked_range)
+        where = ['b.timeframe = ?']
+        params.append(timeframe)
+        if start is not None:
+            where.append('b.ts >= ?')
+            params.append(start)
+        if end is not None:
+            where.append('b.ts < ?')
+            params.append(end)
+        if symbols is not None:
+            symbols = list(symbols)
+            where.append(f"b.symbol IN ({','.join('?' * len(symbols))})")
+            params.extend(symbols)
+        query = f'''
+            SELECT b.symbol, b.ts, b.open, b.high, b.low, b.close, b.volume
+            FROM bars b {join}
+            WHERE {' AND '.join(where)}
+            ORDER BY b.symbol, b.ts
+        '''
+        return self._to_frame(pd.read_sql_query(query, self.conn, params=params))
+
+    def fetch_session_bars(self, timeframe, start, end, session, cond_name=None):
+        # [start, end) 기간 매일 session (KST 자정 기준 초, 예: 9시~10시) 구간의 봉을 한 번에 조회
+        # cond_name 이 있으면 그날 그 조건식에 편입된 종목의 봉만
+        params = []
+        join = ''
+        if cond_name is not None:
+            join = '''JOIN (SELECT DISTINCT code, (first_seen + ?) / 86400 AS day FROM tracked_stocks
+                             WHERE cond_name = ? AND first_seen >= ? AND first_seen < ?) t
+                     ON t.code = b.symbol AND t.day = (b.ts + ?) / 86400'''
+            params = [KST_OFFSET, cond_name, start, end, KST_OFFSET]
+        params += [timeframe, start, end, KST_OFFSET, session[0], KST_OFFSET, session[1]]
+        query = f'''
+            SELECT b.symbol, b.ts, b.open, b.high, b.low, b.close, b.volume
+            FROM bars b {join}
+            WHERE b.timeframe = ? AND b.ts >= ? AND b.ts < ?
+              AND (b.ts + ?) % 86400 >= ? AND (b.ts + ?) % 86400 < ?
+            ORDER BY b.symbol, b.ts
+        '''
+        return self._to_frame(pd.read_sql_query(query, self.conn, params=params))
+
+    def fetch_latest_bars(self, limit, end=None, cond_name=None, tracked_range=None, symbols=None):
+        # (종목, 타임프레임)별 최근 limit 개 봉을 한 번의 쿼리로 가져온다.
+        join, params = self._tracked_join(cond_name, tracked_range)
+        where = []
+        if end is not None:
+            where.append('b.ts < ?')
+            params.append(end)
+        if symbols is not None:
+            symbols = list(symbols)
+            where.append(f"b.symbol IN ({','.join('?' * len(symbols))})")
+            params.extend(symbols)
+        where = ('WHERE ' + ' AND '.join(where)) if where else ''
+        params.append(limit)
+        query = f'''
+            SELECT symbol, timeframe, ts, open, high, low, close, volume FROM (
+                SELECT b.*, ROW_NUMBER() OVER (
+                    PARTITION BY b.symbol, b.timeframe ORDER BY b.ts DESC) AS rn
+                FROM bars b {join} {where}
+            ) WHERE rn <= ?
+            ORDER BY symbol, timeframe, ts
+        '''
+        return self._to_frame(pd.read_sql_query(query, self.conn, params=params))
+
+    def _event_filter(self, cond_name, start, end):
+        where, params = [], []
+        if cond_name is not None:
+            where.append('cond_name = ?')
+            params.append(cond_name)
+        if start is not None:
+            where.append('ts >= ?')
+            params.append(start)
+        if end is not None:
+            where.append('ts < ?')
+            params.append(end)
+        return ('WHERE ' + ' AND '.join(where)) if where else '', params
+
+    def fetch_condition_events(self, cond_name=None, code=None, start=None, end=None):
+        where, params = self._event_filter(cond_name, start, end)
+        if code is not None:
+            where += (' AND ' if where else 'WHERE ') + 'code = ?'
+            params.append(code)
+        query = f'SELECT cond_name, code, ts, type, price FROM condition_events {where} ORDER BY ts, code, seq'
+        return self._to_frame(pd.read_sql_query(query, self.conn, params=params))
+
+    def condition_stays(self, cond_name=None, start=None, end=None):
+        # 편입(I) 부터 바로 다음 이탈(D) 까지 한 행, 아직 이탈하지 않았으면 exited/duration 은 NULL
+        where, params = self._event_filter(cond_name, start, end)
+        query = f'''
+            SELECT cond_name, code, ts AS entered, price AS entry_price,
+                   CASE WHEN next_type = 'D' THEN next_ts END AS exited,
+                   CASE WHEN next_type = 'D' THEN next_price END AS exit_price,
+                   CASE WHEN next_type = 'D' THEN next_ts - ts END AS duration
+            FROM (
+                SELECT cond_name, code, ts, type, price,
+                       LEAD(type) OVER w AS next_type,
+                       LEAD(ts) OVER w AS next_ts,
+                       LEAD(price) OVER w AS next_price
+                FROM condition_events {where}
+                WINDOW w AS (PARTITION BY cond_name, code ORDER BY ts, seq)
+            )
+            WHERE type = 'I'
+            ORDER BY entered, code
+        '''
+        df = pd.read_sql_query(query, self.conn, params=params)
+        df['entered'] = to_datetime_index(df['entered'])
+        df['exited'] = to_datetime_index(df['exited'])
+        return df
+
+    def active_condition_codes(self, cond_name=None, start=None, end=None):
+        # 마지막 이벤트가 편입(I) 인 종목 (지금 조건에 들어와 있는 종목)
+        where, params = self._event_filter(cond_name, start, end)
+        rows = self.conn.execute(f'''
+            SELECT DISTINCT code FROM (
+                SELECT code, type, ROW_NUMBER() OVER (PARTITION BY cond_name, code ORDER BY ts DESC, seq DESC) AS rn
+                FROM condition_events {where}
+            )
+            WHERE rn = 1 AND type = 'I'
+            ORDER BY code
+        ''', params)
+        return [code for code, in rows]
+
+    def condition_reentries(self, cond_name=None, start=None, end=None):
+        # 종목별 편입/이탈 횟수 (재편입 = 편입 - 1)
+        where, params = self._event_filter(cond_name, start, end)
+        query = f'''
+            SELECT cond_name, code,
+                   SUM(type = 'I') AS entries,
+                   MAX(SUM(type = 'I') - 1, 0) AS reentries,
+                   SUM(type = 'D') AS exits,
+                   MIN(ts) AS first_event,
+                   MAX(ts) AS last_event
+            FROM condition_events {where}
+            GROUP BY cond_name, code
+            ORDER BY entries DESC, code
+        '''
+        df = pd.read_sql_query(query, self.conn, params=params)
+        df['first_event'] = to_datetime_index(df['first_event'])
+        df['last_event'] = to_datetime_index(df['last_event'])
+        return df
+
+    def write_daily_history(self, symbol, rows, commit=True):
+        # rows: (ts, open, high, low, close, volume)
+        self.conn.executemany('''
+            INSERT OR REPLACE INTO daily_history (symbol, ts, open, high, low, close, volume)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', ((symbol,) + tuple(row) for row in rows))
+        if commit:
+            self.conn.commit()
+
+    def daily_history_rows(self, symbol, start, end):
+        query = '''SELECT ts, open, high, low, close, volume FROM daily_history
+                   WHERE symbol = ? AND ts >= ? AND ts < ? ORDER BY ts'''
+        return self.conn.execute(query, (symbol, start, end)).fetchall()
+
+    def daily_coverage(self, symbol):
+        rows = self.conn.execute('SELECT start, end FROM daily_coverage WHERE symbol = ? ORDER BY start', (symbol,))
+        return rows.fetchall()
+
+    def add_daily_coverage(self, symbol, start, end, commit=True):
+        self.conn.execute('INSERT OR IGNORE INTO daily_coverage (symbol, start, end) VALUES (?, ?, ?)',
+                          (symbol, start, end))
+        if commit:
+            self.conn.commit()
+
+    def clear_daily_history(self, symbol, commit=True):
+        # 수정주가 기준이 바뀌었을 때 받은 일봉/구간을 지우고 다시 받는다
+        self.conn.execute('DELETE FROM daily_history WHERE symbol = ?', (symbol,))
+        self.conn.execute('DELETE FROM daily_coverage WHERE symbol = ?', (symbol,))
+        if commit:
+            self.conn.commit()
+
+    def ticker_suffix(self, symbol):
+        row = self.conn.execute('SELECT suffix FROM ticker_suffix WHERE symbol = ?', (symbol,)).fetchone()
+        return row[0] if row else None
+
+    def set_ticker_suffix(self, symbol, suffix, commit=True):
+        self.conn.execute('INSERT OR REPLACE INTO ticker_suffix (symbol, suffix) VALUES (?, ?)', (symbol, suffix))
+        if commit:
+            self.conn.commit()
+
+    def _to_frame(self, df):
+        df['date'] = to_datetime_index(df.pop('ts'))
+        return df
+
+    def close(self):
+        self.conn.close()
+
+
+def _infer_timeframe(times):
+    # 타임프레임 접두어가 없는 테이블: 가장 흔한 봉 간격으로 추정
+    diffs = pd.Series(sorted(times)).diff().dropna()
+    diffs = diffs[diffs > 0]
+    return int(diffs.mode().iloc[0]) if not diffs.empty else 60
+
+
+def migrate_legacy_db(store, db_path):
+    # 예전 테이블 구조 (종목별/타임프레임별 테이블)의 .db 파일을 BarStore 로 옮긴다.
+    # 옮긴 봉의 장 초반 특징 (session_features) 도 같은 트랜잭션에서 만든다
+    from session_features import feature_keys, update_features   # session_features 가 이 모듈을 import 함
+    src = sqlite3.connect(db_path)
+    tables = [row[0] for row in src.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    migrated = 0
+    symbols = set()
+    keys = set()
+    try:
+        for table in tables:
+            if table == 'tracked_stocks':
+                rows = src.execute('SELECT code, first_seen, cond_name FROM tracked_stocks').fetchall()
+                rows = [(cond, code, to_epoch(seen)) for code, seen, cond in rows]
+                store.upsert_tracked_stocks(rows, commit=False)
+                # 예전 파일에는 첫 편입만 남아 있으므로 편입(I) 이벤트로 옮긴다
+                store.write_condition_events(((cond, code, seen, 0, 'I', None) for cond, code, seen in rows), commit=False)
+                continue
+
+            tick_match = re.match(r'stock_(\d{6})_주식체결$', table)
+            if tick_match:
+                rows = src.execute(f'SELECT time, price FROM "{table}" ORDER BY id').fetchall()
+                ticks, seq, last_ts = [], 0, None
+                for time_str, price in rows:
+                    ts = to_epoch(time_str)
+                    seq = seq + 1 if ts == last_ts else 0
+                    last_ts = ts
+                    ticks.append((ts, seq, price, None))
+                store.insert_ticks(tick_match.group(1), ticks, commit=False)
+                symbols.add(tick_match.group(1))
+                migrated += 1
+                continue
+
+            match = re.match(r'(?:(\d+)분_)?(\d{6})$', table)
+            stock_match = re.match(r'stock_(\d{6})$', table)
+            if match:
+                rows = src.execute(f'SELECT date, open, high, low, close, volume FROM "{table}"').fetchall()
+                rows = [(to_epoch(r[0]),) + tuple(r[1:]) for r in rows]
+                if match.group(1):
+                    timeframe = int(match.group(1)) * 60
+                else:
+                    timeframe = _infer_timeframe(r[0] for r in rows)
+                store.upsert_bars(match.group(2), timeframe, rows, commit=False)
+                keys |= feature_keys((match.group(2), timeframe, row[0]) for row in rows)
+                symbols.add(match.group(2))
+            elif stock_match:
+                rows = src.execute(f'SELECT time, open, high, low, close FROM "{table}"').fetchall()
+                rows = [(to_epoch(r[0]),) + tuple(r[1:]) + (None,) for r in rows]
+                store.upsert_bars(stock_match.group(1), TICK_BAR, rows, commit=False)
+                symbols.add(stock_match.group(1))
+            else:
+                print(f"Skipping unknown table {table} in {db_path}")
+                continue
+            migrated += 1
+        store.add_legacy_symbols(os.path.splitext(os.path.basename(db_path))[0], sorted(symbols), commit=False)
+        update_features(store, keys, commit=False)
+        store.conn.commit()
+    except Exception:
+        store.conn.rollback()
+        raise
+    finally:
+        src.close()
+    print(f"Migrated {migrated} tables from {db_path}")
+    return migrated
+
+
+if __name__ == "__main__":
+    import glob
+    import sys
+
+    # 사용법: python bar_store.py [대상.db ...]  (인자가 없으면 현재 폴더의 모든 .db)
+    store = BarStore()
+    db_files = sys.argv[1:] or [path for path in sorted(glob.glob('*.db'))
+                                if os.path.abspath(path) != os.path.abspath(store.db_path)]
+    for db_file in db_files:
+        migrate_legacy_db(store, db_file)
+    store.close()
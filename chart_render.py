@@ -0,0 +1,130 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+
+# 해상도/크기 프리셋 (DBVisualizer 는 예전과 같은 print, 분석 차트는 screen)
+PRESETS = {
+    'preview': {'dpi': 100, 'figsize': (10, 6)},
+    'screen': {'dpi': 200, 'figsize': (10, 6)},
+    'print': {'dpi': 800, 'figsize': (10, 6)},
+}
+CACHE_FILENAME = '.chart_hashes.json'
+
+logger = logging.getLogger(__name__)
+
+
+def make_job(path, df, title, volume=False, hlines=(), **plot_kwargs):
+    # 워커 프로세스로 보낼 차트 작업. hlines: (가격, 색, 두께, 라벨) 목록
+    return {'path': path, 'df': df, 'title': title, 'volume': volume,
+            'hlines': list(hlines), 'plot_kwargs': plot_kwargs}
+
+
+def job_hash(job, preset):
+    # 데이터와 그리는 옵션이 같으면 같은 해시 -> 다시 그리지 않는다
+    digest = hashlib.sha1()
+    digest.update(pd.util.hash_pandas_object(job['df'], index=True).to_numpy().tobytes())
+    options = {key: job[key] for key in ('title', 'volume', 'hlines', 'plot_kwargs')}
+    digest.update(repr((options, PRESETS[preset])).encode())
+    return digest.hexdigest()
+
+
+def render_chart(job, preset):
+    # 워커 프로세스에서 실행 (화면 없이 Agg 백엔드)
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import mplfinance as mpf
+
+    df = job['df']
+    addplots = [
+        mpf.make_addplot(pd.Series([price] * len(df), index=df.index), type='line', linestyle='-',
+                         width=width, color=color, label=label)
+        for price, color, width, label in job['hlines']
+    ]
+    kwargs = dict(job['plot_kwargs'])
+    if addplots:
+        kwargs['addplot'] = addplots
+    fig, _ = mpf.plot(df, type='candle', style='charles', title=job['title'], volume=job['volume'],
+                      returnfig=True, **kwargs)
+    settings = PRESETS[preset]
+    # figscale (예전 mpf.plot 옵션) 은 프리셋 크기에 곱한다 (글자 크기는 그대로, 봉이 더 크게)
+    scale = kwargs.get('figscale', 1.0)
+    fig.set_size_inches(settings['figsize'][0] * scale, settings['figsize'][1] * scale)
+    os.makedirs(os.path.dirname(job['path']) or '.', exist_ok=True)
+    fig.savefig(job['path'], dpi=settings['dpi'])
+    plt.close(fig)
+    return job['path']
+
+
+class ChartRenderer:
+    # 차트 작업을 프로세스 풀 (Agg 백엔드) 로 나눠서 그린다.
+    # 폴더마다 .chart_hashes.json 에 마지막으로 그린 데이터의 해시를 남겨서 바뀐 차트만 다시 그린다.
+
+    def __init__(self, preset='screen', workers=None, force=False):
+        if preset not in PRESETS:
+            raise ValueError(f"Unknown preset {preset}, choose from {list(PRESETS)}")
+        self.preset = preset
+        self.workers = workers or os.cpu_count() or 1
+        self.force = force
+
+    def _load_cache(self, folder):
+        try:
+            with open(os.path.join(folder, CACHE_FILENAME), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self, folder, cache):
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, CACHE_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=1)
+
+    def render(self, jobs):
+        caches = {}
+        pending = []
+        skipped = 0
+        for job in jobs:
+            folder = os.path.dirname(job['path']) or '.'
+            cache = caches.setdefault(folder, self._load_cache(folder))
+            name = os.path.basename(job['path'])
+            digest = job_hash(job, self.preset)
+            if not self.force and cache.get(name) == digest and os.path.exists(job['path']):
+                skipped += 1
+                continue
+            pending.append((job, folder, name, digest))
+
+        rendered = failed = 0
+        if pending:
+            if self.workers == 1 or len(pending) == 1:
+                results = []
+                for job, folder, name, digest in pending:
+                    try:
+                        render_chart(job, self.preset)
+                        results.append((folder, name, digest, None))
+                    except Exception as e:
+                        results.append((folder, name, digest, e))
+            else:
+                results = []
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(pending))) as pool:
+                    futures = {pool.submit(render_chart, job, self.preset): (folder, name, digest)
+                               for job, folder, name, digest in pending}
+                    for future in as_completed(futures):
+                        folder, name, digest = futures[future]
+                        results.append((folder, name, digest, future.exception()))
+
+            for folder, name, digest, error in results:
+                if error is None:
+                    caches[folder][name] = digest
+                    rendered += 1
+                else:
+                    failed += 1
+                    logger.error(f"Failed to render {os.path.join(folder, name)}: {error}")
+
+            for folder, cache in caches.items():
+                self._save_cache(folder, cache)
+
+        logger.info(f"Charts rendered={rendered}, unchanged={skipped}, failed={failed}")
+        return {'rendered': rendered, 'unchanged': skipped, 'failed': failed}
@@ -0,0 +1,184 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from bar_store import BarStore, BAR_STORE_PATH, BAR_COLUMNS, KST_OFFSET, from_epoch, to_datetime_index
+
+COLUMN_CACHE_DIR = 'bar_cache'
+MANIFEST = 'manifest.json'
+# 컬럼별 저장 타입 (원화 가격은 int32 로 충분), 거래량이 없으면 -1
+COLUMN_TYPES = {'ts': np.int64, 'open': np.int32, 'high': np.int32, 'low': np.int32, 'close': np.int32,
+                'volume': np.int64}
+MISSING_VOLUME = -1
+
+
+def day_key(day):
+    return from_epoch(day).strftime('%Y%m%d')
+
+
+class ColumnCache:
+    # bars.db 의 봉을 (타임프레임, 날짜) 폴더마다 컬럼별 .npy 파일로 내보내고 memory-map 으로 읽는다.
+    # - 폴더 안의 행은 종목/시간 순이고 manifest.json 에 종목별 [시작, 끝) 행 번호를 남긴다
+    #   -> (종목, 타임프레임, 날짜) 하나는 mmap 배열의 복사 없는 슬라이스
+    # - 쓰는 컬럼 파일만 열고 (np.load mmap_mode='r'), 한 번 연 파일은 프로세스 안에서 재사용.
+    #   여러 프로세스가 같은 파일을 열면 OS 페이지 캐시를 같이 쓴다
+    # - export() 는 bars.db 에서 봉 수/마지막 ts/가격·거래량 합계가 바뀐 날만 다시 만든다
+
+    def __init__(self, root=COLUMN_CACHE_DIR):
+        self.root = root
+        self.manifest = self._load_manifest()
+        self.maps = {}   # 파일 경로 -> mmap 배열
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.root, MANIFEST), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, MANIFEST)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f)
+        os.replace(path + '.tmp', path)
+
+    def _folder(self, timeframe, day):
+        return os.path.join(self.root, str(timeframe), day_key(day))
+
+    def export(self, store, timeframes, start=None, end=None):
+        # 바뀐 (타임프레임, 날짜) 만 다시 내보내고 그 수를 돌려준다
+        written = 0
+        for timeframe in timeframes:
+            for day, (count, last, checksum) in store.bar_day_counts(timeframe).items():
+                if (start is not None and day < start) or (end is not None and day >= end):
+                    continue
+                entry = self.manifest.get(f'{timeframe}/{day_key(day)}')
+                if entry is not None and entry['rows'] == count and entry['last_ts'] == last and \
+                        entry.get('checksum') == checksum:
+                    continue
+                self._write_day(timeframe, day, store.bar_range_rows(timeframe, day, day + 86400), last, checksum)
+                written += 1
+        self._save_manifest()
+        return written
+
+    def _write_day(self, timeframe, day, rows, last, checksum):
+        symbols = np.array([row[0] for row in rows])
+        data = np.array([row[1:] for row in rows], dtype=np.float64)   # None -> NaN
+        folder = self._folder(timeframe, day)
+        temp = folder + '.tmp'
+        shutil.rmtree(temp, ignore_errors=True)
+        os.makedirs(temp)
+        for i, (name, dtype) in enumerate(COLUMN_TYPES.items()):
+            values = data[:, i]
+            if name == 'volume':
+                values = np.where(np.isnan(values), MISSING_VOLUME, values)
+            np.save(os.path.join(temp, name + '.npy'), values.astype(dtype))
+
+        bounds = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1], True])
+        index = {str(symbols[first]): [int(first), int(end)] for first, end in zip(bounds[:-1], bounds[1:])}
+        # 다시 쓰는 날은 열어 둔 mmap 을 놓고 폴더를 통째로 바꾼다
+        for name in COLUMN_TYPES:
+            self.maps.pop(os.path.join(folder, name + '.npy'), None)
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(temp, folder)
+        self.manifest[f'{timeframe}/{day_key(day)}'] = {
+            'timeframe': timeframe, 'day': day, 'rows': len(rows), 'last_ts': last, 'checksum': checksum,
+            'symbols': index}
+
+    def days(self, timeframe, start=None, end=None):
+        days = [entry['day'] for entry in self.manifest.values() if entry['timeframe'] == timeframe]
+        return sorted(day for day in days if (start is None or day >= start) and (end is None or day < end))
+
+    def has_day(self, timeframe, day):
+        return f'{timeframe}/{day_key(day)}' in self.manifest
+
+    def column(self, timeframe, day, name):
+        path = os.path.join(self._folder(timeframe, day), name + '.npy')
+        array = self.maps.get(path)
+        if array is None:
+            array = self.maps[path] = np.load(path, mmap_mode='r')
+        return array
+
+    def load(self, timeframe, day, columns=('ts', 'close'), symbol=None):
+        # 컬럼 이름 -> mmap 배열 (symbol 을 주면 그 종목 구간의 뷰, 복사하지 않음)
+        entry = self.manifest[f'{timeframe}/{day_key(day)}']
+        if symbol is None:
+            return {name: self.column(timeframe, day, name) for name in columns}
+        first, end = entry['symbols'].get(symbol, (0, 0))
+        return {name: self.column(timeframe, day, name)[first:end] for name in columns}
+
+    def frame(self, timeframe, start=None, end=None, symbols=None, session=None, columns=BAR_COLUMNS):
+        # BarStore.fetch_bars/fetch_session_bars 와 같은 모양 (symbol, 컬럼들, date) 의 DataFrame.
+        # 필요한 날짜/종목/행만 골라서 복사한다. session: (시작, 끝) KST 자정 기준 초
+        parts = []
+        for day in self.days(timeframe, None if start is None else start - 86400, end):
+            index = self.manifest[f'{timeframe}/{day_key(day)}']['symbols']
+            wanted = index.items() if symbols is None else ((s, index[s]) for s in symbols if s in index)
+            slices = [(symbol, first, stop) for symbol, (first, stop) in wanted]
+            if not slices:
+                continue
+            rows = np.concatenate([np.arange(first, stop) for _, first, stop in slices])
+            names = np.repeat([symbol for symbol, _, _ in slices], [stop - first for _, first, stop in slices])
+            ts = self.column(timeframe, day, 'ts')[rows]
+            keep = np.ones(len(rows), dtype=bool)
+            if start is not None:
+                keep &= ts >= start
+            if end is not None:
+                keep &= ts < end
+            if session is not None:
+                seconds = (ts + KST_OFFSET) % 86400
+                keep &= (seconds >= session[0]) & (seconds < session[1])
+            rows = rows[keep]
+            part = {'symbol': names[keep]}
+            for name in columns:
+                values = self.column(timeframe, day, name)[rows]
+                if name == 'volume':
+                    values = np.where(values == MISSING_VOLUME, np.nan, values)
+                part[name] = values
+            part['ts'] = ts[keep]
+            parts.append(part)
+        if not parts:
+            df = pd.DataFrame(columns=['symbol'] + list(columns))
+            df['date'] = pd.to_datetime([])
+            return df
+        merged = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+        if len(parts) > 1:
+            # fetch_bars 처럼 종목, 시간 순 (날짜 순으로 붙였으므로 종목으로만 안정 정렬)
+            order = np.argsort(merged['symbol'], kind='stable')
+            merged = {key: values[order] for key, values in merged.items()}
+        df = pd.DataFrame(merged)
+        df['date'] = to_datetime_index(df.pop('ts'))
+        return df
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from bar_aggregator import TIMEFRAMES
+
+    # 사용법: python column_cache.py [bars.db] [캐시 폴더]
+    store = BarStore(sys.argv[1] if len(sys.argv) > 1 else BAR_STORE_PATH)
+    cache = ColumnCache(sys.argv[2] if len(sys.argv) > 2 else COLUMN_CACHE_DIR)
+    started = time.perf_counter()
+    written = cache.export(store, TIMEFRAMES)
+    print(f"Exported {written} timeframe/days in {time.perf_counter() - started:.2f}s "
+          f"(again: {cache.export(store, TIMEFRAMES)} changed)")
+
+    # 전체 1분봉을 읽는 시간 비교 (sqlite + pandas vs mmap)
+    started = time.perf_counter()
+    from_sql = store.fetch_bars(60)
+    sql_time = time.perf_counter() - started
+    started = time.perf_counter()
+    from_cache = ColumnCache(cache.root).frame(60)
+    cache_time = time.perf_counter() - started
+    started = time.perf_counter()
+    fresh = ColumnCache(cache.root)
+    closes = [fresh.load(60, day, ('close',), symbol)['close']
+              for day in fresh.days(60) for symbol in fresh.manifest[f'60/{day_key(day)}']['symbols']]
+    view_time = time.perf_counter() - started
+    assert len(from_sql) == len(from_cache) and (from_sql['close'].to_numpy() == from_cache['close'].to_numpy()).all()
+    print(f"{len(from_sql)} bars: fetch_bars {sql_time * 1000:.1f} ms, frame {cache_time * 1000:.1f} ms, "
+          f"{len(closes)} symbol-day views {view_time * 1000:.1f} ms")
+    store.close()
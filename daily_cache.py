@@ -0,0 +1,158 @@
+import time
+import numpy as np
+import pandas as pd
+from bar_store import BarStore, BAR_STORE_PATH, KST_OFFSET, day_range, from_epoch, to_datetime_index
+from bar_aggregator import TIMEFRAMES, resample_bars
+
+DAY = 86400
+# 접미어를 모르는 종목은 코스피 -> 코스닥 순서로 시도
+YAHOO_SUFFIXES = ['.KS', '.KQ']
+DAILY_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+ACTION_COLUMNS = ['Dividends', 'Stock Splits']
+
+
+def yahoo_history(ticker, start, end):
+    # yfinance 는 이 함수에서만 쓴다 (로컬 봉만 쓸 때는 설치하지 않아도 됨)
+    import yfinance as yf
+    return yf.Ticker(ticker).history(interval='1d', start=start, end=end, actions=True, auto_adjust=True)
+
+
+def _day_starts(index):
+    # yfinance 날짜 인덱스 -> KST 자정 epoch 배열
+    if index.tz is not None:
+        index = index.tz_convert('Asia/Seoul').tz_localize(None)
+    ts = index.values.astype('datetime64[s]').astype(np.int64) - KST_OFFSET
+    return ts - (ts + KST_OFFSET) % DAY
+
+
+def history_rows(df):
+    # yfinance 일봉 DataFrame -> (KST 자정 epoch, open, high, low, close, volume)
+    if df.empty:
+        return []
+    values = df[DAILY_COLUMNS].to_numpy(dtype=np.float64)
+    return [(int(t), o, h, l, c, None if np.isnan(v) else int(v))
+            for t, (o, h, l, c, v) in zip(_day_starts(df.index), values)]
+
+
+def action_days(df):
+    # 배당/분할이 있었던 날 (KST 자정 epoch), actions=True 로 받은 컬럼이 없으면 빈 목록
+    columns = [column for column in ACTION_COLUMNS if column in df]
+    if df.empty or not columns:
+        return []
+    happened = (df[columns].fillna(0).to_numpy() != 0).any(axis=1)
+    return [int(t) for t in _day_starts(df.index)[happened]]
+
+
+def missing_ranges(covered, start, end):
+    # covered: 정렬된 [start, end) 구간들 -> [start, end) 중 아직 받지 않은 구간 목록
+    gaps = []
+    for cov_start, cov_end in covered:
+        if cov_end <= start:
+            continue
+        if cov_start >= end:
+            break
+        if cov_start > start:
+            gaps.append((start, cov_start))
+        start = max(start, cov_end)
+    if start < end:
+        gaps.append((start, end))
+    return gaps
+
+
+def _frame(rows):
+    df = pd.DataFrame(rows, columns=['ts'] + DAILY_COLUMNS)
+    df.index = to_datetime_index(df.pop('ts'))
+    df.index.name = 'Date'
+    return df
+
+
+class DailyCache:
+    # 지지/저항 분석용 일봉 캐시 (bars.db 의 daily_history).
+    # - 요청 기간 중 받지 않은 날짜 구간만 yfinance 로 받아서 채우고, 받은 구간은 daily_coverage 에 남긴다
+    # - 종목의 시장 접미어 (.KS/.KQ) 를 기억해서 코스닥 종목도 두 번째부터는 한 번만 요청
+    # - 오늘 일봉은 장중에 바뀌므로 받은 구간으로 남기지 않는다 (다음 요청 때 다시 받음)
+    # - 수정주가 (auto_adjust) 라서 새로 받은 구간에 배당/분할이 있고 그보다 앞선 날을 이미 받아 두었으면
+    #   그 종목의 받은 구간 전체를 다시 받는다 (예전 기준과 새 기준 가격이 섞이지 않도록)
+    # - source='local' 이면 네트워크 없이 우리가 기록한 분봉 (bars) 을 일봉으로 묶어서 쓴다
+
+    def __init__(self, db_path=BAR_STORE_PATH, fetcher=yahoo_history):
+        self.store = BarStore(db_path)
+        self.fetcher = fetcher
+
+        # 통계
+        self.fetches = 0
+        self.hits = 0
+
+    def daily(self, symbol, start, end, source='yahoo'):
+        # start/end: 'YYYY-MM-DD' (end 는 yfinance 처럼 포함하지 않음)
+        # 반환: yfinance history 와 같은 컬럼 (Open/High/Low/Close/Volume), KST 날짜 인덱스
+        start_ts, end_ts = day_range(start)[0], day_range(end)[0]
+        if source == 'local':
+            return _frame(self.local_rows(symbol, start_ts, end_ts))
+        gaps = missing_ranges(self.store.daily_coverage(symbol), start_ts, end_ts)
+        if not gaps:
+            self.hits += 1
+        for gap_start, gap_end in gaps:
+            self._top_up(symbol, gap_start, gap_end)
+        return _frame(self.store.daily_history_rows(symbol, start_ts, end_ts))
+
+    def _download(self, symbol, start, end):
+        # 반환: (일봉 행, 배당/분할 날짜, 찾았는지)
+        suffix = self.store.ticker_suffix(symbol)
+        first, last = from_epoch(start).strftime('%Y-%m-%d'), from_epoch(end).strftime('%Y-%m-%d')
+        for candidate in [suffix] if suffix else YAHOO_SUFFIXES:
+            print(f"Fetching {symbol}{candidate} from {first} to {last}")
+            df = self.fetcher(symbol + candidate, first, last)
+            self.fetches += 1
+            rows = history_rows(df)
+            if rows:
+                if candidate != suffix:
+                    self.store.set_ticker_suffix(symbol, candidate, commit=False)
+                return rows, action_days(df), True
+        # 어느 시장에서도 못 찾았으면 휴장 구간인지 없는 종목인지 알 수 없으므로 기록하지 않는다
+        return [], [], suffix is not None
+
+    def _top_up(self, symbol, start, end):
+        rows, actions, found = self._download(symbol, start, end)
+        if not found:
+            return
+        covered = self.store.daily_coverage(symbol)
+        if actions and covered and max(actions) > covered[0][0]:
+            # 받아 둔 날 이후에 배당/분할 -> 받아 둔 가격은 예전 기준이므로 전체를 새 기준으로 다시 받는다
+            start, end = min(start, covered[0][0]), max(end, covered[-1][1])
+            print(f"{symbol}: corporate action on {from_epoch(max(actions)):%Y-%m-%d}, refetching cached history")
+            self.store.clear_daily_history(symbol, commit=False)
+            rows, _, _ = self._download(symbol, start, end)
+        self.store.write_daily_history(symbol, rows, commit=False)
+        today = int(time.time()) + KST_OFFSET
+        today -= today % DAY + KST_OFFSET
+        covered_end = min(end, today)
+        if covered_end > start:
+            self.store.add_daily_coverage(symbol, start, covered_end, commit=False)
+        self.store.conn.commit()
+
+    def local_rows(self, symbol, start, end):
+        # 기록된 봉 중 가장 짧은 타임프레임으로 일봉을 만든다
+        for timeframe in TIMEFRAMES:
+            rows = [row for row in self.store.bar_rows(symbol, timeframe, start) if row[0] < end]
+            if rows:
+                return resample_bars(rows, DAY)
+        return []
+
+    def close(self):
+        self.store.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    # 사용법: python daily_cache.py <종목코드> <시작일> <종료일> [local]
+    symbol, start, end = sys.argv[1:4]
+    cache = DailyCache()
+    for attempt in range(2):
+        started = time.perf_counter()
+        df = cache.daily(symbol, start, end, source=sys.argv[4] if len(sys.argv) > 4 else 'yahoo')
+        print(f"{len(df)} days in {(time.perf_counter() - started) * 1000:.1f} ms "
+              f"(fetches={cache.fetches}, cache hits={cache.hits})")
+    print(df.tail())
+    cache.close()
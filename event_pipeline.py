@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import deque
+
+
+class EventPipeline:
+    # OCX 콜백 (Qt 메인 스레드) 은 (kind, args) 튜플을 deque 에 append 만 하고 바로 돌아간다.
+    # deque.append / popleft 는 락 없이 스레드 안전하므로 콜백이 워커를 기다리는 일이 없다.
+    # 같은 key (종목코드) 의 이벤트는 항상 같은 워커로 가서 순서가 유지되고, 워커별 상태에 락이 필요 없다.
+    # 큐가 가득 차면 새 이벤트를 버리고 dropped 로 센다 (콜백은 절대 막히지 않음).
+
+    def __init__(self, handlers, workers=2, max_queue=50000, idle_sleep=0.002):
+        self.handlers = handlers       # kind -> 워커 스레드에서 실행할 함수(*args)
+        self.max_queue = max_queue     # 워커 하나당 최대 대기 이벤트 수
+        self.idle_sleep = idle_sleep
+        self.shards = [deque() for _ in range(workers)]
+        self.threads = []
+        self._running = False
+
+        # 통계 (콜백 스레드만 쓰는 값과 워커별로 쓰는 값을 나눠서 락 없이 센다)
+        self.received = 0
+        self.dropped = 0
+        self.high_water = 0
+        self.processed = [0] * workers
+        self.errors = [0] * workers
+
+    def start(self):
+        self._running = True
+        for i in range(len(self.shards)):
+            thread = threading.Thread(target=self._run, args=(i,), name=f"EventPipeline-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, kind, key, *args):
+        self.received += 1
+        shard = self.shards[hash(key) % len(self.shards)]
+        size = len(shard)
+        if size >= self.max_queue:
+            self.dropped += 1
+            return False
+        shard.append((kind, args))
+        if size >= self.high_water:
+            self.high_water = size + 1
+        return True
+
+    def pressure(self):
+        # 가장 많이 밀린 워커의 큐 사용률 (0 ~ 1), GUI 에서 경고 표시용
+        return max(len(shard) for shard in self.shards) / self.max_queue
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'processed': sum(self.processed),
+            'queued': sum(len(shard) for shard in self.shards),
+            'high_water': self.high_water,
+            'dropped': self.dropped,
+            'errors': sum(self.errors),
+        }
+
+    def drain(self, timeout=None):
+        # 지금까지 들어온 이벤트가 모두 처리될 때까지 대기
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while any(self.shards) or sum(self.processed) + sum(self.errors) < self.received - self.dropped:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(self.idle_sleep)
+        return True
+
+    def stop(self, timeout=5):
+        self.drain(timeout)
+        self._running = False
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def _run(self, index):
+        shard = self.shards[index]
+        handlers = self.handlers
+        while self._running:
+            try:
+                kind, args = shard.popleft()
+            except IndexError:
+                time.sleep(self.idle_sleep)
+                continue
+            try:
+                handlers[kind](*args)
+                self.processed[index] += 1
+            except Exception as e:
+                self.errors[index] += 1
+                print(f"EventPipeline {kind} handler failed: {e}")
+
+
+if __name__ == "__main__":
+    # 09:00 에 조건검색 편입 500건이 한꺼번에 들어오고 처리 (DB/화면) 가 건당 5ms 걸리는 경우
+    # 콜백 안에서 처리할 때와 파이프라인에 넘길 때의 콜백 지연 비교
+    def slow_handler(code, event_type, cond_name, received_at):
+        time.sleep(0.005)
+
+    codes = [f'{i:06d}' for i in range(500)]
+
+    started = time.perf_counter()
+    for code in codes:
+        slow_handler(code, 'I', 'test', time.time())
+    inline = (time.perf_counter() - started) / len(codes)
+
+    pipeline = EventPipeline({'condition': slow_handler}, workers=4)
+    pipeline.start()
+    latencies = []
+    for code in codes:
+        started = time.perf_counter()
+        pipeline.put('condition', code, code, 'I', 'test', time.time())
+        latencies.append(time.perf_counter() - started)
+    burst_stats = pipeline.stats()
+    pipeline.stop(timeout=10)
+
+    print(f"inline callback:   {inline * 1e6:,.0f} us/event, next event waits {inline * len(codes):.2f}s at 09:00")
+    print(f"pipeline callback: {sum(latencies) / len(latencies) * 1e6:.2f} us/event (max {max(latencies) * 1e6:.1f} us)")
+    print(f"after burst: {burst_stats}, after drain: {pipeline.stats()}")
@@ -0,0 +1,194 @@
+import time
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter
+from bar_store import KST_OFFSET
+
+
+def decimate(x, y, max_points):
+    # 화면용으로 점 수를 줄인다. 구간마다 최저/최고점을 시간 순서대로 남겨서 급등락이 사라지지 않게
+    n = len(x)
+    if n <= max_points:
+        return x, y
+    buckets = max_points // 2
+    size = n // buckets
+    start = n - buckets * size   # 나머지는 가장 오래된 쪽에서 버린다
+    xs = x[start:].reshape(buckets, size)
+    ys = y[start:].reshape(buckets, size)
+    low, high = ys.argmin(axis=1), ys.argmax(axis=1)
+    first, second = np.minimum(low, high), np.maximum(low, high)
+    rows = np.arange(buckets)
+    out_x = np.empty(buckets * 2)
+    out_y = np.empty(buckets * 2)
+    out_x[0::2], out_x[1::2] = xs[rows, first], xs[rows, second]
+    out_y[0::2], out_y[1::2] = ys[rows, first], ys[rows, second]
+    return out_x, out_y
+
+
+def _format_time(x, pos=None):
+    return time.strftime('%H:%M', time.gmtime(x + KST_OFFSET))
+
+
+class LiveChartGrid:
+    # 여러 종목의 실시간 가격선을 한 Figure 의 rows x cols 격자에 페이지 단위로 그린다.
+    # 선은 animated 로 두고 배경 (축/눈금) 은 한 번만 그려서 저장, 이후에는 바뀐 종목의 축만 blit.
+    # 데이터가 축 범위를 벗어날 때만 전체를 다시 그린다.
+
+    def __init__(self, history, rows=4, cols=5, max_points=400, canvas_class=None):
+        if canvas_class is None:
+            from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as canvas_class
+        self.history = history          # PriceHistory
+        self.max_points = max_points
+        self.figure = Figure(figsize=(cols * 3, rows * 2))
+        self.canvas = canvas_class(self.figure)
+        self.figure.subplots_adjust(left=0.05, right=0.98, bottom=0.06, top=0.95, wspace=0.3, hspace=0.5)
+        self.axes = list(self.figure.subplots(rows, cols, squeeze=False).ravel())
+        self.lines = []
+        formatter = FuncFormatter(_format_time)
+        for ax in self.axes:
+            line, = ax.plot([], [], 'b-', linewidth=0.8, animated=True)
+            ax.xaxis.set_major_formatter(formatter)
+            ax.tick_params(labelsize=6)
+            self.lines.append(line)
+        self.backgrounds = [None] * len(self.axes)
+        self.codes = []
+        self.page = 0
+        self.drawn = {}   # code -> 마지막으로 그린 (개수, 마지막 시각)
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+        # 통계
+        self.blits = 0
+        self.full_draws = 0
+
+    @property
+    def per_page(self):
+        return len(self.axes)
+
+    def page_count(self):
+        return max(1, -(-len(self.codes) // self.per_page))
+
+    def page_codes(self):
+        start = self.page * self.per_page
+        return self.codes[start:start + self.per_page]
+
+    def set_codes(self, codes):
+        self.codes = list(codes)
+        self.set_page(self.page)
+
+    def set_page(self, page):
+        self.page = min(max(page, 0), self.page_count() - 1)
+        codes = self.page_codes()
+        for i, ax in enumerate(self.axes):
+            ax.set_visible(i < len(codes))
+            self.lines[i].set_data([], [])
+            if i < len(codes):
+                ax.set_title(codes[i], fontsize=8)
+                ax.set_xlim(0, 1)
+                ax.set_ylim(0, 1)
+        self.drawn = {}
+        self.refresh(force_full=True)
+
+    def next_page(self):
+        self.set_page((self.page + 1) % self.page_count())
+
+    def prev_page(self):
+        self.set_page((self.page - 1) % self.page_count())
+
+    def _on_draw(self, event):
+        # 전체 다시 그리기가 끝나면 축별 배경을 저장하고 선을 그 위에 그린다
+        self.backgrounds = [self.canvas.copy_from_bbox(ax.bbox) for ax in self.axes]
+        for ax, line in zip(self.axes, self.lines):
+            if ax.get_visible():
+                ax.draw_artist(line)
+
+    def _rescale(self, ax, x, y):
+        # 데이터가 축 범위를 벗어날 때만 여유를 두고 넓힌다 (True 면 전체 다시 그리기)
+        changed = False
+        left, right = ax.get_xlim()
+        if x[0] < left or x[-1] > right or right - left == 1:
+            span = max(x[-1] - x[0], 60)
+            ax.set_xlim(x[0], x[-1] + span * 0.2)
+            changed = True
+        bottom, top = ax.get_ylim()
+        low, high = y.min(), y.max()
+        if low < bottom or high > top or top - bottom == 1:
+            pad = max((high - low) * 0.1, high * 0.002, 1)
+            ax.set_ylim(low - pad, high + pad)
+            changed = True
+        return changed
+
+    def refresh(self, force_full=False):
+        # 타이머에서 호출: 지금 페이지에서 새 체결이 있는 종목만 다시 그린다. 다시 그린 종목 수를 돌려준다
+        dirty = []
+        full = force_full
+        for i, code in enumerate(self.page_codes()):
+            if code not in self.history:
+                continue
+            buffer = self.history[code]
+            last = buffer.last()
+            if last is None:
+                continue
+            state = (len(buffer), last[0])
+            if self.drawn.get(code) == state:
+                continue
+            ts, price, _ = buffer.window()
+            x, y = decimate(ts / 1000.0, price.astype(np.float64), self.max_points)
+            self.lines[i].set_data(x, y)
+            if self._rescale(self.axes[i], x, y):
+                full = True
+            self.drawn[code] = state
+            dirty.append(i)
+
+        if full:
+            self.canvas.draw()   # draw_event 에서 배경 저장 + 선 그리기
+            self.full_draws += 1
+        elif dirty:
+            for i in dirty:
+                ax = self.axes[i]
+                self.canvas.restore_region(self.backgrounds[i])
+                ax.draw_artist(self.lines[i])
+                self.canvas.blit(ax.bbox)
+            self.blits += len(dirty)
+        return len(dirty)
+
+
+if __name__ == "__main__":
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from ring_buffer import PriceHistory
+
+    # 120종목 x 5000체결, 한 페이지 20종목. 페이지의 모든 종목에 체결이 하나씩 들어왔을 때 갱신 시간 비교
+    rng = np.random.default_rng(0)
+    history = PriceHistory(10000)
+    codes = [f'{i:06d}' for i in range(120)]
+    start_ms = 1721174400 * 1000
+    for code in codes:
+        prices = 10000 + np.cumsum(rng.integers(-10, 11, 5000))
+        for j, price in enumerate(prices):
+            history.append(code, start_ms + j * 1000, int(price), 1)
+
+    grid = LiveChartGrid(history, rows=4, cols=5, canvas_class=FigureCanvasAgg)
+    grid.set_codes(codes)
+    rounds = 20
+    started = time.perf_counter()
+    for r in range(rounds):
+        for code in grid.page_codes():
+            ts, price, _ = history[code].last()
+            history.append(code, ts + 1000, price, 1)
+        grid.refresh()
+    incremental = (time.perf_counter() - started) / rounds
+
+    # 예전 방식: 모든 축을 지우고 전체 이력을 다시 그린다
+    figure = Figure(figsize=(15, 8))
+    canvas = FigureCanvasAgg(figure)
+    axes = figure.subplots(4, 5).ravel()
+    started = time.perf_counter()
+    for r in range(3):
+        for ax, code in zip(axes, codes[:20]):
+            ax.clear()
+            ax.set_title(code)
+            ax.plot(history[code].times(), history[code].window()[1], 'b-')
+        canvas.draw()
+    full = (time.perf_counter() - started) / 3
+
+    print(f"blit refresh: {incremental * 1000:.1f} ms/page (blits={grid.blits}, full draws={grid.full_draws})")
+    print(f"clear + replot: {full * 1000:.1f} ms/page")
@@ -0,0 +1,343 @@
+import os
+import sqlite3
+import time
+from collections import deque
+from bar_store import BarStore, migrate_legacy_db, from_epoch, day_range, parse_db_name
+from real_data import REAL_FID_LAYOUT
+
+# 이 저장소 코드가 쓰는 장운영구분 (FID 215) 값
+MARKET_BEFORE_OPEN = '0'
+MARKET_OPEN = '1'
+MARKET_CLOSE = '2'
+
+
+class Signal:
+    # QAxWidget 시그널 흉내 (connect / emit)
+    def __init__(self):
+        self.slots = []
+
+    def connect(self, slot):
+        self.slots.append(slot)
+
+    def disconnect(self, slot):
+        self.slots.remove(slot)
+
+    def emit(self, *args):
+        for slot in self.slots:
+            slot(*args)
+
+
+def create_ocx():
+    # KIWOOM_REPLAY 환경변수가 있으면 기록된 데이터로 재생, 없으면 실제 키움 OCX
+    source = os.environ.get('KIWOOM_REPLAY')
+    if not source:
+        from PyQt5.QAxContainer import QAxWidget
+        return QAxWidget("KHOPENAPI.KHOpenAPICtrl.1")
+
+    speed = os.environ.get('KIWOOM_REPLAY_SPEED', '1')
+    replay = ReplayMarketData.from_path(
+        source,
+        date=os.environ.get('KIWOOM_REPLAY_DATE'),
+        speed=None if speed == 'max' else float(speed),
+    )
+    replay.attach_qt_timer()
+    return replay
+
+
+class ReplayMarketData:
+    # 키움 OCX 대신 bars.db 의 체결(ticks) 또는 분봉(bars)을 재생한다.
+    # speed: 1 = 실제 속도, N = N배속, None = 최대 속도. 이벤트 순서와 간격은 데이터의 체결 시간으로만 정해진다.
+
+    def __init__(self, store, date, speed=1.0, clock=time.monotonic, sleep=time.sleep, max_events_per_pump=5000):
+        self.store = store
+        self.date = date.replace('-', '')
+        self.speed = speed
+        self.clock = clock
+        self.sleep = sleep
+        self.max_events_per_pump = max_events_per_pump
+
+        self.OnEventConnect = Signal()
+        self.OnReceiveRealData = Signal()
+        self.OnReceiveRealCondition = Signal()
+        self.OnReceiveConditionVer = Signal()
+        self.OnReceiveTrCondition = Signal()
+
+        self.screens = {}            # 화면번호 -> 등록 종목
+        self.registered = set()
+        self.market_listeners = 0    # FID 215 (장시작시간) 등록 수
+        self.conditions = set()      # 실시간 조건검색 중인 조건식 이름
+        self.current = {}            # 종목 -> {fid: 문자열}, GetCommRealData 가 읽는 값
+        self.immediate = deque()
+        self.timeline = self._build_timeline()
+        self.position = 0
+        self.started_at = None
+        self.emitted = 0
+        self._timer = None
+
+    @classmethod
+    def from_path(cls, path, date=None, **kwargs):
+        # bars.db 는 그대로, 예전 YYYYMMDD_조건식.db 는 메모리로 옮겨서 사용
+        conn = sqlite3.connect(path)
+        is_store = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'bars'").fetchone()
+        conn.close()
+        if is_store:
+            store = BarStore(path)
+        else:
+            store = BarStore(':memory:')
+            migrate_legacy_db(store, path)
+        if date is None:
+            try:
+                date = parse_db_name(path)[0]
+            except ValueError:
+                last_ts = store.conn.execute('SELECT MAX(ts) FROM bars WHERE timeframe > 0').fetchone()[0]
+                date = from_epoch(last_ts).strftime('%Y%m%d')
+        return cls(store, date, **kwargs)
+
+    def _build_timeline(self):
+        # (ts, 순번, 종류, 데이터) 를 체결 시간 순으로
+        start, end = day_range(self.date)
+        events = []
+        conn = self.store.conn
+
+        tick_rows = conn.execute(
+            'SELECT symbol, ts, price, volume FROM ticks WHERE ts >= ? AND ts < ? ORDER BY ts, symbol, seq',
+            (start, end)).fetchall()
+        tick_symbols = {row[0] for row in tick_rows}
+        for symbol, ts, price, volume in tick_rows:
+            events.append((ts, '주식체결', (symbol, price, volume or 0)))
+
+        # 체결 기록이 없는 종목은 가장 짧은 분봉으로 체결을 만든다 (시가 -> 고/저 -> 종가)
+        bar_rows = conn.execute('''
+            SELECT b.symbol, b.timeframe, b.ts, b.open, b.high, b.low, b.close, b.volume FROM bars b
+            JOIN (SELECT symbol, MIN(timeframe) AS timeframe FROM bars
+                  WHERE timeframe > 0 AND ts >= ? AND ts < ? GROUP BY symbol) f
+              ON f.symbol = b.symbol AND f.timeframe = b.timeframe
+            WHERE b.ts >= ? AND b.ts < ?
+        ''', (start, end, start, end)).fetchall()
+        for symbol, tf, ts, o, h, l, c, v in bar_rows:
+            if symbol in tick_symbols:
+                continue
+            path = (o, l, h, c) if c >= o else (o, h, l, c)
+            volume = (v or 0) // 4
+            for k, price in enumerate(path):
+                events.append((ts + k * tf // 4, '주식체결', (symbol, price, volume)))
+
+        # 조건검색 편입(I)/이탈(D) 은 condition_events 에서 (ts, seq) 순서로,
+        # 이벤트 기록이 없는 (조건식, 종목) (예전 파일) 은 tracked_stocks 의 첫 편입만
+        logged = set()
+        for cond_name, code, ts, event_type in conn.execute(
+                'SELECT cond_name, code, ts, type FROM condition_events WHERE ts >= ? AND ts < ? ORDER BY ts, seq',
+                (start, end)):
+            logged.add((cond_name, code))
+            events.append((ts, 'condition', (code, cond_name, event_type)))
+        for cond_name, code, first_seen in conn.execute(
+                'SELECT cond_name, code, first_seen FROM tracked_stocks WHERE first_seen >= ? AND first_seen < ?',
+                (start, end)):
+            if (cond_name, code) not in logged:
+                events.append((first_seen, 'condition', (code, cond_name, 'I')))
+
+        events.sort(key=lambda e: e[0])
+        if events:
+            events.insert(0, (events[0][0], '장시작시간', MARKET_OPEN))
+            events.append((events[-1][0], '장시작시간', MARKET_CLOSE))
+        return [(ts, seq, kind, payload) for seq, (ts, kind, payload) in enumerate(events)]
+
+    # ---- 키움 OCX 호환 ----
+    def dynamicCall(self, signature, *args):
+        name = signature.split('(')[0]
+        method = getattr(self, name, None)
+        if method is None:
+            print(f"ReplayMarketData: unsupported call {signature}")
+            return ''
+        return method(*args)
+
+    def CommConnect(self):
+        self.immediate.append(lambda: self.OnEventConnect.emit(0))
+
+    def GetConnectState(self):
+        return 1
+
+    def SetRealReg(self, screen_no, code_list, fid_list, real_type):
+        codes = {code for code in code_list.split(';') if code}
+        if str(real_type) == '0':
+            self.screens[screen_no] = codes
+        else:
+            self.screens.setdefault(screen_no, set()).update(codes)
+        if '215' in fid_list.split(';'):
+            self.market_listeners += 1
+        self._refresh_registered()
+        self._start()
+        return 0
+
+    def SetRealRemove(self, screen_no, code):
+        if screen_no == 'ALL':
+            self.screens.clear()
+        elif code == 'ALL':
+            self.screens.pop(screen_no, None)
+        else:
+            self.screens.get(screen_no, set()).discard(code)
+        self._refresh_registered()
+
+    def DisConnectRealData(self, screen_no):
+        self.screens.pop(screen_no, None)
+        self._refresh_registered()
+
+    def GetCommRealData(self, code, fid):
+        return self.current.get(code, {}).get(int(fid), '')
+
+    def GetConditionLoad(self):
+        self.immediate.append(lambda: self.OnReceiveConditionVer.emit(1, ''))
+        return 1
+
+    def GetConditionNameList(self):
+        names = [row[0] for row in self.store.conn.execute(
+            'SELECT cond_name FROM tracked_stocks UNION SELECT cond_name FROM condition_events ORDER BY 1')]
+        return ''.join(f'{index:03d}^{name};' for index, name in enumerate(names))
+
+    def SendCondition(self, screen, cond_name, cond_index, search):
+        self.conditions.add(cond_name)
+        self._start()
+        return 1
+
+    def SendConditionStop(self, screen, cond_name, cond_index):
+        self.conditions.discard(cond_name)
+
+    def _refresh_registered(self):
+        self.registered = set().union(*self.screens.values()) if self.screens else set()
+
+    # ---- 재생 ----
+    def _start(self):
+        if self.started_at is None:
+            self.started_at = self.clock()
+
+    def _due(self, ts):
+        # 이 이벤트를 내보낼 시각 (clock 기준)
+        if self.speed is None:
+            return self.started_at
+        return self.started_at + (ts - self.timeline[0][0]) / self.speed
+
+    def finished(self):
+        return self.position >= len(self.timeline) and not self.immediate
+
+    def pump(self):
+        # 지금까지 시간이 된 이벤트를 내보낸다 (Qt 타이머에서 주기적으로 호출)
+        while self.immediate:
+            self.immediate.popleft()()
+        if self.started_at is None:
+            return 0
+        now = self.clock()
+        count = 0
+        while self.position < len(self.timeline) and count < self.max_events_per_pump:
+            event = self.timeline[self.position]
+            if self._due(event[0]) > now:
+                break
+            self.position += 1
+            self._emit(event)
+            count += 1
+        return count
+
+    def run(self):
+        # Qt 없이 끝까지 재생 (벤치마크/테스트용)
+        self._start()
+        while not self.finished():
+            while self.immediate:
+                self.immediate.popleft()()
+            if self.position >= len(self.timeline):
+                break
+            event = self.timeline[self.position]
+            wait = self._due(event[0]) - self.clock()
+            if wait > 0:
+                self.sleep(wait)
+            self.position += 1
+            self._emit(event)
+
+    def attach_qt_timer(self, interval_ms=1):
+        from PyQt5.QtCore import QTimer
+        self._timer = QTimer()
+        self._timer.timeout.connect(self.pump)
+        self._timer.start(interval_ms)
+
+    def _emit(self, event):
+        ts, _, kind, payload = event
+        time_str = from_epoch(ts).strftime('%H%M%S')
+        if kind == '주식체결':
+            code, price, volume = payload
+            if code not in self.registered:
+                return
+            fields = self._trade_fields(code, time_str, price, volume)
+            self.current[code] = fields
+            data = '\t'.join(fields.get(fid, '') for fid in REAL_FID_LAYOUT['주식체결'])
+            self.emitted += 1
+            self.OnReceiveRealData.emit(code, kind, data)
+        elif kind == 'condition':
+            code, cond_name, event_type = payload
+            if cond_name in self.conditions:
+                self.emitted += 1
+                self.OnReceiveRealCondition.emit(code, event_type, cond_name, '000')
+        elif kind == '장시작시간' and self.market_listeners:
+            fields = {215: payload, 20: time_str, 214: '000000'}
+            self.current[''] = fields
+            self.emitted += 1
+            self.OnReceiveRealData.emit('', kind, '\t'.join(fields[fid] for fid in REAL_FID_LAYOUT[kind]))
+
+    def _trade_fields(self, code, time_str, price, volume):
+        # 기준가는 그날 첫 체결가로 둔다 (부호 +/- 는 기준가 대비)
+        previous = self.current.get(code)
+        if previous is None:
+            reference, cumulative = price, 0
+        else:
+            reference, cumulative = previous['_reference'], previous['_cumulative']
+        cumulative += volume
+        sign = '-' if price < reference else '+'
+        change = price - reference
+        return {
+            '_reference': reference,
+            '_cumulative': cumulative,
+            20: time_str,
+            10: f'{sign}{price}',
+            11: f'{sign}{abs(change)}',
+            12: f'{sign}{abs(change) / reference * 100:.2f}' if reference else '0.00',
+            15: f'+{volume}',
+            13: str(cumulative),
+        }
+
+
+if __name__ == "__main__":
+    import sys
+    from bar_aggregator import BarAggregator
+    from bar_store import hhmmss_to_epoch
+    from store_writer import StoreWriter
+    from real_data import RealDataDecoder
+
+    # 사용법: python market_data.py <재생할 .db> [배속|max] [저장할 db]
+    # 실시간 기록기와 같은 경로 (체결 -> 분봉 집계 -> 배치 저장) 를 Qt 없이 돌려 처리량을 잰다
+    source = sys.argv[1] if len(sys.argv) > 1 else '20240717_시가갭검색식_돌파.db'
+    speed = None if len(sys.argv) <= 2 or sys.argv[2] == 'max' else float(sys.argv[2])
+    target = sys.argv[3] if len(sys.argv) > 3 else 'replay_bench.db'
+
+    replay = ReplayMarketData.from_path(source, speed=speed)
+    writer = StoreWriter(target)
+    writer.start()
+    aggregator = BarAggregator(on_bar=writer.put_bar)
+    day_start = day_range(replay.date)[0]
+    decoder = RealDataDecoder()
+
+    def on_real_data(code, real_type, data):
+        if real_type == '주식체결':
+            trade = decoder.trade(data)
+            ts = hhmmss_to_epoch(trade.time, day_start)
+            writer.put_tick(code, ts, trade.price, trade.volume)
+            aggregator.add_tick(code, ts, trade.price, trade.volume)
+
+    replay.OnReceiveRealData.connect(on_real_data)
+    codes = {event[3][0] for event in replay.timeline if event[2] == '주식체결'}
+    replay.SetRealReg('1000', ';'.join(sorted(codes)), '20;10;15', '0')
+
+    started = time.perf_counter()
+    replay.run()
+    aggregator.flush()
+    writer.flush()
+    elapsed = time.perf_counter() - started
+    writer.close()
+    print(f"Replayed {replay.emitted} events for {len(codes)} codes in {elapsed:.2f}s "
+          f"({replay.emitted / elapsed:,.0f} events/s, dropped={writer.dropped})")
@@ -0,0 +1,147 @@
+from collections import namedtuple
+
+# 실시간 타입별 FID 순서 (OnReceiveRealData 의 data 인자는 이 순서의 탭 구분 문자열)
+REAL_FID_LAYOUT = {
+    '주식체결': [20, 10, 11, 12, 27, 28, 15, 13, 14, 16, 17, 18, 25, 26, 29, 30, 31, 32, 228, 311, 290, 691, 567, 568],
+    '주식호가잔량': [21] + list(range(41, 51)) + list(range(61, 71)) + list(range(51, 61)) + list(range(71, 81)) + [121, 125],
+    '장시작시간': [215, 20, 214],
+}
+
+# OnReceiveRealData 의 data (탭 구분 패킷) 을 한 번에 읽어서 만드는 레코드
+# 가격은 부호 (+/- : 전일 대비) 를 뗀 값, 대비/등락율은 부호 그대로
+Trade = namedtuple('Trade', ['time', 'price', 'change', 'rate', 'volume', 'cumulative_volume'])
+Quote = namedtuple('Quote', ['time', 'ask_prices', 'ask_volumes', 'bid_prices', 'bid_volumes', 'total_ask', 'total_bid'])
+MarketStatus = namedtuple('MarketStatus', ['status', 'time', 'remaining'])
+
+
+class RealDataDecoder:
+    # 실시간 타입별 FID 위치를 미리 계산해 두고 패킷을 split 한 번으로 해석한다.
+    # FID 마다 GetCommRealData (COM dynamicCall) 를 부르지 않아도 된다.
+
+    def __init__(self, layouts=REAL_FID_LAYOUT):
+        self.positions = {real_type: {fid: i for i, fid in enumerate(fids)} for real_type, fids in layouts.items()}
+        trade = self.positions['주식체결']
+        self._trade = (trade[20], trade[10], trade[11], trade[12], trade[15], trade[13])
+        quote = self.positions['주식호가잔량']
+        self._quote = (
+            quote[21],
+            [quote[fid] for fid in range(41, 51)],
+            [quote[fid] for fid in range(61, 71)],
+            [quote[fid] for fid in range(51, 61)],
+            [quote[fid] for fid in range(71, 81)],
+            quote[121],
+            quote[125],
+        )
+        market = self.positions['장시작시간']
+        self._market = (market[215], market[20], market[214])
+        self.decoders = {
+            '주식체결': self.trade,
+            '주식호가잔량': self.quote,
+            '장시작시간': self.market_status,
+        }
+        self.errors = 0
+
+    def decode(self, real_type, data):
+        decoder = self.decoders.get(real_type)
+        return decoder(data) if decoder is not None else None
+
+    def trade(self, data):
+        fields = data.split('\t')
+        time_i, price_i, change_i, rate_i, volume_i, cumulative_i = self._trade
+        try:
+            return Trade(
+                fields[time_i].strip(),
+                abs(int(fields[price_i])),
+                int(fields[change_i] or 0),
+                float(fields[rate_i] or 0),
+                abs(int(fields[volume_i] or 0)),  # 체결량 부호는 매수 +, 매도 -
+                int(fields[cumulative_i] or 0),
+            )
+        except (ValueError, IndexError):
+            self.errors += 1
+            return None
+
+    def quote(self, data):
+        fields = data.split('\t')
+        time_i, ask_i, ask_volume_i, bid_i, bid_volume_i, total_ask_i, total_bid_i = self._quote
+        try:
+            return Quote(
+                fields[time_i].strip(),
+                [abs(int(fields[i] or 0)) for i in ask_i],
+                [int(fields[i] or 0) for i in ask_volume_i],
+                [abs(int(fields[i] or 0)) for i in bid_i],
+                [int(fields[i] or 0) for i in bid_volume_i],
+                int(fields[total_ask_i] or 0),
+                int(fields[total_bid_i] or 0),
+            )
+        except (ValueError, IndexError):
+            self.errors += 1
+            return None
+
+    def market_status(self, data):
+        fields = data.split('\t')
+        status_i, time_i, remaining_i = self._market
+        try:
+            return MarketStatus(fields[status_i].strip(), fields[time_i].strip(), fields[remaining_i].strip())
+        except IndexError:
+            self.errors += 1
+            return None
+
+
+if __name__ == "__main__":
+    import io
+    import time
+    from contextlib import redirect_stdout
+
+    # 체결 한 건 처리 비용: 패킷 한 번 해석 vs 지금처럼 FID 마다 GetCommRealData
+    # (실제 OCX 는 dynamicCall 마다 COM 호출 비용이 더 붙으므로 실제 차이는 이보다 크다)
+    class PacketOCX:
+        # ReplayMarketData 와 같은 방식으로 dynamicCall 을 메서드로 넘긴다
+        def __init__(self):
+            self.current = {}
+
+        def dynamicCall(self, signature, *args):
+            return getattr(self, signature.split('(')[0])(*args)
+
+        def GetCommRealData(self, code, fid):
+            return self.current.get(code, {}).get(int(fid), '')
+
+    layout = REAL_FID_LAYOUT['주식체결']
+    fields = {20: '093015', 10: '+71500', 11: '+1200', 12: '+1.71', 15: '-35', 13: '1523400'}
+    packet = '\t'.join(fields.get(fid, '') for fid in layout)
+    ocx = PacketOCX()
+    ocx.current['005930'] = fields
+    decoder = RealDataDecoder()
+    n = 200000
+
+    def per_fid(code, echo):
+        values = []
+        for fid in (20, 10, 15):
+            value = ocx.dynamicCall("GetCommRealData(QString, int)", code, fid)
+            if echo:
+                print(f"GetCommRealData: {code}, {fid} -> {value}")
+            values.append(value)
+        time_str = values[0].strip()
+        price = int(values[1].strip().replace('+', '').replace('-', '').replace(',', ''))
+        volume = abs(int(values[2].strip() or 0))
+        return time_str, price, volume
+
+    started = time.perf_counter()
+    for _ in range(n):
+        decoder.trade(packet)
+    bulk = (time.perf_counter() - started) / n
+
+    started = time.perf_counter()
+    for _ in range(n):
+        per_fid('005930', False)
+    calls = (time.perf_counter() - started) / n
+
+    with redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        for _ in range(n):
+            per_fid('005930', True)
+        calls_print = (time.perf_counter() - started) / n
+
+    print(f"bulk decode:            {bulk * 1e6:.2f} us/event -> {decoder.trade(packet)}")
+    print(f"per-FID calls:          {calls * 1e6:.2f} us/event")
+    print(f"per-FID calls + print:  {calls_print * 1e6:.2f} us/event (stdout to memory)")
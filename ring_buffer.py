@@ -0,0 +1,74 @@
+import numpy as np
+from bar_store import KST_OFFSET
+
+DEFAULT_CAPACITY = 10000
+
+
+class PriceRingBuffer:
+    # 종목별 고정 크기 체결 이력 (epoch ms, 가격, 거래량)
+    # 같은 값을 [i] 와 [i + capacity] 두 곳에 기록해서 최근 n개는 항상 연속된 구간 -> 복사 없는 view
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._ts = np.zeros(2 * capacity, dtype=np.int64)
+        self._price = np.zeros(2 * capacity, dtype=np.int64)
+        self._volume = np.zeros(2 * capacity, dtype=np.int64)
+        self._head = 0   # 다음에 쓸 위치
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, ts_ms, price, volume=0):
+        i = self._head
+        j = i + self.capacity
+        self._ts[i] = self._ts[j] = ts_ms
+        self._price[i] = self._price[j] = price
+        self._volume[i] = self._volume[j] = volume
+        self._head = i + 1 if i + 1 < self.capacity else 0
+        if self._size < self.capacity:
+            self._size += 1
+
+    def window(self, n=None):
+        # 최근 n개 (기본: 전체) 의 (ts, price, volume) 읽기 전용 view
+        # 복사본이 아니므로 버퍼가 가득 찬 뒤의 append 는 view 의 오래된 값부터 덮어쓴다 (보관하려면 copy)
+        n = self._size if n is None else min(n, self._size)
+        end = self._head + self.capacity
+        views = (self._ts[end - n:end], self._price[end - n:end], self._volume[end - n:end])
+        for view in views:
+            view.flags.writeable = False
+        return views
+
+    def last(self):
+        if not self._size:
+            return None
+        i = self._head - 1 if self._head else self.capacity - 1
+        return int(self._ts[i]), int(self._price[i]), int(self._volume[i])
+
+    def times(self, n=None):
+        # 차트용 naive KST datetime64 배열
+        return (self.window(n)[0] + KST_OFFSET * 1000).astype('datetime64[ms]')
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+
+
+class PriceHistory:
+    # 종목코드 -> PriceRingBuffer, 처음 들어온 종목은 자동으로 생성
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.buffers = {}
+
+    def __getitem__(self, code):
+        buffer = self.buffers.get(code)
+        if buffer is None:
+            buffer = self.buffers[code] = PriceRingBuffer(self.capacity)
+        return buffer
+
+    def __contains__(self, code):
+        return code in self.buffers
+
+    def append(self, code, ts_ms, price, volume=0):
+        self[code].append(ts_ms, price, volume)
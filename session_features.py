@@ -0,0 +1,102 @@
+from collections import defaultdict
+import numpy as np
+from bar_store import KST_OFFSET, TICK_BAR
+from bar_aggregator import SESSION_OPEN
+
+# 첫 한 시간 (09:00 ~ 10:00), 앞쪽 봉은 최대 5개까지 본다 (StockAnalyzer 규칙과 같음)
+FIRST_HOUR_END = 10 * 3600
+FEATURE_CANDLES = 5
+
+
+def feature_keys(bars):
+    # 새로 쓴 봉 (symbol, timeframe, ts, ...) -> 특징을 다시 계산할 (symbol, timeframe, day)
+    # 첫 한 시간 밖의 봉은 특징에 영향을 주지 않는다 (다음 날 갭의 전일 종가는 다음 날 첫 봉 때 읽음)
+    keys = set()
+    for symbol, timeframe, ts, *_ in bars:
+        seconds = (ts + KST_OFFSET) % 86400
+        if timeframe != TICK_BAR and seconds < FIRST_HOUR_END:
+            keys.add((symbol, timeframe, ts - seconds))
+    return keys
+
+
+def session_features(rows, prev_closes, timeframe, day):
+    # 하루 첫 한 시간 봉 (symbol, ts, open, high, low, close, volume), 종목/시간 순 -> session_features 행
+    if not rows:
+        return []
+    data = np.array([row[1:] for row in rows], dtype=np.float64)   # None -> NaN
+    symbols = np.array([row[0] for row in rows])
+    starts = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])
+    group = np.cumsum(np.r_[True, symbols[1:] != symbols[:-1]]) - 1
+    pos = np.arange(len(rows)) - starts[group]
+    n = len(starts)
+    counts = np.bincount(group, minlength=n)
+
+    # 앞쪽 FEATURE_CANDLES 개 봉의 시가/저가/종가 (종목 x 순서, 빈칸 NaN)
+    keep = pos < FEATURE_CANDLES
+    opens, lows, closes = (np.full((n, FEATURE_CANDLES), np.nan) for _ in range(3))
+    opens[group[keep], pos[keep]] = data[keep, 1]
+    lows[group[keep], pos[keep]] = data[keep, 3]
+    closes[group[keep], pos[keep]] = data[keep, 4]
+    run = np.cumprod(closes[:, 1:] >= opens[:, 1:], axis=1).sum(axis=1)
+    one_price = closes[np.arange(n), run]
+
+    volume = np.nan_to_num(data[:, 5])
+    high = np.maximum.reduceat(data[:, 2], starts)
+    low = np.minimum.reduceat(data[:, 3], starts)
+    total_volume = np.add.reduceat(volume, starts)
+    typical = (data[:, 2] + data[:, 3] + data[:, 4]) / 3
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vwap = np.add.reduceat(typical * volume, starts) / total_volume
+
+    def value(x, integer=True):
+        return None if np.isnan(x) else (int(x) if integer else float(x))
+
+    result = []
+    for i, symbol in enumerate(symbols[starts]):
+        prev_close = prev_closes.get(symbol)
+        gap = opens[i, 0] / prev_close - 1 if prev_close else None
+        result.append((symbol, timeframe, day, int(counts[i]), prev_close, gap,
+                       value(opens[i, 0]), value(closes[i, 0]), value(opens[i, 1]), value(closes[i, 1]),
+                       value(lows[i, 1]), int(run[i]), value(one_price[i]), value(high[i]), value(low[i]),
+                       int(total_volume[i]), value(vwap[i], integer=False)))
+    return result
+
+
+def update_features(store, keys, commit=True):
+    # (symbol, timeframe, day) 들의 특징을 다시 계산해서 저장, (timeframe, day) 마다 쿼리 두 번
+    by_day = defaultdict(set)
+    for symbol, timeframe, day in keys:
+        by_day[timeframe, day].add(symbol)
+    written = 0
+    for (timeframe, day), symbols in by_day.items():
+        rows = store.bar_range_rows(timeframe, day + SESSION_OPEN, day + FIRST_HOUR_END, sorted(symbols))
+        features = session_features(rows, store.previous_closes(timeframe, day, symbols), timeframe, day)
+        store.write_session_features(features, commit=False)
+        written += len(features)
+    if commit:
+        store.conn.commit()
+    return written
+
+
+def rebuild_features(store, timeframes, start=None, end=None):
+    # 이미 저장된 봉으로 특징 테이블을 (다시) 만든다
+    written = 0
+    for timeframe in timeframes:
+        keys = [(symbol, timeframe, day) for symbol, day in store.session_day_keys(timeframe, FIRST_HOUR_END, start, end)]
+        written += update_features(store, keys, commit=False)
+    store.conn.commit()
+    return written
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from bar_store import BarStore, BAR_STORE_PATH
+    from bar_aggregator import TIMEFRAMES
+
+    # 사용법: python session_features.py [bars.db]  (저장된 모든 봉으로 특징 테이블 다시 만들기)
+    store = BarStore(sys.argv[1] if len(sys.argv) > 1 else BAR_STORE_PATH)
+    started = time.perf_counter()
+    written = rebuild_features(store, TIMEFRAMES)
+    print(f"Rebuilt {written} feature rows in {time.perf_counter() - started:.2f}s")
+    store.close()
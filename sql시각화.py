@@ -1,43 +1,46 @@
 import sqlite3
 import pandas as pd
-import mplfinance as mpf
-import os
 import logging
-import re
-import matplotlib.pyplot as plt
+from chart_render import ChartRenderer, make_job
+from bar_store import BarStore, BAR_STORE_PATH, TICK_BAR, day_range, parse_db_name, timeframe_label
 
 class DBVisualizer:
-    def __init__(self, db_name, num_records=200):
+    def __init__(self, db_name, num_records=200, store_path=BAR_STORE_PATH, preset='print', workers=None):
         self.db_name = db_name
-        self.db_path = f'{db_name}.db'
+        self.date_str, self.cond_name = parse_db_name(db_name)
+        self.store_path = store_path
         self.charts_folder = db_name
         self.num_records = num_records
+        self.renderer = ChartRenderer(preset, workers)
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
         self.logger = logging.getLogger(__name__)
 
-    def fetch_table_names(self):
+    def fetch_bars(self):
+        # 해당 날짜에 조건식에 편입된 종목 + 예전 날짜별 DB 파일에 테이블이 있던 종목의
+        # (종목, 타임프레임)별 최근 봉을 한 번에 조회. 그날 봉이 있는데 빠진 종목은 로그로 남긴다
+        day_start, day_end = day_range(self.date_str)
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = [name[0] for name in cursor.fetchall() if re.match(r'.*\d{6}$', name[0])]
-            conn.close()
-            self.logger.info(f"Found tables: {tables}")
-            return tables
+            store = BarStore(self.store_path)
+            symbols = store.chart_symbols(self.cond_name, self.db_name, day_start, day_end)
+            skipped = set(store.bar_symbols(day_start, day_end)) - set(symbols)
+            df = store.fetch_latest_bars(self.num_records, end=day_end, symbols=symbols)
+            store.close()
+            if skipped:
+                self.logger.info(f"Skipped {len(skipped)} stocks not tracked by {self.cond_name}: {', '.join(sorted(skipped))}")
+            self.logger.info(f"Fetched {len(df)} bars for {df['symbol'].nunique()} stocks")
+            return df
         except sqlite3.Error as e:
-            self.logger.error(f"Failed to fetch table names: {e}")
-            return []
+            self.logger.error(f"Failed to fetch bars: {e}")
+            return pd.DataFrame(columns=['symbol', 'timeframe', 'date', 'open', 'high', 'low', 'close', 'volume'])
 
     def visualize_all(self):
-        tables = self.fetch_table_names()
-        for selected_table in tables:
+        df_all = self.fetch_bars()
+        df_all = df_all[df_all['timeframe'] != TICK_BAR]  # 예전 실시간 기록기의 틱 묶음 봉은 제외
+        jobs = []
+        for (symbol, timeframe), df in df_all.groupby(['symbol', 'timeframe']):
+            selected_table = f"{timeframe_label(timeframe)}_{symbol}"
             try:
-                conn = sqlite3.connect(self.db_path)
-                query = f'SELECT * FROM "{selected_table}" ORDER BY date DESC LIMIT {self.num_records}'
-                df = pd.read_sql_query(query, conn, parse_dates=['date'], index_col='date')
-                conn.close()
-                
-                df = df.sort_index()  # Sorting back to ascending order for plotting
+                df = df.set_index('date')[['open', 'high', 'low', 'close', 'volume']]
 
                 prev_day = df.index.max() - pd.Timedelta(days=1)
                 prev_day_df = df.loc[df.index.date == prev_day.date(), 'close']
@@ -48,21 +51,15 @@ class DBVisualizer:
                     title += f"\nPrevious close: {prev_day_close}"
 
                 save_path = f'./{self.charts_folder}/{selected_table}.jpg'
-                os.makedirs(os.path.dirname(save_path), exist_ok=True)
-                savefig_options = {'fname': save_path, 'dpi': 800}
-
-                fig, ax = mpf.plot(df, type='candle', style='charles', title=title, volume=True, returnfig=True)
-                fig.set_size_inches(10, 6)
-                fig.savefig(**savefig_options)
-                plt.close(fig)
-                self.logger.info(f"Saved chart for {selected_table} at {save_path}")
+                jobs.append(make_job(save_path, df, title, volume=True))
             except KeyError as e:
                 self.logger.error(f"Error with table {selected_table}: {e}")
-            except sqlite3.Error as e:
-                self.logger.error(f"Database error with table {selected_table}: {e}")
             except Exception as e:
                 self.logger.error(f"Unexpected error with table {selected_table}: {e}")
 
+        # 프로세스 풀에서 병렬로 그리고, 데이터가 바뀌지 않은 차트는 건너뜀
+        return self.renderer.render(jobs)
+
 # Example usage
 if __name__ == "__main__":
     db_name = '20240717_시가갭검색식_돌파'
@@ -0,0 +1,157 @@
+import queue
+import threading
+import time
+from bar_store import BarStore, BAR_STORE_PATH
+from session_features import feature_keys, update_features
+
+_FLUSH = object()
+_STOP = object()
+
+
+class StoreWriter:
+    # 실시간 콜백에서는 큐에 넣기만 하고, 백그라운드 스레드가 모아서 executemany + 한 번의 commit
+
+    def __init__(self, db_path=BAR_STORE_PATH, max_queue=100000, batch_size=1000, flush_interval=0.5):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = None
+        self._tick_seq = {}
+        self._event_seq = {}
+
+        # 통계 (GUI/로그에서 확인용)
+        self.written = 0
+        self.commits = 0
+        self.dropped = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="StoreWriter", daemon=True)
+        self.thread.start()
+
+    def put_bar(self, symbol, timeframe, ts, open_price, high_price, low_price, close_price, volume=None):
+        self._put(('bar', (symbol, timeframe, ts, open_price, high_price, low_price, close_price, volume)))
+
+    def put_tick(self, symbol, ts, price, volume=None):
+        # 같은 초에 들어온 체결은 seq 로 구분
+        last_ts, seq = self._tick_seq.get(symbol, (None, -1))
+        seq = seq + 1 if ts == last_ts else 0
+        self._tick_seq[symbol] = (ts, seq)
+        self._put(('tick', (symbol, ts, seq, price, volume)))
+
+    def put_condition_event(self, cond_name, code, ts, event_type, price=None, seq=None):
+        # 같은 초에 들어온 이벤트는 seq 로 구분. 나중에 가격을 채울 때는 돌려받은 seq 로 같은 이벤트를 다시 넣는다
+        if seq is None:
+            last_ts, seq = self._event_seq.get((cond_name, code), (None, -1))
+            seq = seq + 1 if ts == last_ts else 0
+            self._event_seq[cond_name, code] = (ts, seq)
+        self._put(('condition', (cond_name, code, ts, seq, event_type, price)))
+        return seq
+
+    def put_tracked_stock(self, cond_name, code, first_seen):
+        self._put(('tracked', (cond_name, code, first_seen)))
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # 콜백 스레드는 절대 기다리지 않는다
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                print(f"StoreWriter queue full, dropped {self.dropped} records")
+
+    def flush(self, timeout=None):
+        # 지금까지 넣은 데이터가 commit 될 때까지 대기
+        if self.thread is None or not self.thread.is_alive():
+            return False
+        done = threading.Event()
+        self.queue.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    def close(self, timeout=10):
+        if self.thread is None:
+            return
+        self.queue.put((_STOP, None))
+        self.thread.join(timeout)
+        self.thread = None
+        print(f"StoreWriter closed: written={self.written}, commits={self.commits}, dropped={self.dropped}")
+
+    def _run(self):
+        # sqlite 연결은 이 스레드에서만 사용
+        store = BarStore(self.db_path)
+        store.set_wal_mode()
+        bars, ticks, events, tracked = [], [], [], []
+        deadline = None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    kind, payload = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    kind, payload = _FLUSH, None
+
+                if kind == 'bar':
+                    bars.append(payload)
+                elif kind == 'tick':
+                    ticks.append(payload)
+                elif kind == 'condition':
+                    events.append(payload)
+                elif kind == 'tracked':
+                    tracked.append(payload)
+
+                pending = len(bars) + len(ticks) + len(events) + len(tracked)
+                if pending and deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+                if kind is _FLUSH or kind is _STOP or pending >= self.batch_size:
+                    if pending:
+                        self._commit(store, bars, ticks, events, tracked)
+                        bars, ticks, events, tracked = [], [], [], []
+                    deadline = None
+                    if kind is _FLUSH and payload is not None:
+                        payload.set()
+                    if kind is _STOP:
+                        break
+        finally:
+            if bars or ticks or events or tracked:
+                self._commit(store, bars, ticks, events, tracked)
+            store.close()
+
+    def _commit(self, store, bars, ticks, events, tracked):
+        # 실패하면 한 번 더 (잠깐 잠긴 경우 등), 그래도 실패하면 종류별로 따로 써서
+        # 잘못된 행이 있는 종류만 버리고 dropped 로 센다
+        batches = [(kind, rows) for kind, rows in
+                   (('bar', bars), ('tick', ticks), ('condition', events), ('tracked', tracked)) if rows]
+        count = sum(len(rows) for _, rows in batches)
+        for attempt in range(2):
+            try:
+                self._write(store, batches)
+                return
+            except Exception as e:
+                store.conn.rollback()
+                print(f"StoreWriter failed to write {count} records (attempt {attempt + 1}): {e}")
+                if attempt == 0:
+                    time.sleep(self.flush_interval)
+        for kind, rows in batches:
+            try:
+                self._write(store, [(kind, rows)])
+            except Exception as e:
+                store.conn.rollback()
+                self.dropped += len(rows)
+                print(f"StoreWriter dropped {len(rows)} {kind} records: {e}")
+
+    def _write(self, store, batches):
+        for kind, rows in batches:
+            if kind == 'bar':
+                store.write_bars(rows, commit=False)
+                # 장 초반 봉이 들어오면 그 종목/날짜의 특징도 같은 트랜잭션에서 갱신
+                update_features(store, feature_keys(rows), commit=False)
+            elif kind == 'tick':
+                store.write_ticks(rows, commit=False)
+            elif kind == 'condition':
+                store.write_condition_events(rows, commit=False)
+            elif kind == 'tracked':
+                store.upsert_tracked_stocks(rows, commit=False)
+        store.conn.commit()
+        self.written += sum(len(rows) for _, rows in batches)
+        self.commits += 1
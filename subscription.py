@@ -0,0 +1,120 @@
+from collections import deque
+
+# 키움 실시간 등록 제한: 화면번호 하나에 최대 100종목
+MAX_CODES_PER_SCREEN = 100
+# 실시간 시세 전용 화면번호 (조건검색 "100", 장운영 "1000" 등 기존 화면과 겹치지 않게)
+FIRST_SCREEN = 5000
+MAX_SCREENS = 50
+REAL_FIDS = "20;10;15"
+
+
+class SubscriptionManager:
+    # 실시간 시세 구독을 종목 단위로 더하고 뺀다.
+    # - 여러 사용처 (조건식, 기록기 등) 가 같은 종목을 구독하면 사용처별로 세서 모두 해지했을 때만 SetRealRemove
+    # - 종목을 화면번호마다 max_codes 개까지 나눠 담고, 추가는 항상 real_type "1" (기존 등록 유지)
+    # - subscribe/unsubscribe 는 어느 스레드에서 불러도 되고 (요청만 쌓음),
+    #   실제 OCX 호출은 apply() 를 부르는 Qt 메인 스레드에서 화면별로 한 번에 한다.
+
+    def __init__(self, ocx, fids=REAL_FIDS, first_screen=FIRST_SCREEN, max_screens=MAX_SCREENS,
+                 max_codes=MAX_CODES_PER_SCREEN):
+        self.ocx = ocx
+        self.fids = fids
+        self.max_codes = max_codes
+        self.screens = [str(first_screen + i) for i in range(max_screens)]
+        self.screen_codes = {screen: set() for screen in self.screens}
+        self.screen_of = {}      # code -> 등록된 화면번호
+        self.consumers = {}      # code -> 구독 중인 사용처 집합
+        self.pending = deque()   # (add/remove, codes, consumer)
+
+        # 통계
+        self.register_calls = 0
+        self.remove_calls = 0
+        self.rejected = 0
+
+    def subscribe(self, codes, consumer):
+        self.pending.append(('add', tuple(codes), consumer))
+
+    def unsubscribe(self, codes, consumer):
+        self.pending.append(('remove', tuple(codes), consumer))
+
+    def unsubscribe_all(self, consumer):
+        self.pending.append(('remove_all', (), consumer))
+
+    def apply(self):
+        # 쌓인 요청을 정리해서 OCX 에 반영 (같은 주기 안에서 추가 후 해지된 종목은 등록하지 않음)
+        added, removed = set(), set()
+        while self.pending:
+            action, codes, consumer = self.pending.popleft()
+            if action == 'remove_all':
+                action = 'remove'
+                codes = [code for code, users in self.consumers.items() if consumer in users]
+            for code in codes:
+                users = self.consumers.get(code)
+                if action == 'add':
+                    if users is None:
+                        users = self.consumers[code] = set()
+                        if code in removed:
+                            removed.discard(code)
+                        else:
+                            added.add(code)
+                    users.add(consumer)
+                elif users is not None and consumer in users:
+                    users.discard(consumer)
+                    if not users:
+                        del self.consumers[code]
+                        if code in added:
+                            added.discard(code)
+                        else:
+                            removed.add(code)
+
+        for code in removed:
+            screen = self.screen_of.pop(code)
+            self.screen_codes[screen].discard(code)
+            self.ocx.dynamicCall("SetRealRemove(QString, QString)", screen, code)
+            self.remove_calls += 1
+
+        if added:
+            self._register(sorted(added))
+        return len(added), len(removed)
+
+    def _register(self, codes):
+        # 빈자리가 있는 화면부터 채워서 화면마다 SetRealReg 한 번
+        i = 0
+        for screen in self.screens:
+            if i >= len(codes):
+                break
+            space = self.max_codes - len(self.screen_codes[screen])
+            if space <= 0:
+                continue
+            batch = codes[i:i + space]
+            i += len(batch)
+            self.screen_codes[screen].update(batch)
+            for code in batch:
+                self.screen_of[code] = screen
+            self.ocx.dynamicCall("SetRealReg(QString, QString, QString, QString)",
+                                 screen, ";".join(batch), self.fids, "1")
+            self.register_calls += 1
+        if i < len(codes):
+            # 화면번호가 모두 찼으면 남은 종목은 구독하지 못한다
+            for code in codes[i:]:
+                del self.consumers[code]
+            self.rejected += len(codes) - i
+            print(f"SubscriptionManager: no screen left for {len(codes) - i} codes")
+
+    def close(self):
+        for screen in self.screens:
+            if self.screen_codes[screen]:
+                self.ocx.dynamicCall("SetRealRemove(QString, QString)", screen, "ALL")
+                self.screen_codes[screen].clear()
+        self.screen_of.clear()
+        self.consumers.clear()
+        self.pending.clear()
+
+    def stats(self):
+        return {
+            'codes': len(self.screen_of),
+            'screens': sum(1 for codes in self.screen_codes.values() if codes),
+            'register_calls': self.register_calls,
+            'remove_calls': self.remove_calls,
+            'rejected': self.rejected,
+        }
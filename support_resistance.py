@@ -0,0 +1,251 @@
+import time
+from collections import namedtuple
+import numpy as np
+from bar_store import KST_OFFSET
+from bar_aggregator import TIMEFRAMES
+
+# price: 거래량 가중 평균 가격, low/high: 가격대 범위, strength: 가장 강한 가격대 대비 거래량 (0~1)
+Level = namedtuple('Level', 'price low high strength volume')
+
+
+def cluster_stats(values, labels, weights=None):
+    # 군집 결과 (label -1 = 잡음) -> 군집별 (label, 중앙값, 개수, 가중치 합)
+    # 군집마다 마스크를 만들지 않고 (label, 값) 으로 한 번 정렬해서 구간별로 집계한다
+    values = np.asarray(values, dtype=np.float64).ravel()
+    labels = np.asarray(labels).ravel()
+    weights = np.ones_like(values) if weights is None else np.asarray(weights, dtype=np.float64).ravel()
+    keep = labels >= 0
+    values, labels, weights = values[keep], labels[keep], weights[keep]
+    if not len(values):
+        empty = np.empty(0)
+        return empty.astype(np.int64), empty, empty.astype(np.int64), empty
+    order = np.lexsort((values, labels))
+    values, labels = values[order], labels[order]
+    counts = np.bincount(labels)
+    present = np.flatnonzero(counts)
+    counts = counts[present]
+    starts = np.cumsum(counts) - counts
+    medians = (values[starts + (counts - 1) // 2] + values[starts + counts // 2]) / 2
+    totals = np.bincount(labels, weights=weights[order])[present]
+    return present, medians, counts, totals
+
+
+class LevelTracker:
+    # 가격대별 거래량 분포 (volume profile) 로 지지/저항 가격대를 찾는다.
+    # - 가격 구간은 bin_pct 간격의 로그 눈금, 봉마다 거래량의 close_weight 만큼은 종가 구간에,
+    #   나머지는 저가~고가 구간에 고르게 나눠 더한다 (차분 배열에 np.bincount 로 한 번에 더하고 cumsum)
+    # - window 개 봉만 유지: 새 봉은 더하고 밀려난 봉은 같은 방법으로 뺀다 (전체를 다시 계산하지 않음)
+    # - 거래량이 threshold (최대 대비 비율) 이상인 연속 구간을 하나의 가격대로 묶는다
+
+    def __init__(self, bin_pct=0.002, window=None, threshold=0.3, max_levels=8, close_weight=0.5):
+        self.step = np.log1p(bin_pct)
+        self.close_weight = close_weight
+        self.window = window
+        self.threshold = threshold
+        self.max_levels = max_levels
+        self.origin = None        # profile[0] 의 로그 눈금 번호
+        self.profile = np.zeros(0)
+        # 창 안의 봉별 기여 (봉마다 저가~고가, 종가 두 개씩): 시작/끝 구간 번호 (절대값), 구간당 거래량
+        self.lo = np.empty(0, dtype=np.int64)
+        self.hi = np.empty(0, dtype=np.int64)
+        self.weight = np.empty(0)
+        self.ts = np.empty(0, dtype=np.int64)   # 창 안의 봉별 ts (ts 없이 더한 봉은 -1)
+        self.last_ts = None
+
+    def __len__(self):
+        return len(self.weight) // 2
+
+    def _bins(self, prices):
+        return np.floor(np.log(prices) / self.step).astype(np.int64)
+
+    def _accumulate(self, lo, hi, weight, sign):
+        # 절대 구간 번호 -> profile 인덱스, 필요하면 profile 을 넓힌다
+        low, high = lo.min(), hi.max() + 1
+        if self.origin is None:
+            self.origin = low
+        if low < self.origin:
+            self.profile = np.concatenate([np.zeros(self.origin - low), self.profile])
+            self.origin = low
+        if high - self.origin > len(self.profile):
+            self.profile = np.concatenate([self.profile, np.zeros(high - self.origin - len(self.profile))])
+        size = len(self.profile) + 1
+        diff = np.bincount(lo - self.origin, weights=weight, minlength=size)
+        diff -= np.bincount(hi + 1 - self.origin, weights=weight, minlength=size)
+        self.profile += sign * np.cumsum(diff)[:-1]
+
+    def add_bars(self, high, low, close, volume, ts=None):
+        # high/low/close/volume: 같은 길이의 배열 (시간순). volume 이 없으면 (NaN) 봉 하나를 1 로 센다
+        high = np.asarray(high, dtype=np.float64)
+        low = np.asarray(low, dtype=np.float64)
+        close = np.asarray(close, dtype=np.float64)
+        volume = np.nan_to_num(np.asarray(volume, dtype=np.float64), nan=1.0)
+        valid = (low > 0) & (high >= low) & (close >= low) & (close <= high)
+        if not valid.any():
+            return
+        volume = volume[valid]
+        lo, hi, at_close = self._bins(low[valid]), self._bins(high[valid]), self._bins(close[valid])
+        spread = volume * (1 - self.close_weight) / (hi - lo + 1)
+        # 시간순 만료를 위해 봉별 (범위, 종가) 기여를 번갈아 담는다
+        lo = np.column_stack([lo, at_close]).ravel()
+        hi = np.column_stack([hi, at_close]).ravel()
+        weight = np.column_stack([spread, volume * self.close_weight]).ravel()
+        self._accumulate(lo, hi, weight, 1.0)
+        self.lo = np.concatenate([self.lo, lo])
+        self.hi = np.concatenate([self.hi, hi])
+        self.weight = np.concatenate([self.weight, weight])
+        if ts is not None:
+            self.last_ts = int(np.asarray(ts)[-1])
+            self.ts = np.concatenate([self.ts, np.asarray(ts, dtype=np.int64)[valid]])
+        else:
+            self.ts = np.concatenate([self.ts, np.full(len(volume), -1, dtype=np.int64)])
+
+        if self.window is not None and len(self) > self.window:
+            self._remove(slice(None, (len(self) - self.window) * 2))
+
+    def _remove(self, entries):
+        # 봉별 기여 중 entries 구간을 빼고 버린다 (창에서 밀려난 봉 / 다시 읽을 봉)
+        self._accumulate(self.lo[entries], self.hi[entries], self.weight[entries], -1.0)
+        keep = np.ones(len(self.weight), dtype=bool)
+        keep[entries] = False
+        self.lo, self.hi, self.weight = self.lo[keep], self.hi[keep], self.weight[keep]
+        self.ts = self.ts[keep[::2]]
+        np.maximum(self.profile, 0, out=self.profile)   # 빼기 후 부동소수 오차
+
+    def drop_since(self, ts):
+        # ts 이후 봉의 기여를 뺀다 (장중 미완성 봉을 같은 ts 로 덮어쓴 경우 다시 더하기 위해)
+        first = int(np.searchsorted(self.ts, ts))
+        if first < len(self):
+            self._remove(slice(first * 2, None))
+
+    def levels(self):
+        if not len(self.weight) or self.profile.max() <= 0:
+            return []
+        dense = self.profile >= self.profile.max() * self.threshold
+        # 연속 구간마다 번호를 붙여서 (가격*거래량, 거래량, 시작, 끝) 을 bincount 로 한 번에 집계
+        starts = dense & ~np.r_[False, dense[:-1]]
+        zone = np.cumsum(starts) - 1
+        bins = np.flatnonzero(dense)
+        zone = zone[bins]
+        volume = self.profile[bins]
+        prices = np.exp((bins + self.origin + 0.5) * self.step)
+        totals = np.bincount(zone, weights=volume)
+        price = np.bincount(zone, weights=prices * volume) / totals
+        first = np.flatnonzero(starts)
+        last = np.flatnonzero(dense & ~np.r_[dense[1:], False])
+        low = np.exp((first + self.origin) * self.step)
+        high = np.exp((last + self.origin + 1) * self.step)
+        strength = totals / totals.max()
+        strongest = np.sort(np.argsort(totals)[::-1][:self.max_levels])
+        return [Level(float(price[i]), float(low[i]), float(high[i]), float(strength[i]), float(totals[i]))
+                for i in strongest]
+
+
+class LevelBook:
+    # 종목 x 타임프레임별 LevelTracker. update() 는 BarStore 에서 종목마다 마지막으로 본 봉부터 읽어서 더한다
+    # (장중에 주기적으로 불러서 편입 종목 전체의 가격대를 갱신)
+    # - 마지막으로 본 봉은 미완성 봉이 같은 ts 로 덮어써졌을 수 있으므로 빼고 다시 더한다
+    # - 나중에 백필된 종목은 다른 종목의 진행과 상관없이 start 부터 읽는다
+
+    def __init__(self, timeframes=TIMEFRAMES, window=400, **tracker_options):
+        self.timeframes = list(timeframes)
+        self.window = window
+        self.tracker_options = tracker_options
+        self.trackers = {}   # (symbol, timeframe) -> LevelTracker
+        self.seen = {}       # (symbol, timeframe) -> 지금까지 읽은 마지막 봉 ts
+        self.skipped = {}    # (symbol, timeframe) -> 읽었지만 조건에 안 맞았던 때의 마지막 봉 ts
+
+    def update(self, store, start=None, cond_name=None, tracked_range=None):
+        # 갱신된 (종목, 타임프레임) 수를 돌려준다
+        updated = 0
+        for timeframe in self.timeframes:
+            # 새 봉이 생긴 종목만 읽는다: 처음 보는 종목은 start 부터, 본 종목은 마지막으로 본 봉부터
+            last_times = store.last_bar_times(timeframe)
+            new, known = [], {}
+            for symbol, last in last_times.items():
+                since = self.seen.get((symbol, timeframe))
+                if since is not None:
+                    if last > since:
+                        known[symbol] = since
+                elif self.skipped.get((symbol, timeframe)) != last:
+                    new.append(symbol)
+            reads = []
+            if new:
+                reads.append(store.fetch_bars(timeframe, start=start, symbols=new,
+                                              cond_name=cond_name, tracked_range=tracked_range))
+            if known:
+                reads.append(store.fetch_bars(timeframe, start=min(known.values()), symbols=known,
+                                              cond_name=cond_name, tracked_range=tracked_range))
+            for bars in reads:
+                updated += self._add(bars, timeframe, known)
+            for symbol in new:
+                if (symbol, timeframe) not in self.seen:
+                    self.skipped[(symbol, timeframe)] = last_times[symbol]
+        return updated
+
+    def _add(self, bars, timeframe, known):
+        if bars.empty:
+            return 0
+        ts = bars['date'].to_numpy().astype('datetime64[s]').astype(np.int64) - KST_OFFSET
+        symbols = bars['symbol'].to_numpy()
+        bounds = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1], True])
+        for first, end in zip(bounds[:-1], bounds[1:]):
+            symbol = symbols[first]
+            key = (symbol, timeframe)
+            tracker = self.trackers.get(key)
+            if tracker is None:
+                tracker = self.trackers[key] = LevelTracker(window=self.window, **self.tracker_options)
+            since = known.get(symbol)
+            if since is not None:
+                # 다른 종목 기준으로 더 앞에서부터 읽었으면 이 종목이 본 봉 이전은 버린다
+                first += int(np.searchsorted(ts[first:end], since))
+                tracker.drop_since(since)
+            rows = bars.iloc[first:end]
+            tracker.add_bars(rows['high'].to_numpy(), rows['low'].to_numpy(), rows['close'].to_numpy(),
+                             rows['volume'].to_numpy(), ts[first:end])
+            self.seen[key] = int(ts[end - 1])
+        return len(bounds) - 1
+
+    def levels(self, symbol, timeframe):
+        tracker = self.trackers.get((symbol, timeframe))
+        return tracker.levels() if tracker is not None else []
+
+    def nearest(self, symbol, timeframe, price):
+        # 현재가 바로 아래 지지선, 바로 위 저항선 (없으면 None)
+        levels = self.levels(symbol, timeframe)
+        support = max((l for l in levels if l.price <= price), key=lambda l: l.price, default=None)
+        resistance = min((l for l in levels if l.price > price), key=lambda l: l.price, default=None)
+        return support, resistance
+
+
+if __name__ == "__main__":
+    import sys
+    from bar_store import BarStore, BAR_STORE_PATH, timeframe_label
+
+    # 사용법: python support_resistance.py [bars.db] [조건식]
+    store = BarStore(sys.argv[1] if len(sys.argv) > 1 else BAR_STORE_PATH)
+    book = LevelBook()
+    started = time.perf_counter()
+    updated = book.update(store, cond_name=sys.argv[2] if len(sys.argv) > 2 else None)
+    elapsed = time.perf_counter() - started
+    started = time.perf_counter()
+    book.update(store)   # 새 봉이 없으면 읽기만 하고 끝
+    again = time.perf_counter() - started
+    print(f"{updated} symbol/timeframes in {elapsed * 1000:.1f} ms, incremental check {again * 1000:.1f} ms")
+    for (symbol, timeframe) in sorted(book.trackers)[:10]:
+        levels = ', '.join(f"{l.price:,.0f}({l.strength:.2f})" for l in book.levels(symbol, timeframe))
+        print(f"{symbol} {timeframe_label(timeframe)}: {levels}")
+
+    # 예전 방식 (군집마다 마스크) 과 cluster_stats 비교
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=200000)
+    labels = rng.integers(-1, 200, size=len(values))
+    started = time.perf_counter()
+    medians = [np.median(values[labels == label]) for label in set(labels) if label != -1]
+    sizes = [np.sum(labels == label) for label in set(labels) if label != -1]
+    masks = time.perf_counter() - started
+    started = time.perf_counter()
+    _, grouped_medians, grouped_sizes, _ = cluster_stats(values, labels)
+    grouped = time.perf_counter() - started
+    assert np.allclose(sorted(medians), sorted(grouped_medians)) and sorted(sizes) == sorted(grouped_sizes)
+    print(f"cluster stats: per-label masks {masks * 1000:.1f} ms, grouped {grouped * 1000:.1f} ms")
+    store.close()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# 저장소 루트 모듈과 학습모듈/ 스크립트를 테스트에서 바로 import
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, '학습모듈')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import SessionGrid, simulate
+
+# 수수료/세금/슬리피지 없이 가격 규칙만 본다
+NO_COST = {'timeframe': 60, 'fee': 0.0, 'tax': 0.0, 'slippage': 0.0}
+
+# 첫 봉 양봉 (시가 100 -> 0 가격), 2번째 봉 양봉 종가 120 (1 가격), 3번째 봉 음봉
+# -> 매수 0.382 = 107.64, 손절 0 = 100, 일부 익절 0.786 = 115.72, 목표 1.618 = 132.36
+SETUP = [
+    ('09:00', 100, 110, 100, 110),
+    ('09:01', 110, 120, 110, 120),
+    ('09:02', 120, 121, 112, 115),
+]
+
+
+def make_grid(*sessions):
+    rows = []
+    for symbol, bars in sessions:
+        for hhmm, o, h, l, c in bars:
+            rows.append((symbol, pd.Timestamp(f'2024-07-15 {hhmm}'), o, h, l, c))
+    return SessionGrid(pd.DataFrame(rows, columns=['symbol', 'date', 'open', 'high', 'low', 'close']))
+
+
+def run(bars, **params):
+    trades, signals = simulate(make_grid(('A', SETUP + bars)), dict(NO_COST, **params))
+    assert signals == 1
+    return trades
+
+
+def test_limit_fill_then_target_with_partial():
+    trades = run([('09:03', 108, 109, 106, 108), ('09:04', 110, 135, 109, 130)])
+    trade = trades.iloc[0]
+    assert trade['entry_price'] == pytest.approx(107.64)
+    assert trade['reason'] == 'target' and trade['partial']
+    assert trade['exit_price'] == pytest.approx(0.5 * 115.72 + 0.5 * 132.36)
+    assert trade['bars_held'] == 1
+
+
+def test_fill_bar_opening_below_stop_exits_at_open():
+    # 손절가 아래로 갭 하락한 봉: 시가에 사서 시가에 손절, 손절 거래가 이익이 되면 안 된다
+    trades = run([('09:03', 95, 99, 94, 96)])
+    trade = trades.iloc[0]
+    assert trade['reason'] == 'stop'
+    assert trade['entry_price'] == 95
+    assert trade['exit_price'] == 95
+    assert trade['return'] <= 0
+
+
+def test_stop_before_target_on_same_bar():
+    trades = run([('09:03', 108, 109, 106, 108), ('09:04', 110, 140, 95, 120)])
+    trade = trades.iloc[0]
+    assert trade['reason'] == 'stop' and not trade['partial']
+    assert trade['exit_price'] == 100
+
+
+def test_gap_down_stop_exits_at_open():
+    trades = run([('09:03', 108, 109, 106, 108), ('09:04', 90, 92, 88, 91)])
+    assert trades.iloc[0]['exit_price'] == 90
+
+
+def test_gap_up_target_exits_at_open():
+    trades = run([('09:03', 108, 109, 106, 108), ('09:04', 140, 142, 139, 141)], partial_fraction=0.0)
+    trade = trades.iloc[0]
+    assert trade['reason'] == 'target' and not trade['partial']
+    assert trade['exit_price'] == 140
+
+
+def test_unexited_trade_closes_at_last_bar_with_slippage():
+    trades = run([('09:03', 108, 109, 106, 108), ('09:04', 108, 110, 104, 109)], slippage=0.001)
+    trade = trades.iloc[0]
+    assert trade['reason'] == 'close'
+    assert trade['exit_price'] == pytest.approx(109 * 0.999)
+
+
+def test_no_fill_and_no_signal():
+    # 매수가에 닿지 않은 종목, 첫 봉이 음봉인 종목은 거래가 없다
+    grid = make_grid(('A', SETUP + [('09:03', 112, 115, 110, 114)]),
+                     ('B', [('09:00', 100, 100, 90, 95), ('09:01', 95, 96, 80, 81)]))
+    trades, signals = simulate(grid, NO_COST)
+    assert signals == 1
+    assert trades.empty
+
+
+def test_costs_reduce_return():
+    bars = [('09:03', 108, 109, 106, 108), ('09:04', 110, 135, 109, 130)]
+    gross = run(bars).iloc[0]['return']
+    net = run(bars, fee=0.00015, tax=0.0018).iloc[0]['return']
+    assert net == pytest.approx((gross + 1) * (1 - 0.00015 - 0.0018) / (1 + 0.00015) - 1)
+    assert np.isfinite(net)
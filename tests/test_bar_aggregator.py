@@ -0,0 +1,62 @@
+from bar_store import day_range
+from bar_aggregator import BarAggregator, resample_bars
+
+DAY1 = day_range('20240715')[0]
+DAY2 = day_range('20240716')[0]
+
+
+def at(day, hhmm, second=0):
+    hour, minute = hhmm.split(':')
+    return day + int(hour) * 3600 + int(minute) * 60 + second
+
+
+def minute(day, hhmm, o, h, l, c, volume=10):
+    return (at(day, hhmm), o, h, l, c, volume)
+
+
+def test_resample_keeps_closing_auction_bucket_separate():
+    rows = [minute(DAY1, '15:18', 100, 102, 99, 101),
+            minute(DAY1, '15:19', 101, 103, 100, 102),
+            minute(DAY1, '15:30', 104, 104, 104, 104, 50)]
+    bars = resample_bars(rows, 300)
+    assert bars == [(at(DAY1, '15:15'), 100, 103, 99, 102, 20),
+                    (at(DAY1, '15:30'), 104, 104, 104, 104, 50)]
+
+
+def test_resample_skips_partial_first_bucket():
+    rows = [minute(DAY1, '09:01', 100, 101, 99, 100),
+            minute(DAY1, '09:02', 100, 102, 100, 101),
+            minute(DAY1, '09:03', 101, 105, 101, 104, None)]
+    assert resample_bars(rows, 180, start=at(DAY1, '09:01')) == [(at(DAY1, '09:03'), 101, 105, 101, 104, 0)]
+    assert resample_bars(rows, 180)[0] == (at(DAY1, '09:00'), 100, 102, 99, 101, 20)
+
+
+def test_late_tick_within_grace_goes_to_its_bucket():
+    bars = []
+    aggregator = BarAggregator([60], on_bar=lambda *bar: bars.append(bar), grace=2)
+    aggregator.add_tick('A', at(DAY1, '09:00', 10), 100, 5)
+    aggregator.add_tick('A', at(DAY1, '09:00', 50), 103, 5)
+    aggregator.add_tick('B', at(DAY1, '09:01', 1), 200, 1)
+    aggregator.add_tick('A', at(DAY1, '09:00', 5), 99, -5)    # 순서가 뒤바뀐 체결 (grace 안)
+    assert bars == []
+    aggregator.add_tick('B', at(DAY1, '09:01', 2), 201, 1)    # 09:00 구간 마감
+    assert bars == [('A', 60, at(DAY1, '09:00'), 99, 103, 99, 103, 15)]
+
+    aggregator.add_tick('A', at(DAY1, '09:00', 55), 150, 5)   # grace 이후 -> 버림
+    assert aggregator.late == 1
+    aggregator.flush()
+    assert bars[-1] == ('B', 60, at(DAY1, '09:01'), 200, 201, 200, 201, 2)
+
+
+def test_new_day_resets_watermark():
+    bars = []
+    aggregator = BarAggregator([60], on_bar=lambda *bar: bars.append(bar))
+    aggregator.add_tick('A', at(DAY1, '15:30'), 100, 5)
+    aggregator.new_day()
+    assert bars == [('A', 60, at(DAY1, '15:30'), 100, 100, 100, 100, 5)]
+
+    aggregator.add_tick('A', at(DAY2, '09:00', 30), 110, 5)
+    aggregator.add_tick('A', at(DAY2, '09:00', 10), 108, 5)   # 전날 워터마크로 늦은 체결 판정하지 않음
+    aggregator.flush()
+    assert aggregator.late == 0
+    assert bars[-1] == ('A', 60, at(DAY2, '09:00'), 108, 110, 108, 110, 10)
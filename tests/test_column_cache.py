@@ -0,0 +1,65 @@
+from bar_store import BarStore, day_range
+from column_cache import ColumnCache
+
+DAY1 = day_range('20240715')[0]
+DAY2 = day_range('20240716')[0]
+
+
+def minute_bars(day, closes, volume=100):
+    return [(day + 9 * 3600 + 60 * i, c, c + 5, c - 5, c, volume) for i, c in enumerate(closes)]
+
+
+def make_store(tmp_path):
+    store = BarStore(str(tmp_path / 'bars.db'))
+    store.upsert_bars('A', 60, minute_bars(DAY1, [100, 101, 102]))
+    store.upsert_bars('B', 60, minute_bars(DAY1, [200, 201]))
+    store.upsert_bars('A', 60, minute_bars(DAY2, [103, 104]))
+    return store
+
+
+def test_export_is_incremental_and_matches_store(tmp_path):
+    store = make_store(tmp_path)
+    cache = ColumnCache(str(tmp_path / 'cache'))
+    assert cache.export(store, [60]) == 2
+    assert cache.export(store, [60]) == 0
+    assert ColumnCache(cache.root).export(store, [60]) == 0   # manifest 에서 다시 읽어도 같음
+
+    frame = cache.frame(60)
+    expected = store.fetch_bars(60)
+    assert frame['symbol'].tolist() == expected['symbol'].tolist()
+    assert frame['close'].tolist() == expected['close'].tolist()
+    assert (frame['date'].to_numpy() == expected['date'].to_numpy()).all()
+
+    # 새 봉이 붙은 날만 다시 쓴다
+    store.upsert_bars('B', 60, minute_bars(DAY2, [205]))
+    assert cache.export(store, [60]) == 1
+    assert cache.load(60, DAY2, ('close',), 'B')['close'].tolist() == [205]
+    store.close()
+
+
+def test_in_place_correction_invalidates_day(tmp_path):
+    # 같은 (종목, 타임프레임, ts) 를 고쳐 쓰면 봉 수/마지막 ts 는 그대로지만 다시 내보내야 한다
+    store = make_store(tmp_path)
+    cache = ColumnCache(str(tmp_path / 'cache'))
+    cache.export(store, [60])
+    assert cache.load(60, DAY1, ('close',), 'A')['close'].tolist() == [100, 101, 102]
+
+    store.upsert_bars('A', 60, [(DAY1 + 9 * 3600 + 60, 101, 106, 96, 99, 100)])
+    assert cache.export(store, [60]) == 1
+    assert cache.load(60, DAY1, ('close',), 'A')['close'].tolist() == [100, 99, 102]
+    assert cache.frame(60, DAY1, DAY2, ['A'])['close'].tolist() == [100, 99, 102]
+
+    # 거래량만 고친 경우도
+    store.upsert_bars('B', 60, [(DAY1 + 9 * 3600, 200, 205, 195, 200, 150)])
+    assert cache.export(store, [60]) == 1
+    assert cache.load(60, DAY1, ('volume',), 'B')['volume'].tolist() == [150, 100]
+    store.close()
+
+
+def test_missing_volume_round_trips_as_nan(tmp_path):
+    store = BarStore(str(tmp_path / 'bars.db'))
+    store.upsert_bars('A', 60, [(DAY1 + 9 * 3600, 100, 105, 95, 100, None)])
+    cache = ColumnCache(str(tmp_path / 'cache'))
+    cache.export(store, [60])
+    assert cache.frame(60)['volume'].isna().all()
+    store.close()
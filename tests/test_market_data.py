@@ -0,0 +1,38 @@
+from bar_store import BarStore, day_range
+from market_data import ReplayMarketData
+
+DAY = day_range('20240715')[0]
+OPEN = DAY + 9 * 3600
+
+
+def replay_conditions(store):
+    replay = ReplayMarketData(store, '20240715', speed=None)
+    received = []
+    replay.OnReceiveRealCondition.connect(lambda code, event_type, cond_name, index: received.append((code, event_type, cond_name)))
+    for name in replay.GetConditionNameList().split(';'):
+        if name:
+            replay.SendCondition('0101', name.split('^')[1], 0, 1)
+    replay.run()
+    return received
+
+
+def test_replay_emits_entries_and_exits_in_order(tmp_path):
+    store = BarStore(str(tmp_path / 'bars.db'))
+    store.upsert_tracked_stocks([('조건', 'A', OPEN), ('조건', 'B', OPEN + 5)])
+    # 같은 초의 이탈/재편입은 seq 순서대로
+    store.write_condition_events([('조건', 'A', OPEN, 0, 'I', 100),
+                                  ('조건', 'B', OPEN + 5, 0, 'I', 200),
+                                  ('조건', 'A', OPEN + 10, 0, 'D', 101),
+                                  ('조건', 'A', OPEN + 10, 1, 'I', 102),
+                                  ('조건', 'B', OPEN + 20, 0, 'D', 190)])
+    assert replay_conditions(store) == [('A', 'I', '조건'), ('B', 'I', '조건'), ('A', 'D', '조건'),
+                                        ('A', 'I', '조건'), ('B', 'D', '조건')]
+    store.close()
+
+
+def test_replay_falls_back_to_tracked_stocks(tmp_path):
+    # 이벤트 기록이 없는 (예전) 파일은 첫 편입만
+    store = BarStore(str(tmp_path / 'bars.db'))
+    store.upsert_tracked_stocks([('조건', 'B', OPEN + 5), ('조건', 'A', OPEN)])
+    assert replay_conditions(store) == [('A', 'I', '조건'), ('B', 'I', '조건')]
+    store.close()
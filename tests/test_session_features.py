@@ -0,0 +1,59 @@
+import sqlite3
+
+import pytest
+
+from bar_store import BarStore, day_range, migrate_legacy_db
+from session_features import session_features, update_features
+
+DAY1 = day_range('20240715')[0]
+DAY2 = day_range('20240716')[0]
+
+
+def at(day, hhmm):
+    hour, minute = hhmm.split(':')
+    return day + int(hour) * 3600 + int(minute) * 60
+
+
+A = [('09:00', 100, 110, 95, 105, 10),
+     ('09:01', 105, 112, 104, 110, 20),
+     ('09:02', 110, 115, 108, 114, 10),
+     ('09:03', 114, 116, 100, 101, 10)]
+
+
+def test_features_from_hand_built_bars():
+    rows = [('A', at(DAY2, hhmm), *bar) for hhmm, *bar in A] + [('B', at(DAY2, '09:00'), 50, 52, 49, 51, None)]
+    a, b = session_features(rows, {'A': 100}, 60, DAY2)
+    typical = sum((h + l + c) / 3 * v for _, _, h, l, c, v in A) / 50
+    assert a[:16] == ('A', 60, DAY2, 4, 100, 0.0, 100, 105, 105, 110, 104, 2, 114, 116, 95, 50)
+    assert a[16] == pytest.approx(typical)
+    # 봉 하나, 거래량 없음, 전일 종가 없음
+    assert b == ('B', 60, DAY2, 1, None, None, 50, 51, None, None, None, 0, 51, 52, 49, 0, None)
+
+
+def test_update_features_reads_previous_close(tmp_path):
+    store = BarStore(str(tmp_path / 'bars.db'))
+    store.upsert_bars('A', 60, [(at(DAY1, '15:30'), 80, 80, 80, 80, 5)])
+    store.upsert_bars('A', 60, [(at(DAY2, hhmm), *bar) for hhmm, *bar in A])
+    store.upsert_bars('A', 60, [(at(DAY2, '10:00'), 200, 300, 50, 250, 99)])   # 첫 한 시간 밖
+    assert update_features(store, [('A', 60, DAY2)]) == 1
+    row = store.conn.execute('SELECT * FROM session_features').fetchone()
+    assert row[3:6] == (4, 80, pytest.approx(0.25))
+    assert row[13:16] == (116, 95, 50)
+    store.close()
+
+
+def test_migration_writes_features(tmp_path):
+    legacy = tmp_path / '20240716_조건.db'
+    conn = sqlite3.connect(legacy)
+    conn.execute('CREATE TABLE "1분_000001" (date TEXT, open INTEGER, high INTEGER, low INTEGER, close INTEGER, volume INTEGER)')
+    conn.executemany('INSERT INTO "1분_000001" VALUES (?, ?, ?, ?, ?, ?)',
+                     [(f'2024-07-16 {hhmm}:00', *bar) for hhmm, *bar in A])
+    conn.commit()
+    conn.close()
+
+    store = BarStore(str(tmp_path / 'bars.db'))
+    migrate_legacy_db(store, str(legacy))
+    features = store.fetch_session_features(60, DAY2, DAY2 + 86400)
+    assert features['symbol'].tolist() == ['000001']
+    assert features['bars'].tolist() == [4] and features['one_price'].tolist() == [114]
+    store.close()
@@ -0,0 +1,46 @@
+from bar_store import BarStore, day_range
+from store_writer import StoreWriter
+
+OPEN = day_range('20240715')[0] + 9 * 3600
+
+
+def test_bad_row_drops_only_its_kind(tmp_path):
+    path = str(tmp_path / 'bars.db')
+    writer = StoreWriter(path, flush_interval=0.01)
+    writer.start()
+    writer.put_bar('A', 60, OPEN, 100, 110, 90, 105, 10)
+    writer.put_tick('A', OPEN, 100, 5)
+    writer.put_tick('A', OPEN + 1, [101], 5)   # 바인딩할 수 없는 값 -> 체결 묶음만 실패
+    writer.put_condition_event('조건', 'A', OPEN, 'I', 100)
+    writer.close()
+
+    assert writer.dropped == 2
+    assert writer.written == 2
+    store = BarStore(path)
+    assert store.conn.execute('SELECT COUNT(*) FROM bars').fetchone()[0] == 1
+    assert store.conn.execute('SELECT COUNT(*) FROM ticks').fetchone()[0] == 0
+    assert store.conn.execute('SELECT COUNT(*) FROM condition_events').fetchone()[0] == 1
+    # 봉과 같은 트랜잭션에서 만든 특징도 남아 있다
+    assert store.conn.execute('SELECT COUNT(*) FROM session_features').fetchone()[0] == 1
+    store.close()
+
+
+def test_batch_is_retried_once(tmp_path):
+    path = str(tmp_path / 'bars.db')
+    writer = StoreWriter(path, flush_interval=0.01)
+    failures = []
+    original = writer._write
+
+    def flaky(store, batches):
+        if not failures:
+            failures.append(batches)
+            raise RuntimeError('database is locked')
+        original(store, batches)
+    writer._write = flaky
+    writer.start()
+    writer.put_bar('A', 60, OPEN, 100, 110, 90, 105, 10)
+    writer.put_tick('A', OPEN, 100, 5)
+    writer.close()
+
+    assert len(failures) == 1
+    assert writer.dropped == 0 and writer.written == 2 and writer.commits == 1
@@ -0,0 +1,32 @@
+from bar_store import BarStore, day_range
+from support_resistance import LevelBook
+
+DAY = day_range('20240715')[0]
+
+
+def minute_bars(closes, volume=100, first=0):
+    return [(DAY + 9 * 3600 + 60 * (first + i), c, c + 5, c - 5, c, volume) for i, c in enumerate(closes)]
+
+
+def profiles(book):
+    return {key: tracker.profile[tracker.profile > 1e-9].round(6).tolist() for key, tracker in book.trackers.items()}
+
+
+def test_incremental_update_matches_fresh_book(tmp_path):
+    store = BarStore(str(tmp_path / 'bars.db'))
+    store.upsert_bars('A', 60, minute_bars([100, 110, 120]))
+    book = LevelBook(timeframes=[60])
+    assert book.update(store) == 1
+
+    # 마지막 봉을 완성된 값으로 덮어쓰고 새 봉 추가, B 는 A 보다 늦게 과거 봉부터 백필
+    store.upsert_bars('A', 60, minute_bars([150, 160], volume=300, first=2))
+    store.upsert_bars('B', 60, minute_bars([200, 210, 220, 230]))
+    assert book.update(store) == 2
+    assert book.update(store) == 0
+
+    fresh = LevelBook(timeframes=[60])
+    fresh.update(store)
+    assert profiles(book) == profiles(fresh)
+    assert len(book.trackers[('A', 60)]) == 4
+    assert len(book.trackers[('B', 60)]) == 4
+    store.close()
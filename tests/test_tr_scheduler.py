@@ -0,0 +1,84 @@
+import pytest
+
+from tr_scheduler import (FakeClock, FakeTRBackend, TRScheduler, KIWOOM_LIMITS,
+                          PRIORITY_CONDITION, PRIORITY_BACKFILL)
+
+
+def make_scheduler(limits=KIWOOM_LIMITS, latency=0.0, pages=1):
+    clock = FakeClock()
+    backend = FakeTRBackend(clock, latency=latency, pages=pages)
+    return TRScheduler(backend, limits, clock=clock, sleep=clock.sleep), backend, clock
+
+
+def send_times(scheduler, backend, clock, count):
+    times = []
+    for i in range(count):
+        scheduler.request('opt10080', 종목코드=f'{i:06d}', next=0)
+        times.append(clock.now)
+    return times
+
+
+def test_per_second_limit():
+    scheduler, backend, clock = make_scheduler()
+    times = send_times(scheduler, backend, clock, 20)
+    assert times == [float(second) for second in range(4) for _ in range(5)]
+    # 어느 1초 구간에도 5회를 넘지 않는다
+    for first in range(len(times) - 5):
+        assert times[first + 5] - times[first] >= 1.0 - 1e-9
+
+
+def test_per_hour_limit():
+    scheduler, backend, clock = make_scheduler(limits=[(5, 1.0), (10, 3600.0)])
+    times = send_times(scheduler, backend, clock, 12)
+    assert times[:10] == [0.0] * 5 + [1.0] * 5
+    # 시간당 10회를 다 쓰면 첫 요청 뒤 한 시간이 지나야 다시 보낸다
+    assert times[10:] == [3600.0] * 2
+    assert scheduler.stats()['usage']['10/3600s'] == pytest.approx(0.7)   # 1초에 보낸 5개 + 새로 보낸 2개
+
+
+def test_priority_order_and_coalescing():
+    scheduler, backend, clock = make_scheduler()
+    done = []
+    for code in ['000001', '000002', '000003']:
+        queued = scheduler.submit('opt10080', PRIORITY_BACKFILL,
+                                  lambda request: done.append(request.params['종목코드']), 종목코드=code, next=0)
+    urgent = scheduler.submit('opt10080', PRIORITY_CONDITION, 종목코드='000009', next=0)
+    # 대기 중인 백필 요청과 같은 요청 -> 합쳐지고 우선순위가 올라감
+    merged = scheduler.submit('opt10080', PRIORITY_CONDITION, lambda request: done.append('merged'),
+                              종목코드='000003', next=0)
+    assert scheduler.stats()['queued'] == 4
+    scheduler.run_all()
+
+    # 우선순위가 같으면 먼저 들어온 요청부터
+    assert [params['종목코드'] for _, params in backend.calls] == ['000003', '000009', '000001', '000002']
+    assert merged is queued and merged.done and urgent.done
+    assert done == ['000003', 'merged', '000001', '000002']
+    stats = scheduler.stats()
+    assert stats['issued'] == 4 and stats['coalesced'] == 1 and stats['queued'] == 0 and stats['errors'] == 0
+
+
+def test_continuation_chain_is_not_interleaved():
+    scheduler, backend, clock = make_scheduler(pages=3)
+    chain = scheduler.submit('opt10080', PRIORITY_BACKFILL, more=lambda pages: True, 종목코드='000001')
+    scheduler.submit('opt10080', PRIORITY_BACKFILL, more=lambda pages: len(pages) < 2, 종목코드='000002')
+    scheduler.run_next()
+    # 연속 조회 도중에 더 급한 요청이 들어와도 이미 보낸 묶음은 끝까지 이어서 보낸다
+    scheduler.submit('opt10080', PRIORITY_CONDITION, 종목코드='000009', next=0)
+    scheduler.run_all()
+
+    calls = [(params['종목코드'], params['next']) for _, params in backend.calls]
+    assert calls == [('000001', 0), ('000001', 2), ('000001', 2), ('000009', 0), ('000002', 0), ('000002', 2)]
+    assert len(chain.result) == 3
+
+
+def test_error_is_counted_and_raised():
+    scheduler, backend, clock = make_scheduler()
+
+    def fail(tr_code, **params):
+        raise RuntimeError('TR 실패')
+    backend.block_request = fail
+    with pytest.raises(RuntimeError):
+        scheduler.request('opt10080', 종목코드='000001', next=0)
+    stats = scheduler.stats()
+    assert stats['errors'] == 1 and stats['issued'] == 1
+    assert stats['usage']['5/1s'] == pytest.approx(0.2)
@@ -0,0 +1,222 @@
+import heapq
+import itertools
+import time
+from collections import deque
+import pandas as pd
+
+# 키움 TR 조회 제한: (요청 수, 초) — 1초 5회, 1분 100회, 1시간 1000회
+KIWOOM_LIMITS = [(5, 1.0), (100, 60.0), (1000, 3600.0)]
+# 조건검색 (SendCondition) 제한: 1초 1회, 같은 조건식은 1분에 1회
+CONDITION_LIMITS = [(1, 1.0)]
+CONDITION_REPEAT_SEC = 60.0
+
+# 숫자가 작을수록 먼저 처리
+PRIORITY_CONDITION = 0   # 실시간 조건검색 편입 종목
+PRIORITY_LIVE = 5
+PRIORITY_BACKFILL = 10   # 과거 데이터 채우기
+
+
+class TokenBucket:
+    # capacity 개 토큰, 쓴 토큰은 정확히 period 초 뒤에 돌아온다 (쓴 시각을 기억)
+    # 조금씩 계속 채우는 방식은 가득 찬 상태에서 몰아 보낸 직후에도 채워진 만큼 더 보내서
+    # 어떤 period 초 구간에서는 capacity 를 넘는다 (키움 제한은 구간마다 세므로 넘으면 안 됨)
+    def __init__(self, capacity, period, now):
+        self.capacity = capacity
+        self.period = period
+        self.spent = deque()
+        self.tokens = capacity
+
+    def refill(self, now):
+        while self.spent and self.spent[0] + self.period <= now:
+            self.spent.popleft()
+        self.tokens = self.capacity - len(self.spent)
+
+    def wait_time(self, now):
+        self.refill(now)
+        return 0.0 if self.tokens >= 1 else self.spent[0] + self.period - now
+
+    def take(self, now):
+        self.refill(now)
+        self.spent.append(now)
+        self.tokens -= 1
+
+
+class TRRequest:
+    # more 가 있으면 연속 조회 한 묶음: next=0 페이지부터 next=2 페이지를 이어서 받고 result 는 페이지 목록
+    def __init__(self, seq, priority, tr_code, params, key, more=None):
+        self.seq = seq
+        self.priority = priority
+        self.tr_code = tr_code
+        self.params = params
+        self.key = key
+        self.more = more
+        self.callbacks = []
+        self.done = False
+        self.result = None
+        self.error = None
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class FakeClock:
+    # 오프라인 테스트용 시계: sleep 하면 시간만 넘어간다
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(0.0, seconds)
+
+
+class FakeTRBackend:
+    # pykiwoom Kiwoom.block_request 흉내, 호출 기록과 지연 시간만 흉내낸다
+    def __init__(self, clock=None, latency=0.05, pages=1):
+        self.clock = clock
+        self.latency = latency
+        self.pages = pages
+        self.calls = []
+        self.tr_remained = False
+        self._page = 0
+
+    def block_request(self, tr_code, **params):
+        self.calls.append((tr_code, params))
+        if self.clock is not None:
+            self.clock.sleep(self.latency)
+        self._page = 0 if params.get('next', 0) == 0 else self._page + 1
+        self.tr_remained = self._page + 1 < self.pages
+        return pd.DataFrame({'체결시간': [], '현재가': [], '시가': [], '고가': [], '저가': [], '거래량': []})
+
+
+class TRScheduler:
+    # 모든 TR 요청을 우선순위 큐에 모으고, 각 시간 창의 토큰 버킷에 토큰이 있을 때만 보낸다.
+    # 대기 중인 요청과 같은 TR/입력값이면 새로 보내지 않고 합친다 (더 급한 쪽 우선순위로).
+    # 연속 조회 (next=2) 는 한 요청으로 묶어서 끝까지 이어 보낸다: 페이지 사이에 다른 요청이 끼거나
+    # 순서가 바뀌면 키움 연속 조회 상태가 깨지므로, 우선순위는 묶음 단위로만 적용된다.
+
+    def __init__(self, backend, limits=KIWOOM_LIMITS, clock=time.monotonic, sleep=time.sleep):
+        self.backend = backend
+        self.clock = clock
+        self.sleep = sleep
+        now = clock()
+        self.buckets = [TokenBucket(capacity, period, now) for capacity, period in limits]
+        self.queue = []
+        self.pending = {}
+        self._seq = itertools.count()
+
+        # 통계
+        self.issued = 0
+        self.coalesced = 0
+        self.waited = 0.0
+        self.errors = 0
+
+    def submit(self, tr_code, priority=PRIORITY_BACKFILL, callback=None, more=None, **params):
+        # more(pages) -> 다음 페이지를 더 받을지 (연속 조회 묶음일 때만, params 에 next 는 넣지 않는다)
+        # 합쳐진 연속 조회는 먼저 들어온 요청의 more 로 받는다
+        key = (tr_code, tuple(sorted(params.items())), more is not None)
+        request = self.pending.get(key)
+        if request is not None:
+            self.coalesced += 1
+            if priority < request.priority:
+                # 더 급한 요청이 합쳐지면 우선순위를 올린다
+                request.priority = priority
+                heapq.heapify(self.queue)
+        else:
+            request = TRRequest(next(self._seq), priority, tr_code, params, key, more)
+            self.pending[key] = request
+            heapq.heappush(self.queue, request)
+        if callback is not None:
+            request.callbacks.append(callback)
+        return request
+
+    def wait_time(self):
+        # 지금 보내려면 기다려야 하는 시간 (0 이면 바로 보낼 수 있음)
+        now = self.clock()
+        return max(bucket.wait_time(now) for bucket in self.buckets)
+
+    def take(self):
+        # 요청 하나를 보냈다고 기록 (wait_time() 이 0 일 때 부른다)
+        now = self.clock()
+        for bucket in self.buckets:
+            bucket.take(now)
+        self.issued += 1
+
+    def acquire(self):
+        wait = self.wait_time()
+        while wait > 0:
+            self.waited += wait
+            self.sleep(wait)
+            wait = self.wait_time()
+        self.take()
+
+    def _send(self, tr_code, params):
+        self.acquire()
+        return self.backend.block_request(tr_code, **params)
+
+    def run_next(self):
+        if not self.queue:
+            return None
+        request = heapq.heappop(self.queue)
+        del self.pending[request.key]
+        try:
+            if request.more is None:
+                request.result = self._send(request.tr_code, request.params)
+            else:
+                pages = [self._send(request.tr_code, dict(request.params, next=0))]
+                while self.backend.tr_remained and request.more(pages):
+                    pages.append(self._send(request.tr_code, dict(request.params, next=2)))
+                request.result = pages
+        except Exception as e:
+            self.errors += 1
+            request.error = e
+        request.done = True
+        for callback in request.callbacks:
+            callback(request)
+        return request
+
+    def run_all(self):
+        while self.queue:
+            self.run_next()
+
+    def request(self, tr_code, priority=PRIORITY_BACKFILL, more=None, **params):
+        # 동기 호출: 이 요청보다 급한 요청을 먼저 처리하고 결과를 돌려준다
+        request = self.submit(tr_code, priority, more=more, **params)
+        while not request.done:
+            self.run_next()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def stats(self):
+        now = self.clock()
+        windows = {}
+        for bucket in self.buckets:
+            bucket.refill(now)
+            windows[f'{bucket.capacity}/{bucket.period:g}s'] = round(1 - bucket.tokens / bucket.capacity, 3)
+        return {
+            'issued': self.issued,
+            'coalesced': self.coalesced,
+            'queued': len(self.queue),
+            'waited_sec': round(self.waited, 2),
+            'errors': self.errors,
+            'usage': windows,  # 시간 창별 사용률 (1 이면 제한에 닿음)
+        }
+
+
+if __name__ == "__main__":
+    # 57종목 x 4타임프레임 백필 (종목마다 연속 조회 3페이지) 을 가짜 시계/가짜 TR 로 돌려서 걸리는 시간을 비교
+    clock = FakeClock()
+    backend = FakeTRBackend(clock, pages=3)
+    scheduler = TRScheduler(backend, clock=clock, sleep=clock.sleep)
+    codes = [f'{i:06d}' for i in range(57)]
+    every_page = lambda pages: True
+    for tick_range in [1, 3, 5, 30]:
+        for code in codes:
+            scheduler.submit('opt10080', more=every_page, 종목코드=code, 틱범위=tick_range, output='주식분봉차트조회')
+    # 조건검색 편입 종목은 뒤에 들어와도 먼저 처리, 같은 요청은 합쳐짐
+    scheduler.submit('opt10080', PRIORITY_CONDITION, more=every_page, 종목코드=codes[-1], 틱범위=1, output='주식분봉차트조회')
+    scheduler.run_all()
+    print(f"token bucket: {clock.now:.1f}s simulated, first request {backend.calls[0][1]['종목코드']}, stats={scheduler.stats()}")
+    print(f"fixed 1s sleep: {len(backend.calls) * (1 + backend.latency):.1f}s simulated")
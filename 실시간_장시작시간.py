@@ -1,12 +1,12 @@
-from PyQt5.QAxContainer import QAxWidget
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtCore import QEventLoop
 import sys
+from market_data import create_ocx
 
 class KiwoomAPI:
     def __init__(self):
         self.app = QApplication(sys.argv)
-        self.ocx = QAxWidget("KHOPENAPI.KHOpenAPICtrl.1")
+        self.ocx = create_ocx()
         self.ocx.OnEventConnect.connect(self._event_connect)
         self.ocx.OnReceiveRealData.connect(self._receive_real_data)
         self.login_event_loop = QEventLoop()
@@ -1,14 +1,18 @@
 import sys
 from PyQt5.QtWidgets import *
-from PyQt5.QAxContainer import *
 from PyQt5.QtCore import QTimer
-import datetime
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-import sqlite3
+import time
+from bar_store import hhmmss_to_epoch, kst_day_start
+from bar_aggregator import BarAggregator, TIMEFRAMES
+from store_writer import StoreWriter
+from ring_buffer import PriceHistory, DEFAULT_CAPACITY
+from market_data import create_ocx
+from real_data import RealDataDecoder
+from subscription import SubscriptionManager
+from live_chart import LiveChartGrid
 
 class MyWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, history_capacity=DEFAULT_CAPACITY, grid_rows=4, grid_cols=5):
         super().__init__()
         self.setWindowTitle("Real")
         self.setGeometry(300, 300, 800, 600)
@@ -17,9 +21,12 @@ class MyWindow(QMainWindow):
         self.setCentralWidget(self.central_widget)
         self.layout = QVBoxLayout(self.central_widget)
 
-        # Initialize SQLite connection and cursor
-        self.conn = sqlite3.connect('실시간db.db')
-        self.cur = self.conn.cursor()
+        # 모든 종목의 봉을 하나의 bars 테이블에 저장 (백그라운드 스레드에서 묶어서 commit)
+        self.writer = StoreWriter()
+        self.writer.start()
+
+        # 체결 시간 기준 1/3/5/30분봉, 구간이 끝나면 save_bar_to_db 로 한 번씩 전달
+        self.aggregator = BarAggregator(TIMEFRAMES, on_bar=self.save_bar_to_db)
 
         # 종목 코드 리스트
         self.stock_codes = [
@@ -29,38 +36,39 @@ class MyWindow(QMainWindow):
             "220100", "018290"
         ]  # 삼성전자, SK하이닉스, NAVER 예시
 
-        # Matplotlib Figure와 Canvas 설정
-        self.figures = {}
-        self.axes = {}
-        self.canvases = {}
-        self.data = {code: [] for code in self.stock_codes}
-
-        for code in self.stock_codes:
-            fig, ax = plt.subplots()
-            canvas = FigureCanvas(fig)
-            self.layout.addWidget(canvas)
-
-            self.figures[code] = fig
-            self.axes[code] = ax
-            self.canvases[code] = canvas
-
-            ax.set_title(f"Stock Code: {code}")
-            ax.set_xlabel("Time")
-            ax.set_ylabel("Price")
-
-        # 타이머 설정 (3분마다 갱신)
+        # 종목별 고정 크기 체결 이력 (세션 내내 메모리 일정)
+        self.data = PriceHistory(history_capacity)
+        self.day_start = kst_day_start(time.time())
+
+        # 하나의 Figure 에 rows x cols 격자로 페이지 단위 차트 (바뀐 종목만 blit)
+        self.charts = LiveChartGrid(self.data, rows=grid_rows, cols=grid_cols)
+        self.charts.set_codes(self.stock_codes)
+        self.layout.addWidget(self.charts.canvas)
+
+        page_layout = QHBoxLayout()
+        prev_button = QPushButton("◀")
+        next_button = QPushButton("▶")
+        self.page_label = QLabel()
+        prev_button.clicked.connect(lambda: self.change_page(-1))
+        next_button.clicked.connect(lambda: self.change_page(1))
+        page_layout.addWidget(prev_button)
+        page_layout.addWidget(self.page_label)
+        page_layout.addWidget(next_button)
+        self.layout.addLayout(page_layout)
+        self.change_page(0)
+
+        # 타이머 설정 (0.5초마다, 새 체결이 있는 종목만 다시 그림)
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_charts)
-        self.timer.start(180000)  # 3 minutes in milliseconds
+        self.timer.start(500)
 
-        self.ocx = QAxWidget("KHOPENAPI.KHOpenAPICtrl.1")
+        self.ocx = create_ocx()
+        self.decoder = RealDataDecoder()
+        self.subscriptions = SubscriptionManager(self.ocx)
         self.ocx.OnEventConnect.connect(self._handler_login)
         self.ocx.OnReceiveRealData.connect(self._handler_real_data)
         self.CommmConnect()
 
-        # Create tables for each stock code in SQLite
-        self.create_tables()
-
     def CommmConnect(self):
         self.ocx.dynamicCall("CommConnect()")
         self.statusBar().showMessage("login 중 ...")
@@ -69,81 +77,47 @@ class MyWindow(QMainWindow):
         if err_code == 0:
             self.statusBar().showMessage("login 완료")
             # 구독 시작 (로그인 후에 설정)
-            self.SetRealReg("1000", ";".join(self.stock_codes), "20;10", 0)
+            self.subscriptions.subscribe(self.stock_codes, 'recorder')
+            self.subscriptions.apply()
         else:
             self.statusBar().showMessage(f"login 실패: {err_code}")
 
     def _handler_real_data(self, code, real_type, data):
-        print(f"Received real data: {code}, {real_type}, {data}")
         if real_type == "주식체결":
-            # 체결 시간
-            time_str = self.GetCommRealData(code, 20).strip()
-            date = datetime.datetime.now().strftime("%Y-%m-%d ")
+            # 체결 시간/현재가/체결량을 패킷에서 한 번에 읽는다
+            trade = self.decoder.trade(data)
+            if trade is None:
+                print(f"Invalid real data for {code}: {data}")
+                return  # 유효하지 않은 데이터는 무시
             try:
-                time = datetime.datetime.strptime(date + time_str, "%Y-%m-%d %H%M%S")
-
-                # 현재가
-                price_str = self.GetCommRealData(code, 10).strip()
-                price = int(price_str.replace('+', '').replace('-', '').replace(',', ''))
-
-                # 가격이 숫자인지 확인하고 변환
-                if isinstance(price, int):
-                    price = int(price)
-                else:
-                    print(f"Invalid price data for {code}: {price}")
-                    return  # 유효하지 않은 데이터는 무시
+                day_start = kst_day_start(time.time())
+                if day_start != self.day_start:
+                    # 자정을 넘겨 계속 켜 두면 다음 날 체결을 전날에 붙이지 않도록
+                    self.day_start = day_start
+                    self.aggregator.new_day()
+                ts = hhmmss_to_epoch(trade.time, self.day_start)
 
                 # 데이터 추가
-                self.data[code].append((time, price))
-
-                # Check if 3 minutes have passed
-                if len(self.data[code]) >= 3:
-                    self.save_data_to_db(code, self.data[code])
+                self.data.append(code, ts * 1000, trade.price, trade.volume)
+                self.writer.put_tick(code, ts, trade.price, trade.volume)
+                self.aggregator.add_tick(code, ts, trade.price, trade.volume)
 
             except Exception as e:
                 print(f"Error parsing data for {code}: {e}")
 
 
-    def save_data_to_db(self, code, data):
-        try:
-            table_name = f"stock_{code}"
-            
-            # Compute OHLC values
-            if data:
-                times, prices = zip(*data)
-                open_price = prices[0]
-                high_price = max(prices)
-                low_price = min(prices)
-                close_price = prices[-1]
-
-                # Save OHLC data to database
-                self.cur.execute(f'''
-                    INSERT OR REPLACE INTO {table_name} (time, open, high, low, close)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (times[0].strftime("%Y-%m-%d %H:%M:%S"), open_price, high_price, low_price, close_price))
-                self.conn.commit()
-                print(f"Saved OHLC data to {table_name} table: {times[0]}, {open_price}, {high_price}, {low_price}, {close_price}")
-
-                # Clear data list after saving OHLC
-                data.clear()
-
-        except Exception as e:
-            print(f"Error saving data to {table_name} table: {e}")
+    def save_bar_to_db(self, code, timeframe, ts, open_price, high_price, low_price, close_price, volume):
+        self.writer.put_bar(code, timeframe, ts, open_price, high_price, low_price, close_price, volume)
+        print(f"Saved {timeframe // 60}분 bar for {code}: {ts}, {open_price}, {high_price}, {low_price}, {close_price}, {volume}")
 
 
     def update_charts(self):
-        for code in self.stock_codes:
-            ax = self.axes[code]
-            ax.clear()
-            ax.set_title(f"Stock Code: {code}")
-            ax.set_xlabel("Time")
-            ax.set_ylabel("Price")
-
-            if self.data[code]:
-                times, prices = zip(*self.data[code])
-                ax.plot(times, prices, 'b-')
+        self.charts.refresh()
 
-            self.canvases[code].draw()
+    def change_page(self, step):
+        if step:
+            self.charts.set_page(self.charts.page + step)
+        self.page_label.setText(f"{self.charts.page + 1} / {self.charts.page_count()}")
 
     def SetRealReg(self, screen_no, code_list, fid_list, real_type):
         print(f"Setting real reg: {screen_no}, {code_list}, {fid_list}, {real_type}")
@@ -155,28 +129,12 @@ class MyWindow(QMainWindow):
         self.ocx.dynamicCall("DisConnectRealData(QString)", screen_no)
 
     def GetCommRealData(self, code, fid):
-        data = self.ocx.dynamicCall("GetCommRealData(QString, int)", code, fid) 
-        print(f"GetCommRealData: {code}, {fid} -> {data}")
-        return data
-
-    def create_tables(self):
-        # Create tables for each stock code in SQLite database
-        for code in self.stock_codes:
-            table_name = f"stock_{code}"
-            self.cur.execute(f'''
-                CREATE TABLE IF NOT EXISTS {table_name} (
-                    time TEXT PRIMARY KEY,
-                    open INTEGER,
-                    high INTEGER,
-                    low INTEGER,
-                    close INTEGER
-                )
-            ''')
-        self.conn.commit()
+        return self.ocx.dynamicCall("GetCommRealData(QString, int)", code, fid)
 
     def closeEvent(self, event):
-        self.DisConnectRealData("1000")
-        self.conn.close()  # Close SQLite connection
+        self.subscriptions.close()
+        self.aggregator.flush()  # 아직 끝나지 않은 구간의 봉도 저장
+        self.writer.close()  # 남은 데이터 commit 후 SQLite 연결 종료
         event.accept()
 
 if __name__ == "__main__":
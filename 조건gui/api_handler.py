@@ -1,20 +1,72 @@
-from PyQt5.QAxContainer import QAxWidget
+import os
+import sys
+import threading
+import time
+from collections import deque
 from datetime import datetime
-from PyQt5.QtWidgets import QTableWidgetItem
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bar_store import BAR_STORE_PATH, hhmmss_to_epoch, kst_day_start
+from ring_buffer import PriceHistory
+from market_data import create_ocx
+from real_data import RealDataDecoder
+from event_pipeline import EventPipeline
+from store_writer import StoreWriter
+from subscription import SubscriptionManager
+from bar_aggregator import BarAggregator, TIMEFRAMES
+from tr_scheduler import TRScheduler, CONDITION_LIMITS, CONDITION_REPEAT_SEC
+
+# 조건식마다 다른 화면번호 (키움 실시간 조건검색은 동시에 최대 10개)
+CONDITION_SCREENS = [str(screen) for screen in range(100, 110)]
 
 
 class APIHandler():
-    def __init__(self, parent):
+    # OCX 콜백은 이벤트를 파이프라인에 넘기기만 하고, 해석/저장은 워커 스레드에서 한다.
+    # 화면 (테이블/로그) 은 GUI 타이머가 refresh_view 로 스냅샷을 가져가서 갱신한다.
+    def __init__(self, parent, history_capacity=100, workers=2, store_path=BAR_STORE_PATH, record=False):
         self.parent = parent
-        self.ocx = QAxWidget("KHOPENAPI.KHOpenAPICtrl.1")
+        self.ocx = create_ocx()
+        self.decoder = RealDataDecoder()
+        # 편입 종목 실시간 시세 구독 (화면번호 분산, 조건식별 참조 카운트)
+        self.subscriptions = SubscriptionManager(self.ocx)
         self.ocx.OnEventConnect.connect(self._handler_login)
         self.ocx.OnReceiveConditionVer.connect(self._handler_condition_load)
         self.ocx.OnReceiveRealCondition.connect(self._handler_real_condition)
+        self.ocx.OnReceiveTrCondition.connect(self._handler_tr_condition)
         self.ocx.OnReceiveRealData.connect(self._receive_real_data)
 
-        self.tracked_stocks = {}
-        self.current_condition_name = ""
-        self.data = {}
+        self.tracked_stocks = {}  # (cond_name, code) -> 첫 편입 정보
+        self.tracked_order = []   # 편입 순서 (GUI 는 마지막으로 본 위치 이후만 가져감)
+        self.tracked_lock = threading.Lock()  # 워커 <-> GUI 스냅샷
+        self.active = {}          # code -> 지금 만족 중인 조건식 frozenset (바뀔 때마다 새로 만들어 교체)
+        self.quotes = {}          # code -> (현재가, 등락율), 워커가 덮어씀
+        self.pending_prices = {}  # code -> [(cond_name, ts, seq)] 가격 없이 기록한 편입, 첫 체결가로 채움
+        self.conditions = {}      # 실행 중인 (보낼 차례를 기다리는 것 포함) 조건식 cond_name -> (screen, cond_index)
+        # SendCondition 은 조회 제한 안에서 poll (메인 스레드 타이머) 이 하나씩 보낸다
+        self.condition_queue = deque()
+        self.condition_limiter = TRScheduler(None, CONDITION_LIMITS)
+        self.condition_sent = {}  # cond_name -> 마지막으로 보낸 시각 (같은 조건식 1분 제한)
+        # 종목별 최근 체결 이력 (고정 크기 링버퍼, 종목별로 한 워커만 씀)
+        self.data = PriceHistory(history_capacity)
+        self.day_start = kst_day_start(time.time())   # 체결 시간 (HHMMSS) 을 붙일 날짜, 받은 시각 기준으로 갱신
+
+        # 편입/이탈 이벤트는 바로 bars.db 에 기록 (배치 commit, 프로그램이 죽어도 남음)
+        self.writer = StoreWriter(store_path)
+        self.writer.start()
+
+        # record=True 면 구독 종목의 체결과 1/3/5/30분봉도 저장 (헤드리스 기록기)
+        # BarAggregator 는 스레드 하나에서만 쓰도록 워커를 1개로
+        self.aggregator = None
+        if record:
+            self.aggregator = BarAggregator(TIMEFRAMES, on_bar=self.writer.put_bar)
+            workers = 1
+        self.on_market_status = None   # 장운영구분 (FID 215) 을 받을 함수
+
+        self.pipeline = EventPipeline({
+            'condition': self._process_real_condition,
+            'trade': self._process_real_data,
+        }, workers=workers)
+        self.pipeline.start()
 
     def CommConnect(self):
         print("Attempting to connect...")
@@ -32,47 +84,163 @@ class APIHandler():
         print(f"Condition load handler called with ret: {ret}, msg: {msg}")
         self.parent.status_bar.showMessage(f"Condition Load - ret: {ret}, msg: {msg}")
 
+    def _current_price(self, code):
+        # OCX 가 가진 그 종목의 마지막 체결가 (실시간 등록 전이면 빈 문자열 -> None), 메인 스레드에서만 호출
+        value = self.GetCommRealData(code, 10).strip()
+        try:
+            return abs(int(value)) if value else None
+        except ValueError:
+            return None
+
     def _handler_real_condition(self, code, type, cond_name, cond_index):
-        print(f"Real condition handler called with code: {code}, type: {type}, cond_name: {cond_name}, cond_index: {cond_index}")
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # 콜백에서는 받은 시각과 그 시점 현재가만 붙여서 넘긴다
+        self.pipeline.put('condition', code, code, type, cond_name, time.time(), self._current_price(code))
+
+    def _handler_tr_condition(self, screen, code_list, cond_name, cond_index, next):
+        # SendCondition 직후 지금 조건을 만족하는 종목 목록 -> 편입(I) 으로 처리
+        received_at = time.time()
+        for code in code_list.split(';'):
+            if code:
+                self.pipeline.put('condition', code, code, 'I', cond_name, received_at, self._current_price(code))
+
+    def _process_real_condition(self, code, type, cond_name, received_at, price):
+        with self.tracked_lock:
+            previous = self.active.get(code, frozenset())
+            current = previous | {cond_name} if type == 'I' else previous - {cond_name}
+            if current == previous:
+                return  # 이미 편입된 종목의 편입 (TR 목록 + 실시간 중복), 편입되지 않은 종목의 이탈
+            if current:
+                self.active[code] = current
+            else:
+                self.active.pop(code, None)
+
+        ts = int(received_at)
+        seq = self.writer.put_condition_event(cond_name, code, ts, type, price)
+        if type == 'I' and price is None:
+            # 아직 실시간 등록 전인 종목: 구독 후 첫 체결가로 채운다 (같은 종목은 같은 워커가 처리)
+            self.pending_prices.setdefault(code, []).append((cond_name, ts, seq))
+        elif type == 'D':
+            pending = [item for item in self.pending_prices.pop(code, ()) if item[0] != cond_name]
+            if pending:
+                self.pending_prices[code] = pending
+        # 구독 변경은 요청만 쌓고 refresh_view (메인 스레드) 에서 한 번에 반영
         if type == 'I':
-            if code not in self.tracked_stocks:
-                self.tracked_stocks[code] = {'first_seen': current_time, 'cond_name': cond_name}
-                print(f"Inserted: {current_time} - {cond_name} {code} {type}")
-                self.update_table_widget()
-        self.print_tracked_stocks()
+            self.subscriptions.subscribe([code], cond_name)
+        elif type == 'D':
+            self.subscriptions.unsubscribe([code], cond_name)
+        if type == 'I':
+            first_seen = datetime.fromtimestamp(received_at).strftime('%Y-%m-%d %H:%M:%S')
+            key = (cond_name, code)
+            with self.tracked_lock:
+                if key in self.tracked_stocks:
+                    return
+                self.tracked_stocks[key] = {'code': code, 'first_seen': first_seen, 'cond_name': cond_name, 'seen_at': received_at}
+                self.tracked_order.append(key)
+            self.writer.put_tracked_stock(cond_name, code, int(received_at))
+            print(f"Inserted: {first_seen} - {cond_name} {code} {type}")
 
     def _handler_real_data(self, code, real_type, data):
-        print(f"Received real data: {code}, {real_type}, {data}")
         if real_type == "주식체결":
-            # 체결 시간
-            time_str = self.GetCommRealData(code, 20).strip()
-            date = datetime.datetime.now().strftime("%Y-%m-%d ")
-            try:
-                time = datetime.datetime.strptime(date + time_str, "%Y-%m-%d %H%M%S")
+            self.pipeline.put('trade', code, code, data, time.time())
+
+    def _process_real_data(self, code, data, received_at):
+        # 체결 시간/현재가를 패킷에서 한 번에 읽는다
+        trade = self.decoder.trade(data)
+        if trade is None:
+            print(f"Invalid real data for {code}: {data}")
+            return  # 유효하지 않은 데이터는 무시
+        day_start = kst_day_start(received_at)
+        if day_start != self.day_start:
+            # 다음 날 세션: 전날 봉을 마저 내보내고 새 날짜 기준으로 (데몬은 여러 날 계속 실행됨)
+            self.day_start = day_start
+            if self.aggregator is not None:
+                self.aggregator.new_day()
+        ts = hhmmss_to_epoch(trade.time, self.day_start)
 
-                # 현재가
-                price_str = self.GetCommRealData(code, 10).strip()
-                price = int(price_str.replace('+', '').replace('-', '').replace(',', ''))
+        # 데이터 추가 (history_capacity 를 넘으면 오래된 것부터 덮어씀)
+        self.data.append(code, ts * 1000, trade.price, trade.volume)
+        self.quotes[code] = (trade.price, trade.rate)
+        pending = self.pending_prices.pop(code, None)
+        if pending:
+            for cond_name, event_ts, seq in pending:
+                self.writer.put_condition_event(cond_name, code, event_ts, 'I', trade.price, seq)
+        if self.aggregator is not None:
+            self.writer.put_tick(code, ts, trade.price, trade.volume)
+            self.aggregator.add_tick(code, ts, trade.price, trade.volume)
 
-                print("code : ", code, "price : ", price)
+    def snapshot_tracked_stocks(self):
+        with self.tracked_lock:
+            return {key: dict(info) for key, info in self.tracked_stocks.items()}
 
+    def new_tracked_since(self, start):
+        # start 번째 이후에 편입된 종목만 [info]
+        with self.tracked_lock:
+            return [dict(self.tracked_stocks[key]) for key in self.tracked_order[start:]]
 
-                # 가격이 숫자인지 확인하고 변환
-                if isinstance(price, int):
-                    price = int(price)
-                else:
-                    print(f"Invalid price data for {code}: {price}")
-                    return  # 유효하지 않은 데이터는 무시
+    def conditions_of(self, code):
+        # 이 종목이 지금 만족하는 조건식들
+        return self.active.get(code, frozenset())
 
-                # # 데이터 추가
-                self.data[code].append((time, price))
-                if len(self.data[code]) > 100:  # 데이터 포인트가 100개를 넘으면 오래된 것부터 제거
-                    self.data[code].pop(0)
+    def poll(self):
+        # Qt 메인 스레드 타이머에서 호출: 워커가 쌓은 구독 변경을 OCX 에 반영, 기다리는 조건식 전송
+        self.subscriptions.apply()
+        self.send_queued_conditions()
 
-            except Exception as e:
-                print(f"Error parsing data for {code}: {e}")
+    def send_queued_conditions(self):
+        # 조회 제한에 걸리지 않는 만큼만 보낸다 (기다리지 않음). 1분 안에 다시 켠 조건식은 뒤로 미룬다
+        now = time.monotonic()
+        for _ in range(len(self.condition_queue)):
+            if self.condition_limiter.wait_time() > 0:
+                return
+            cond_name = self.condition_queue.popleft()
+            if now - self.condition_sent.get(cond_name, -CONDITION_REPEAT_SEC) < CONDITION_REPEAT_SEC:
+                self.condition_queue.append(cond_name)
+                continue
+            screen, cond_index = self.conditions[cond_name]
+            self.condition_limiter.take()
+            self.condition_sent[cond_name] = now
+            if self.SendCondition(screen, cond_name, cond_index, 1) != 1:
+                del self.conditions[cond_name]
 
+    def status(self):
+        with self.tracked_lock:
+            tracked = len(self.tracked_stocks)
+        return {
+            'conditions': {name: screen for name, (screen, _) in self.conditions.items()},
+            'tracked': tracked,
+            'active_codes': len(self.active),
+            'pipeline': self.pipeline.stats(),
+            'subscriptions': self.subscriptions.stats(),
+            'writer': {'written': self.writer.written, 'commits': self.writer.commits, 'dropped': self.writer.dropped},
+            'late_ticks': self.aggregator.late if self.aggregator is not None else 0,
+        }
+
+    def refresh_view(self):
+        # GUI 타이머에서 호출 (초당 최대 max_repaints 번): 구독 반영, 새 행 추가 + 바뀐 칸만 갱신
+        self.poll()
+        stats = self.pipeline.stats()
+        message = f"events {stats['processed']}/{stats['received']}, queued {stats['queued']}, dropped {stats['dropped']}"
+        if self.pipeline.pressure() > 0.8:
+            message += " (처리 지연)"
+        self.parent.pipeline_label.setText(message)
+
+        model = self.parent.tracked_model
+        added = self.new_tracked_since(model.rowCount())
+        model.append_rows(added)
+        model.update_live(self.quotes.copy(), self.active.copy())
+        self.print_tracked_stocks(added, model.rowCount())
+
+    def close(self):
+        self.stop_all_conditions()
+        self.subscriptions.close()
+        self.pipeline.stop()
+        print(f"EventPipeline closed: {self.pipeline.stats()}")
+        if self.aggregator is not None:
+            self.aggregator.flush()  # 아직 끝나지 않은 구간의 봉도 저장
+        self.writer.close()
+
+    def GetCommRealData(self, code, fid):
+        return self.ocx.dynamicCall("GetCommRealData(QString, int)", code, fid)
 
     def GetConditionLoad(self):
         print("Loading conditions...")
@@ -81,50 +249,95 @@ class APIHandler():
     def GetConditionNameList(self):
         print("Getting condition name list...")
         data = self.ocx.dynamicCall("GetConditionNameList()")
-        conditions = data.split(";")[:-1]
-        for condition in conditions:
+        conditions = []
+        for condition in data.split(";")[:-1]:
             index, name = condition.split('^')
             print(index, name)
+            conditions.append((int(index), name))
+        return conditions
 
     def SendCondition(self, screen, cond_name, cond_index, search):
         print(f"Sending condition: screen={screen}, cond_name={cond_name}, cond_index={cond_index}, search={search}")
-        self.current_condition_name = cond_name  # Save the current condition name for database filename
         ret = self.ocx.dynamicCall("SendCondition(QString, QString, int, int)", screen, cond_name, cond_index, search)
         if ret == 1:
             self.parent.status_bar.showMessage(f"Condition {cond_name} sent successfully")
-            self.parent.db.setup_database(self.current_condition_name)
+            self.parent.db.setup_database(cond_name)
         else:
             self.parent.status_bar.showMessage(f"Failed to send condition {cond_name}")
+        return ret
 
     def SendConditionStop(self, screen, cond_name, cond_index):
         print(f"Stopping condition: screen={screen}, cond_name={cond_name}, cond_index={cond_index}")
         ret = self.ocx.dynamicCall("SendConditionStop(QString, QString, int)", screen, cond_name, cond_index)
 
-    def update_table_widget(self):
-        self.parent.table_widget.setRowCount(len(self.tracked_stocks))
-        for row, (code, info) in enumerate(self.tracked_stocks.items()):
-            self.parent.table_widget.setItem(row, 0, QTableWidgetItem(code))
-            self.parent.table_widget.setItem(row, 1, QTableWidgetItem(info['first_seen']))
-            self.parent.table_widget.setItem(row, 2, QTableWidgetItem(info['cond_name']))
-
-    def print_tracked_stocks(self):
-        print("\nCurrent tracked stocks:")
-        if not self.tracked_stocks:
-            print("No tracked stocks.")
-        else:
-            for code, info in self.tracked_stocks.items():
-                print(f"  Code: {code}, First Seen: {info['first_seen']}, Condition Name: {info['cond_name']}")
+    def start_condition(self, cond_name, cond_index):
+        # 조건식마다 빈 화면번호를 하나씩 써서 여러 조건식을 동시에 실시간 검색
+        # 화면번호만 잡아 두고 전송은 send_queued_conditions 가 조회 제한에 맞춰서 한다
+        if cond_name in self.conditions:
+            return True
+        used = {screen for screen, _ in self.conditions.values()}
+        free = [screen for screen in CONDITION_SCREENS if screen not in used]
+        if not free:
+            self.parent.status_bar.showMessage(f"No free screen for condition {cond_name}")
+            return False
+        self.conditions[cond_name] = (free[0], cond_index)
+        self.condition_queue.append(cond_name)
+        self.send_queued_conditions()
+        return True
+
+    def stop_condition(self, cond_name):
+        if cond_name not in self.conditions:
+            return
+        screen, cond_index = self.conditions.pop(cond_name)
+        if cond_name in self.condition_queue:
+            # 아직 보내지 않은 조건식은 대기열에서만 뺀다
+            self.condition_queue.remove(cond_name)
+            return
+        self.SendConditionStop(screen, cond_name, cond_index)
+        self.subscriptions.unsubscribe_all(cond_name)
+        with self.tracked_lock:
+            for code, names in list(self.active.items()):
+                if cond_name in names:
+                    names = names - {cond_name}
+                    if names:
+                        self.active[code] = names
+                    else:
+                        del self.active[code]
+
+    def start_all_conditions(self):
+        # 조건식 목록 전체를 한 프로세스에서 동시에 실행 (최대 화면 수까지)
+        started = [name for index, name in self.GetConditionNameList() if self.start_condition(name, index)]
+        print(f"Starting {len(started)} conditions (1 per second): {', '.join(started)}")
+        return started
+
+    def stop_all_conditions(self):
+        for cond_name in list(self.conditions):
+            self.stop_condition(cond_name)
+
+    def print_tracked_stocks(self, added, total):
+        # 새로 편입된 종목만 출력
+        if not added:
+            return
+        print(f"\nNew tracked stocks ({len(added)}, total {total}):")
+        for info in added:
+            code = info['code']
+            print(f"  Code: {code}, First Seen: {info['first_seen']}, Condition Name: {info['cond_name']}")
         print("-" * 40)
 
     def subscribe_market_start(self):
         self.ocx.dynamicCall("SetRealReg(QString, QString, QString, QString)", "1000", "", "215", "0")
 
     def _receive_real_data(self, jongmok_code, real_type, real_data):
-        if real_type == "장시작시간":
-            market_start_time = self.ocx.dynamicCall("GetCommRealData(QString, int)", jongmok_code, 215).strip()
+        if real_type == "주식체결":
+            self._handler_real_data(jongmok_code, real_type, real_data)
+        elif real_type == "장시작시간":
+            status = self.decoder.market_status(real_data)
+            market_start_time = status.status if status is not None else ""
             if market_start_time == "0":
                 print("장 시작 전")
             elif market_start_time == "2":
                 print("장 종료, 시간 외 매매 시작")
             elif market_start_time == "3":
-                print("시간 외 매매 종료")
\ No newline at end of file
+                print("시간 외 매매 종료")
+            if self.on_market_status is not None:
+                self.on_market_status(market_start_time)
\ No newline at end of file
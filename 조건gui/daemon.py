@@ -0,0 +1,174 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QTimer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_handler import APIHandler
+from database import DatabaseManager
+from bar_aggregator import SESSION_OPEN, SESSION_CLOSE
+from bar_store import KST_OFFSET
+from market_data import MARKET_OPEN, MARKET_CLOSE
+
+logger = logging.getLogger("daemon")
+
+
+class LogStatusBar:
+    # APIHandler 가 쓰는 status_bar 자리에 로그를 남긴다
+    def showMessage(self, message):
+        logger.info(message)
+
+
+class StatusRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ('/', '/status'):
+            self.send_error(404)
+            return
+        body = json.dumps(self.server.tracker.status, ensure_ascii=False, indent=1).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TrackerDaemon:
+    # 창/차트 없이 조건검색, 실시간 구독, 저장만 하는 실행 모드.
+    # 장운영구분 (FID 215) 로 장 시작 때 조건식을 켜고 장 종료 때 끈다.
+    # 상태는 로그 (status_interval 초마다) 와 http://127.0.0.1:<port>/status (JSON) 로 확인한다.
+
+    def __init__(self, app, conditions=None, record=True, port=8765, status_interval=60, exit_after_close=False):
+        self.app = app
+        self.conditions = conditions       # None 이면 조건식 목록 전체
+        self.exit_after_close = exit_after_close
+        self.status_bar = LogStatusBar()
+        self.api_handler = APIHandler(self, record=record)
+        self.db = DatabaseManager(self.api_handler)
+        self.api_handler.on_market_status = self.on_market_status
+        self.api_handler.ocx.OnEventConnect.connect(self._after_login)
+        self.api_handler.ocx.OnReceiveConditionVer.connect(self._after_condition_load)
+
+        self.conditions_loaded = False
+        self.session_requested = False
+        self.running = False
+        self.started_at = time.time()
+        self.status = {}
+
+        self.poll_timer = QTimer()
+        self.poll_timer.timeout.connect(self.poll)
+        self.poll_timer.start(500)
+        self.status_timer = QTimer()
+        self.status_timer.timeout.connect(self.log_status)
+        self.status_timer.start(status_interval * 1000)
+
+        self.server = None
+        if port:
+            self.server = ThreadingHTTPServer(('127.0.0.1', port), StatusRequestHandler)
+            self.server.tracker = self
+            threading.Thread(target=self.server.serve_forever, name="StatusServer", daemon=True).start()
+            logger.info(f"Status at http://127.0.0.1:{port}/status")
+
+        self.api_handler.CommConnect()
+
+    def _after_login(self, err_code):
+        if err_code != 0:
+            logger.error(f"Login failed: {err_code}")
+            self.app.quit()
+            return
+        self.api_handler.subscribe_market_start()
+        self.api_handler.GetConditionLoad()
+
+    def _after_condition_load(self, ret, msg):
+        self.conditions_loaded = ret == 1
+        if self.conditions_loaded and (self.session_requested or self.in_session()):
+            self.start_session()
+
+    def in_session(self):
+        # 정규장 중에 켜졌으면 장 시작 신호를 기다리지 않는다
+        now = time.time() + KST_OFFSET
+        weekday = (int(now // 86400) + 3) % 7   # 1970-01-01 은 목요일, 월요일 = 0
+        return weekday < 5 and SESSION_OPEN <= now % 86400 < SESSION_CLOSE
+
+    def on_market_status(self, status):
+        if status == MARKET_OPEN:
+            self.start_session()
+        elif status == MARKET_CLOSE:
+            self.stop_session()
+
+    def start_session(self):
+        if self.running:
+            return
+        if not self.conditions_loaded:
+            self.session_requested = True
+            return
+        available = self.api_handler.GetConditionNameList()
+        for index, name in available:
+            if self.conditions is None or name in self.conditions:
+                self.api_handler.start_condition(name, index)
+        missing = set(self.conditions or ()) - {name for _, name in available}
+        if missing:
+            logger.warning(f"Unknown conditions: {', '.join(sorted(missing))}")
+        self.running = True
+        logger.info(f"Session started: {', '.join(self.api_handler.conditions)}")
+
+    def stop_session(self):
+        if not self.running:
+            return
+        self.api_handler.stop_all_conditions()
+        self.api_handler.writer.flush(timeout=10)
+        self.running = False
+        self.log_status()
+        logger.info("Session stopped")
+        if self.exit_after_close:
+            self.app.quit()
+
+    def poll(self):
+        self.api_handler.poll()
+        status = self.api_handler.status()
+        status['running'] = self.running
+        status['uptime_sec'] = int(time.time() - self.started_at)
+        self.status = status
+
+    def log_status(self):
+        status = self.status or self.api_handler.status()
+        pipeline = status['pipeline']
+        logger.info(f"running={self.running} conditions={len(status['conditions'])} tracked={status['tracked']} "
+                    f"codes={status['subscriptions']['codes']} events={pipeline['processed']}/{pipeline['received']} "
+                    f"dropped={pipeline['dropped']} written={status['writer']['written']}")
+
+    def close(self):
+        self.poll_timer.stop()
+        self.status_timer.stop()
+        self.api_handler.close()
+        self.db.save_tracked_stocks_to_db()
+        if self.server is not None:
+            self.server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="조건검색/실시간 체결 기록 (창 없이 실행)")
+    parser.add_argument('--condition', action='append', help="실행할 조건식 이름 (여러 번 지정 가능, 없으면 전체)")
+    parser.add_argument('--no-record', action='store_true', help="체결/분봉은 저장하지 않고 조건검색 이벤트만 기록")
+    parser.add_argument('--port', type=int, default=8765, help="상태 확인용 로컬 포트 (0 이면 끄기)")
+    parser.add_argument('--status-interval', type=int, default=60, help="상태 로그 간격 (초)")
+    parser.add_argument('--exit-after-close', action='store_true', help="장 종료 신호를 받으면 프로그램 종료")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    # QAxWidget 때문에 QApplication 은 필요하지만 창은 만들지 않는다
+    app = QApplication(sys.argv)
+    daemon = TrackerDaemon(app, conditions=args.condition, record=not args.no_record, port=args.port,
+                           status_interval=args.status_interval, exit_after_close=args.exit_after_close)
+    signal.signal(signal.SIGINT, lambda *_: app.quit())  # poll 타이머가 돌 때 Ctrl+C 처리
+    app.exec_()
+    daemon.close()
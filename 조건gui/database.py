@@ -2,34 +2,42 @@ import sqlite3
 from datetime import datetime
 
 class DatabaseManager:
+    # 조건식마다 자기 파일 (YYYYMMDD_조건식.db) 에 연결을 따로 유지한다
     def __init__(self, api_handler):
         self.api_handler = api_handler
-        self.conn = None
-        self.cursor = None
+        self.connections = {}
 
     def setup_database(self, condition_name):
+        if condition_name in self.connections:
+            return
         print("Setting up database...")
         current_date = datetime.now().strftime('%Y%m%d')
         db_filename = f"{current_date}_{condition_name}.db"
-        self.conn = sqlite3.connect(db_filename)
-        self.cursor = self.conn.cursor()
-        self.cursor.execute('''
+        conn = sqlite3.connect(db_filename)
+        conn.execute('''
             CREATE TABLE IF NOT EXISTS tracked_stocks (
                 code TEXT PRIMARY KEY,
                 first_seen TEXT,
                 cond_name TEXT
             )
         ''')
-        self.conn.commit()
+        conn.commit()
+        self.connections[condition_name] = conn
         print(f"Database setup complete with filename: {db_filename}")
 
     def save_tracked_stocks_to_db(self):
         print("Saving tracked stocks to database...")
-        for code, info in self.api_handler.tracked_stocks.items():
-            self.cursor.execute('''
+        tracked = self.api_handler.snapshot_tracked_stocks()
+        for info in tracked.values():
+            conn = self.connections.get(info['cond_name'])
+            if conn is None:
+                continue
+            conn.execute('''
                 INSERT OR REPLACE INTO tracked_stocks (code, first_seen, cond_name)
                 VALUES (?, ?, ?)
-            ''', (code, info['first_seen'], info['cond_name']))
-        self.conn.commit()
-        self.conn.close()
+            ''', (info['code'], info['first_seen'], info['cond_name']))
+        for conn in self.connections.values():
+            conn.commit()
+            conn.close()
+        self.connections = {}
         print("Tracked stocks saved to database.")
@@ -1,9 +1,11 @@
 from PyQt5.QtWidgets import *
+from PyQt5.QtCore import QTimer
 from api_handler import APIHandler
 from database import DatabaseManager
+from tracked_model import TrackedStocksModel
 
 class MyWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, max_repaints=2):
         super().__init__()
         self.setGeometry(300, 300, 600, 400)
         self.setWindowTitle("Kiwoom 실시간 조건식 테스트")
@@ -13,10 +15,14 @@ class MyWindow(QMainWindow):
 
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
+        self.pipeline_label = QLabel()
+        self.status_bar.addPermanentWidget(self.pipeline_label)
 
         btn1 = QPushButton("Load Conditions")
         btn2 = QPushButton("List Conditions")
         btn3 = QPushButton("Send Condition")
+        btn4 = QPushButton("Run All Conditions")
+        btn5 = QPushButton("Stop Condition")
 
         self.cond_name_input = QLineEdit(self)
         self.cond_index_input = QLineEdit(self)
@@ -25,9 +31,9 @@ class MyWindow(QMainWindow):
         form_layout.addRow("Condition Name:", self.cond_name_input)
         form_layout.addRow("Condition Index:", self.cond_index_input)
 
-        self.table_widget = QTableWidget()
-        self.table_widget.setColumnCount(3)
-        self.table_widget.setHorizontalHeaderLabels(["Code", "First Seen", "Condition Name"])
+        self.tracked_model = TrackedStocksModel(self)
+        self.table_view = QTableView()
+        self.table_view.setModel(self.tracked_model)
 
         widget = QWidget()
         layout = QVBoxLayout(widget)
@@ -35,24 +41,36 @@ class MyWindow(QMainWindow):
         layout.addWidget(btn2)
         layout.addLayout(form_layout)
         layout.addWidget(btn3)
-        layout.addWidget(self.table_widget)
+        layout.addWidget(btn4)
+        layout.addWidget(btn5)
+        layout.addWidget(self.table_view)
         self.setCentralWidget(widget)
 
         # event
         btn1.clicked.connect(self.api_handler.GetConditionLoad)
         btn2.clicked.connect(self.api_handler.GetConditionNameList)
         btn3.clicked.connect(self.send_condition)
+        btn4.clicked.connect(self.api_handler.start_all_conditions)
+        btn5.clicked.connect(self.stop_condition)
+
+        # 콜백과 분리된 화면 갱신 (초당 최대 max_repaints 번, 바뀐 것만 모아서)
+        self.view_timer = QTimer(self)
+        self.view_timer.timeout.connect(self.api_handler.refresh_view)
+        self.view_timer.start(int(1000 / max_repaints))
 
         self.api_handler.CommConnect()
 
     def closeEvent(self, event):
+        self.view_timer.stop()
+        self.api_handler.close()
         self.db.save_tracked_stocks_to_db()
+        tracked = self.api_handler.snapshot_tracked_stocks()
         print("\nTracked stocks at program close:")
-        if not self.api_handler.tracked_stocks:
+        if not tracked:
             print("No tracked stocks.")
         else:
-            for code, info in self.api_handler.tracked_stocks.items():
-                print(f"Code: {code}, First Seen: {info['first_seen']}, Condition Name: {info['cond_name']}")
+            for info in tracked.values():
+                print(f"Code: {info['code']}, First Seen: {info['first_seen']}, Condition Name: {info['cond_name']}")
         event.accept()
 
     def send_condition(self):
@@ -60,6 +78,14 @@ class MyWindow(QMainWindow):
         cond_index = self.cond_index_input.text()
         print(f"Preparing to send condition: cond_name={cond_name}, cond_index={cond_index}")
         if cond_name and cond_index:
-            self.api_handler.SendCondition("100", cond_name, int(cond_index), 1)
+            # 이미 실행 중인 조건식은 그대로 두고 빈 화면번호로 추가 실행
+            self.api_handler.start_condition(cond_name, int(cond_index))
         else:
             self.status_bar.showMessage("Please enter both condition name and index")
+
+    def stop_condition(self):
+        cond_name = self.cond_name_input.text()
+        if cond_name:
+            self.api_handler.stop_condition(cond_name)
+        else:
+            self.status_bar.showMessage("Please enter the condition name to stop")
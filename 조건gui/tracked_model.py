@@ -0,0 +1,79 @@
+import time
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+COLUMNS = ["Code", "First Seen", "Condition Name", "Active", "Last Price", "Change %", "Elapsed"]
+ACTIVE_COLUMN, PRICE_COLUMN, RATE_COLUMN, ELAPSED_COLUMN = 3, 4, 5, 6
+
+
+class TrackedStocksModel(QAbstractTableModel):
+    # 편입 종목 테이블 (조건식별로 한 행). 새 종목은 beginInsertRows 로 끝에 붙이고,
+    # 조건 만족 여부/현재가/등락율/경과시간은 바뀐 행 범위만 dataChanged 로 알린다 (위젯을 다시 만들지 않음).
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []     # [code, first_seen 문자열, cond_name, 편입 epoch]
+        self.live = []     # (지금 조건 만족 여부, 현재가, 등락율)
+        self.now = time.time()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        if role == Qt.TextAlignmentRole and column >= PRICE_COLUMN:
+            return Qt.AlignRight | Qt.AlignVCenter
+        if role != Qt.DisplayRole:
+            return None
+
+        code, first_seen, cond_name, seen_at = self.rows[row]
+        if column < ACTIVE_COLUMN:
+            return (code, first_seen, cond_name)[column]
+        active, price, rate = self.live[row]
+        if column == ACTIVE_COLUMN:
+            return 'Y' if active else ''
+        if column == PRICE_COLUMN:
+            return '' if price is None else f'{price:,}'
+        if column == RATE_COLUMN:
+            return '' if rate is None else f'{rate:+.2f}'
+        elapsed = max(0, int(self.now - seen_at))
+        return f'{elapsed // 3600}:{elapsed // 60 % 60:02d}:{elapsed % 60:02d}'
+
+    def append_rows(self, entries):
+        # entries: [info], 새로 편입된 (조건식, 종목) 만
+        if not entries:
+            return
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(entries) - 1)
+        for info in entries:
+            self.rows.append([info['code'], info['first_seen'], info['cond_name'], info['seen_at']])
+            self.live.append((True, None, None))
+        self.endInsertRows()
+
+    def update_live(self, quotes, active, now=None):
+        # quotes: code -> (현재가, 등락율), active: code -> 만족 중인 조건식들
+        # 바뀐 행의 최소~최대 범위를 한 번에 알린다
+        self.now = time.time() if now is None else now
+        if not self.rows:
+            return
+        first = last = None
+        no_quote = (None, None)
+        for row, (code, _, cond_name, _) in enumerate(self.rows):
+            live = (cond_name in active.get(code, ()),) + quotes.get(code, no_quote)
+            if live != self.live[row]:
+                self.live[row] = live
+                if first is None:
+                    first = row
+                last = row
+        if first is not None:
+            self.dataChanged.emit(self.index(first, ACTIVE_COLUMN), self.index(last, RATE_COLUMN), [Qt.DisplayRole])
+        self.dataChanged.emit(self.index(0, ELAPSED_COLUMN), self.index(len(self.rows) - 1, ELAPSED_COLUMN), [Qt.DisplayRole])
@@ -1,14 +1,29 @@
 from pykiwoom.kiwoom import *
+import os
 import time
 import pandas as pd
 import sqlite3
+from datetime import datetime
+from bar_store import BarStore, BAR_STORE_PATH, KST_OFFSET, frame_rows, to_epoch, kst_day_start, parse_db_name
+from tr_scheduler import TRScheduler, PRIORITY_CONDITION, PRIORITY_BACKFILL
+from bar_aggregator import resample_bars
+from session_features import update_features
 
 class StockDataUpdater:
-    def __init__(self, db_path, tick_ranges):
+    def __init__(self, db_path, tick_ranges, store_path=BAR_STORE_PATH, history_pages=5, scheduler=None):
         self.db_path = db_path
-        self.tick_ranges = tick_ranges
+        self.store_path = store_path
+        self.tick_ranges = sorted(tick_ranges)
+        # 가장 짧은 분봉만 TR 로 받고 나머지는 그 분봉으로 만든다
+        self.base_range = self.tick_ranges[0]
+        for tick_range in self.tick_ranges:
+            if tick_range % self.base_range:
+                raise ValueError(f"{tick_range}분봉은 {self.base_range}분봉으로 만들 수 없습니다")
+        self.history_pages = history_pages  # 저장된 봉이 없을 때 이어받을 최대 페이지 수 (페이지당 최대 900봉)
         self.kiwoom = Kiwoom()
         self.kiwoom.CommConnect(block=True)
+        # 고정 sleep 대신 TR 조회 제한 (초/분/시간) 안에서 최대한 빠르게 요청
+        self.scheduler = scheduler or TRScheduler(self.kiwoom)
         self.stock_codes = self._get_tracked_stock_codes()
 
     def _get_tracked_stock_codes(self):
@@ -18,58 +33,114 @@ class StockDataUpdater:
         conn.close()
         return stock_codes_df['code'].tolist()
 
-    def _fetch_stock_data(self, code, tick_range):
-        df = self.kiwoom.block_request("opt10080",
-                                       종목코드=code,
-                                       틱범위=tick_range,
-                                       output="주식분봉차트조회",
-                                       next=0)
-        df['종목코드'] = code
-        return df
+    def _submit_fetch(self, code, tick_range, last_ts, priority, callback):
+        # 최신 봉부터 내려오는 페이지를 마지막 저장 봉에 닿을 때까지 연속 조회 (next=2) 한 묶음으로 요청
+        # 저장된 봉이 없으면 history_pages 페이지까지
+        return self.scheduler.submit("opt10080", priority, callback,
+                                     more=lambda pages: self._more_pages(pages, last_ts),
+                                     종목코드=code,
+                                     틱범위=tick_range,
+                                     output="주식분봉차트조회")
+
+    def _more_pages(self, pages, last_ts):
+        page = pages[-1]
+        if page is None or page.empty:
+            return False
+        if last_ts is None:
+            return len(pages) < self.history_pages
+        return self._format_datetime(page['체결시간'].min()) > last_ts
 
     def _format_datetime(self, dt_str):
-        return pd.to_datetime(dt_str, format='%Y%m%d%H%M%S').strftime('%Y-%m-%d %H:%M:%S')
+        return to_epoch(dt_str)
 
-    def update_stock_data(self):
-        for tick_range in self.tick_ranges:
-            all_data = pd.DataFrame()
+    def _normalize(self, df):
+        df = df.rename(columns={
+            '현재가': 'close',
+            '거래량': 'volume',
+            '체결시간': 'date',
+            '시가': 'open',
+            '고가': 'high',
+            '저가': 'low',
+        })
+        df = df[['date', 'open', 'high', 'low', 'close', 'volume']].copy()
+        df['date'] = df['date'].apply(self._format_datetime)
+        df[['open', 'high', 'low', 'close', 'volume']] = df[['open', 'high', 'low', 'close', 'volume']].apply(pd.to_numeric, errors='coerce').abs()
+        return df
+
+    def _new_bars(self, pages, last_ts):
+        pages = [self._normalize(df) for df in pages if df is not None and not df.empty]
+        if not pages:
+            return None
+        data = pd.concat(pages, ignore_index=True)
+        if last_ts is not None:
+            # 마지막 저장 봉은 장중에 받은 미완성 봉일 수 있으므로 다시 덮어쓴다
+            data = data[data['date'] >= last_ts]
+        return data.drop_duplicates('date').sort_values('date')
+
+    def _derive_bars(self, store, code, since, first_fetch):
+        # since 가 속한 날부터 저장된 기본 분봉으로 상위 타임프레임 봉을 다시 만든다 (미완성 봉 포함)
+        # 처음 받은 종목은 받은 범위가 since 에서 시작하므로 그보다 앞에서 시작하는 (일부만 있는) 구간은 만들지 않는다
+        day_start = since - (since + KST_OFFSET) % 86400
+        base_rows = store.bar_rows(code, self.base_range * 60, day_start)
+        start = since if first_fetch else None
+        for tick_range in self.tick_ranges[1:]:
+            store.upsert_bars(code, tick_range * 60, resample_bars(base_rows, tick_range * 60, start), commit=False)
+
+    def _active_codes(self, store):
+        # 오늘 조건검색에 편입돼 있는 종목 (실시간 조건검색이 기록한 condition_events) 은 먼저 받는다
+        try:
+            cond_name = parse_db_name(self.db_path)[1]
+        except ValueError:
+            cond_name = None
+        return set(store.active_condition_codes(cond_name, kst_day_start(time.time())))
+
+    def update_stock_data(self, job=None):
+        # job 이 같으면 이미 끝난 종목은 건너뛴다 (기본: db 파일명 + 오늘 날짜)
+        job = job or f"{os.path.basename(self.db_path)}:{datetime.now().strftime('%Y%m%d')}"
+        store = BarStore(self.store_path)
+        done = store.completed_backfill(job)
+        base_timeframe = self.base_range * 60
+        timeframes = [tick_range * 60 for tick_range in self.tick_ranges]
+        last_times = store.last_bar_times(base_timeframe, self.stock_codes)
+        active = self._active_codes(store)
+        total = len(self.stock_codes)
+        finished = []
+
+        def save(code, request):
+            finished.append(code)
+            if request.error is not None:
+                # 이 종목은 완료로 남기지 않는다 (같은 job 으로 다시 돌리면 다시 받음)
+                print(f"[{len(finished)}/{total}] {code}: {request.error}")
+                return
+            data = self._new_bars(request.result, last_times.get(code))
+
+            # 기본 분봉, 상위 타임프레임 봉, 진행 상황 기록을 한 트랜잭션으로
+            if data is not None and not data.empty:
+                store.upsert_bars(code, base_timeframe, frame_rows(data, ['date', 'open', 'high', 'low', 'close', 'volume']), commit=False)
+                self._derive_bars(store, code, int(data['date'].min()), last_times.get(code) is None)
+                days = set(int(ts) - (int(ts) + KST_OFFSET) % 86400 for ts in data['date'])
+                update_features(store, [(code, timeframe, day) for timeframe in timeframes for day in days],
+                                commit=False)
+            for timeframe in timeframes:
+                store.mark_backfill_done(job, code, timeframe, commit=False)
+            store.conn.commit()
+            print(f"[{len(finished)}/{total}] {code}: {0 if data is None else len(data)} {self.base_range}분봉 -> {self.tick_ranges}분")
+
+        try:
             for code in self.stock_codes:
-                df = self._fetch_stock_data(code, tick_range)
-                all_data = pd.concat([all_data, df], ignore_index=True)
-                time.sleep(1)
-            
-            all_data.rename(columns={
-                '현재가': 'close',
-                '거래량': 'volume',
-                '체결시간': 'date',
-                '시가': 'open',
-                '고가': 'high',
-                '저가': 'low',
-                '종목코드': 'stock_code'
-            }, inplace=True)
-            
-            reordered_columns = ['stock_code', 'date', 'open', 'high', 'close', 'low', 'volume']
-            reordered_df = all_data[reordered_columns]
-            
-            reordered_df['date'] = reordered_df['date'].apply(self._format_datetime)
-            
-            grouped_data = reordered_df.groupby('stock_code')
-            stock_data_dict = {stock_code: data for stock_code, data in grouped_data}
-            
-            for stock_code in stock_data_dict.keys():
-                stock_data_dict[stock_code] = stock_data_dict[stock_code].sort_values(by='date')
-                stock_data_dict[stock_code][['open', 'high', 'close', 'low', 'volume']] = stock_data_dict[stock_code][['open', 'high', 'close', 'low', 'volume']].apply(pd.to_numeric, errors='coerce').abs()
-            
-            conn = sqlite3.connect(self.db_path)
-            
-            for stock_code, data in stock_data_dict.items():
-                table_name = f"{tick_range}분_{stock_code}"
-                data[['date', 'open', 'high', 'close', 'low', 'volume']].to_sql(table_name, conn, if_exists='replace', index=False)
-            
-            conn.close()
+                if all((code, timeframe) in done for timeframe in timeframes):
+                    finished.append(code)
+                    continue
+                priority = PRIORITY_CONDITION if code in active else PRIORITY_BACKFILL
+                self._submit_fetch(code, self.base_range, last_times.get(code), priority,
+                                   lambda request, code=code: save(code, request))
+            self.scheduler.run_all()
+        finally:
+            store.close()
+            print(f"TR stats: {self.scheduler.stats()}")
 
 # 사용 예제
 db_path = '20240717_시가갭검색식_돌파.db'
 tick_ranges = [1, 3, 5, 30]
 updater = StockDataUpdater(db_path, tick_ranges)
-updater.update_stock_data()
\ No newline at end of file
+updater.update_stock_data()
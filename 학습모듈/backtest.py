@@ -0,0 +1,286 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bar_store import BarStore, BAR_STORE_PATH, day_range
+from bar_aggregator import SESSION_OPEN, SESSION_CLOSE
+from column_cache import ColumnCache
+from stock_analysis import entry_levels
+
+# 0.382 지정가 매수 -> 0.786 에서 일부 익절, 1.618 목표가, 0 가격 (첫 봉 시가) 손절, 못 나가면 장 마감 종가
+DEFAULT_PARAMS = {
+    'timeframe': 180,
+    'max_candles': 5,
+    'entry_ratio': 0.382,
+    'partial_ratio': 0.786,
+    'partial_fraction': 0.5,
+    'target_ratio': 1.618,
+    'stop_ratio': 0.0,
+    'entry_until': None,   # 이 시각 (KST 자정 기준 초) 부터는 매수하지 않음, None 이면 장 마감까지
+    'fee': 0.00015,        # 매수/매도 수수료
+    'tax': 0.0018,         # 매도 거래세
+    'slippage': 0.0005,    # 손절/종가 청산 (시장가) 에만 적용
+}
+TRADE_COLUMNS = ['symbol', 'date', 'entry_time', 'entry_price', 'exit_time', 'exit_price', 'reason',
+                 'partial', 'bars_held', 'return']
+
+
+class SessionGrid:
+    # 하루 (또는 여러 날) 장중 봉을 (종목, 날짜) x 봉 순서 2차원 배열로 한 번 만들어 두고
+    # 파라미터 조합마다 다시 쓴다 (빈칸은 NaN)
+
+    def __init__(self, bars):
+        bars = bars.sort_values(['symbol', 'date'], kind='stable')
+        symbol = bars['symbol'].to_numpy()
+        day = bars['date'].dt.normalize().to_numpy()
+        new_group = np.ones(len(bars), dtype=bool)
+        new_group[1:] = (symbol[1:] != symbol[:-1]) | (day[1:] != day[:-1])
+        group = np.cumsum(new_group) - 1
+        starts = np.flatnonzero(new_group)
+        pos = np.arange(len(bars)) - starts[group]
+
+        self.symbols = symbol[starts]
+        self.days = day[starts]
+        self.counts = np.bincount(group, minlength=len(starts))
+        width = int(self.counts.max()) if len(starts) else 0
+        shape = (len(starts), width)
+        self.times = np.zeros(shape, dtype='datetime64[ns]')
+        self.times[group, pos] = bars['date'].to_numpy()
+        self.seconds = self.times.astype('datetime64[s]').astype(np.int64) % 86400   # KST 자정 기준
+        for column in ('open', 'high', 'low', 'close'):
+            grid = np.full(shape, np.nan)
+            grid[group, pos] = bars[column].to_numpy(dtype=float)
+            setattr(self, column, grid)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def entry_levels(self, max_candles, entry_ratio):
+        k = max(max_candles, 2)
+        pad = ((0, 0), (0, max(0, k - self.open.shape[1])))   # 봉이 k 개보다 적은 날
+        opens, closes, lows = (np.pad(grid[:, :k], pad, constant_values=np.nan)
+                               for grid in (self.open, self.close, self.low))
+        return entry_levels(opens, closes, lows, self.counts, entry_ratio)
+
+
+def _first(mask, none):
+    # 행마다 처음 True 인 열 번호, 없으면 none
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), none)
+
+
+def simulate(grid, params, levels=None):
+    # 모든 (종목, 날짜) 를 한 번에 시뮬레이션한다. 반환: (거래 DataFrame, 신호 수)
+    # 한 봉 안에서 손절과 목표가가 같이 닿으면 손절이 먼저라고 본다 (보수적)
+    # levels: 같은 grid/max_candles 로 미리 계산한 grid.entry_levels() (진입 비율과 무관한 값만 사용)
+    p = dict(DEFAULT_PARAMS, **params)
+    n, width = grid.open.shape
+    if not n:
+        return pd.DataFrame(columns=TRADE_COLUMNS), 0
+    if levels is None:
+        levels = grid.entry_levels(p['max_candles'], p['entry_ratio'])
+    zero = levels['first_open']
+    spread = levels['one_price'] - zero
+    signal = levels['signal'] & (spread > 0)
+    buy = zero + p['entry_ratio'] * spread
+    stop = zero + p['stop_ratio'] * spread
+    partial = zero + p['partial_ratio'] * spread
+    target = zero + p['target_ratio'] * spread
+    # 매수 주문은 연속 양봉이 끝난 (또는 max_candles 개를 본) 다음 봉부터
+    ready = np.minimum(levels['bullish_candles'] + 1, p['max_candles'])
+
+    rows = np.arange(n)
+    col = np.arange(width)
+    valid = col < grid.counts[:, None]
+    orders = valid & signal[:, None] & (col >= ready[:, None])
+    if p['entry_until'] is not None:
+        orders &= grid.seconds < p['entry_until']
+    with np.errstate(invalid='ignore'):
+        fill_idx = _first(orders & (grid.low <= buy[:, None]), width)
+        filled = fill_idx < width
+        rows, fill_idx = rows[filled], fill_idx[filled]
+        if not len(rows):
+            return pd.DataFrame(columns=TRADE_COLUMNS), int(signal.sum())
+        low, high, opens = grid.low[rows], grid.high[rows], grid.open[rows]
+        buy, stop, partial, target = buy[rows], stop[rows], partial[rows], target[rows]
+        valid = valid[rows]
+        last_idx = grid.counts[rows] - 1
+        entry = np.minimum(buy, opens[np.arange(len(rows)), fill_idx])   # 시가가 주문가 아래면 시가에 체결
+
+        after = valid & (col >= fill_idx[:, None])
+        later = valid & (col > fill_idx[:, None])
+        stop_idx = _first(after & (low <= stop[:, None]), width)
+        target_idx = _first(later & (high >= target[:, None]), width)
+        partial_idx = _first(later & (high >= partial[:, None]), width) if p['partial_fraction'] > 0 else \
+            np.full(len(rows), width)
+
+    def open_at(idx):
+        return opens[np.arange(len(rows)), np.minimum(idx, width - 1)]
+
+    stopped = (stop_idx < width) & (stop_idx <= target_idx)
+    hit_target = ~stopped & (target_idx < width)
+    exit_idx = np.where(stopped, stop_idx, np.where(hit_target, target_idx, last_idx))
+    # 갭으로 가격을 건너뛰면 그 봉의 시가에 체결. 체결 봉이 손절가 아래에서 시작했으면
+    # 시가에 사서 바로 시가에 손절 (손절가에 팔았다고 보면 손절 거래가 이익으로 잡힌다)
+    stop_price = np.fmin(stop, open_at(stop_idx))
+    exit_price = np.where(stopped, stop_price * (1 - p['slippage']),
+                          np.where(hit_target, np.fmax(target, open_at(target_idx)),
+                                   grid.close[rows, last_idx] * (1 - p['slippage'])))
+    took_partial = (partial_idx < width) & (partial_idx < stop_idx) & (partial_idx <= exit_idx)
+    fraction = np.where(took_partial, p['partial_fraction'], 0.0)
+    partial_price = np.where(took_partial, np.fmax(partial, open_at(partial_idx)), 0.0)
+    exit_price = fraction * partial_price + (1 - fraction) * exit_price
+
+    cost = entry * (1 + p['fee'])
+    proceeds = exit_price * (1 - p['fee'] - p['tax'])
+    trades = pd.DataFrame({
+        'symbol': grid.symbols[rows],
+        'date': grid.days[rows],
+        'entry_time': grid.times[rows, fill_idx],
+        'entry_price': entry,
+        'exit_time': grid.times[rows, exit_idx],
+        'exit_price': exit_price,
+        'reason': np.where(stopped, 'stop', np.where(hit_target, 'target', 'close')),
+        'partial': took_partial,
+        'bars_held': exit_idx - fill_idx,
+        'return': proceeds / cost - 1,
+    }, columns=TRADE_COLUMNS)
+    return trades, int(signal.sum())
+
+
+def summarize(trades, signals):
+    # 거래 목록 -> 집계 (수익률은 거래당 %, 누적은 단순 합, 낙폭도 누적 합 기준)
+    returns = trades.sort_values('entry_time')['return'].to_numpy()
+    wins, losses = returns[returns > 0].sum(), -returns[returns < 0].sum()
+    equity = np.cumsum(returns)
+    drawdown = (np.maximum.accumulate(np.r_[0.0, equity]) - np.r_[0.0, equity]).max() if len(returns) else 0.0
+    reasons = trades['reason'].value_counts()
+    return {
+        'signals': signals,
+        'trades': len(returns),
+        'fill_rate': len(returns) / signals if signals else np.nan,
+        'win_rate': (returns > 0).mean() if len(returns) else np.nan,
+        'avg_return': returns.mean() if len(returns) else np.nan,
+        'total_return': returns.sum(),
+        'profit_factor': wins / losses if losses else np.inf if wins else np.nan,
+        'max_drawdown': drawdown,
+        'targets': int(reasons.get('target', 0)),
+        'stops': int(reasons.get('stop', 0)),
+        'closes': int(reasons.get('close', 0)),
+        'avg_bars_held': trades['bars_held'].mean() if len(returns) else np.nan,
+    }
+
+
+def load_session_grid(store, timeframe, start, end, cond_name, cache=None):
+    # 하루 [start, end) 그날 조건식에 편입된 종목의 장중 봉 (내보낸 컬럼 캐시가 있으면 mmap 에서)
+    session = (SESSION_OPEN, SESSION_CLOSE)
+    if cache is not None and cache.has_day(timeframe, start):
+        bars = cache.frame(timeframe, start, end, store.tracked_codes(cond_name, start, end), session)
+    else:
+        bars = store.fetch_session_bars(timeframe, start, end, session, cond_name=cond_name)
+    return SessionGrid(bars)
+
+
+def backtest_day(store_path, cond_name, day, param_sets, cache_dir=None):
+    # 작업 프로세스에서 실행: 하루치 봉은 타임프레임별로, 첫 봉 통계는 (타임프레임, max_candles) 별로
+    # 한 번만 만들고 파라미터 조합마다 매수/청산 규칙만 다시 계산한다. 반환: [(조합 번호, 거래, 신호 수)]
+    store = BarStore(store_path)
+    cache = ColumnCache(cache_dir) if cache_dir else None
+    try:
+        grids, levels = {}, {}
+        results = []
+        for index, params in enumerate(param_sets):
+            p = dict(DEFAULT_PARAMS, **params)
+            timeframe, max_candles = p['timeframe'], p['max_candles']
+            if timeframe not in grids:
+                grids[timeframe] = load_session_grid(store, timeframe, day, day + 86400, cond_name, cache)
+            grid = grids[timeframe]
+            if (timeframe, max_candles) not in levels and len(grid):
+                levels[timeframe, max_candles] = grid.entry_levels(max_candles, p['entry_ratio'])
+            trades, signals = simulate(grid, p, levels.get((timeframe, max_candles)))
+            results.append((index, trades, signals))
+        return results
+    finally:
+        store.close()
+
+
+class Backtester:
+    # 여러 날짜 x 여러 파라미터 조합을 프로세스 풀에서 나눠 돌린다 (작업 단위 = 하루)
+    # cache_dir: column_cache.py 로 내보낸 폴더 (있으면 봉을 sqlite 대신 mmap 으로 읽음)
+
+    def __init__(self, cond_name, store_path=BAR_STORE_PATH, workers=None, cache_dir=None):
+        self.cond_name = cond_name
+        self.store_path = store_path
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_dir = cache_dir
+
+    def days(self, start_date, end_date):
+        store = BarStore(self.store_path)
+        try:
+            return store.tracked_days(self.cond_name, day_range(start_date)[0], day_range(end_date)[1])
+        finally:
+            store.close()
+
+    def evaluate(self, days, param_sets):
+        # 모든 날짜 x 조합을 한 번씩 시뮬레이션한다.
+        # 반환: (거래 DataFrame ('params' = 조합 번호, 'day' = 날짜 epoch), 날짜 x 조합 신호 수 배열)
+        signals = np.zeros((len(days), len(param_sets)), dtype=np.int64)
+        frames = []
+
+        def collect(i, results):
+            for index, trades, count in results:
+                signals[i, index] = count
+                if len(trades):
+                    frames.append(trades.assign(params=index, day=days[i]))
+
+        if self.workers == 1 or len(days) <= 1:
+            for i, day in enumerate(days):
+                collect(i, backtest_day(self.store_path, self.cond_name, day, param_sets, self.cache_dir))
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(days))) as pool:
+                futures = {pool.submit(backtest_day, self.store_path, self.cond_name, day, param_sets,
+                                       self.cache_dir): i
+                           for i, day in enumerate(days)}
+                for future in as_completed(futures):
+                    collect(futures[future], future.result())
+
+        trades = pd.concat(frames, ignore_index=True) if frames else \
+            pd.DataFrame(columns=TRADE_COLUMNS + ['params', 'day'])
+        return trades.sort_values(['params', 'entry_time'], ignore_index=True), signals
+
+    def run(self, start_date, end_date, param_sets=({},)):
+        # 반환: (파라미터 조합별 집계 DataFrame, 모든 거래 DataFrame ('params' = 조합 번호))
+        param_sets = [dict(DEFAULT_PARAMS, **params) for params in param_sets]
+        days = self.days(start_date, end_date)
+        trades, signals = self.evaluate(days, param_sets)
+        summary = []
+        for index, params in enumerate(param_sets):
+            stats = summarize(trades[trades['params'] == index], int(signals[:, index].sum()))
+            summary.append(dict(params, days=len(days), **stats))
+        return pd.DataFrame(summary), trades
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="첫 봉 0.382 매수 규칙 백테스트")
+    parser.add_argument('cond_name', help="조건식 이름")
+    parser.add_argument('start', help="시작일 YYYY-MM-DD")
+    parser.add_argument('end', help="종료일 YYYY-MM-DD (포함)")
+    parser.add_argument('--store', default=BAR_STORE_PATH)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cache', default=None, help="column_cache.py 로 내보낸 폴더")
+    parser.add_argument('--timeframe', type=int, action='append', help="봉 간격 (초), 여러 번 지정 가능")
+    args = parser.parse_args()
+
+    param_sets = [{'timeframe': tf} for tf in (args.timeframe or [DEFAULT_PARAMS['timeframe']])]
+    started = time.perf_counter()
+    summary, trades = Backtester(args.cond_name, args.store, args.workers, args.cache).run(args.start, args.end, param_sets)
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_columns', 30)
+    print(trades.tail(20))
+    print(summary.drop(columns=['fee', 'tax', 'slippage']).T)
+    print(f"{len(trades)} trades in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,156 @@
+import itertools
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bar_store import BAR_STORE_PATH
+from backtest import Backtester, DEFAULT_PARAMS, summarize
+
+# analyze_table 에 고정되어 있던 값들 (매수 마감 시각, 앞쪽 봉 수, 진입 비율, 봉 간격)
+PARAM_SPACE = {
+    'timeframe': [60, 180, 300],
+    'max_candles': [2, 3, 4, 5],
+    'entry_ratio': [0.236, 0.382, 0.5, 0.618],
+    'entry_until': [9 * 3600 + 30 * 60, 10 * 3600, 11 * 3600],
+}
+OBJECTIVES = ('total_return', 'avg_return', 'win_rate')
+
+
+def grid_points(space=PARAM_SPACE):
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[key] for key in keys))]
+
+
+def random_points(space=PARAM_SPACE, count=50, seed=0):
+    # 목록은 그중 하나, (최소, 최대) 튜플은 균등분포에서 뽑는다 (중복 조합은 한 번만)
+    rng = np.random.default_rng(seed)
+    points, seen = [], set()
+    for _ in range(count * 10):
+        point = {}
+        for key, values in space.items():
+            if isinstance(values, tuple):
+                point[key] = round(float(rng.uniform(*values)), 4)
+            else:
+                point[key] = values[rng.integers(len(values))]
+        signature = tuple(sorted(point.items()))
+        if signature not in seen:
+            seen.add(signature)
+            points.append(point)
+            if len(points) == count:
+                break
+    return points
+
+
+def walk_forward_splits(days, train_days, test_days, step=None):
+    # 날짜 순서대로 [학습 train_days 일 -> 검증 test_days 일] 을 step 일씩 밀면서
+    step = step or test_days
+    splits = []
+    for start in range(0, len(days) - train_days - test_days + 1, step):
+        splits.append((days[start:start + train_days], days[start + train_days:start + train_days + test_days]))
+    return splits
+
+
+def score_points(trades, n_points, objective, min_trades):
+    # 조합별 목표값을 bincount 로 한 번에 (거래가 min_trades 개보다 적은 조합은 제외)
+    index = trades['params'].to_numpy(dtype=np.int64)
+    returns = trades['return'].to_numpy(dtype=np.float64)
+    count = np.bincount(index, minlength=n_points)
+    total = np.bincount(index, weights=returns, minlength=n_points)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if objective == 'total_return':
+            score = total
+        elif objective == 'avg_return':
+            score = total / count
+        else:
+            score = np.bincount(index, weights=returns > 0, minlength=n_points) / count
+    return np.where(count >= max(min_trades, 1), score, -np.inf), count
+
+
+class WalkForwardOptimizer:
+    # 모든 날짜 x 조합의 거래를 프로세스 풀에서 한 번만 시뮬레이션하고 (봉/첫 봉 통계는 날짜마다 한 번),
+    # 구간별 학습/검증은 그 결과를 날짜로 나눠서 집계만 한다.
+
+    def __init__(self, cond_name, store_path=BAR_STORE_PATH, workers=None, objective='total_return', min_trades=5,
+                 cache_dir=None):
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Unknown objective {objective}, choose from {list(OBJECTIVES)}")
+        self.backtester = Backtester(cond_name, store_path, workers, cache_dir)
+        self.objective = objective
+        self.min_trades = min_trades
+
+    def run(self, start_date, end_date, points, train_days=20, test_days=5, step=None):
+        # 반환: (구간별 선택 결과 DataFrame, 검증 구간 거래 DataFrame, 전체 기간 조합별 집계 DataFrame)
+        points = [dict(DEFAULT_PARAMS, **point) for point in points]
+        days = self.backtester.days(start_date, end_date)
+        splits = walk_forward_splits(days, train_days, test_days, step)
+        if not splits:
+            raise ValueError(f"Need at least {train_days + test_days} trading days, found {len(days)}")
+
+        started = time.perf_counter()
+        trades, signals = self.backtester.evaluate(days, points)
+        print(f"Simulated {len(points)} points x {len(days)} days in {time.perf_counter() - started:.1f}s")
+        day_index = {day: i for i, day in enumerate(days)}
+        trade_days = trades['day'].map(day_index).to_numpy()
+
+        folds, oos = [], []
+        for fold, (train, test) in enumerate(splits):
+            train_rows = (trade_days >= day_index[train[0]]) & (trade_days <= day_index[train[-1]])
+            score, count = score_points(trades[train_rows], len(points), self.objective, self.min_trades)
+            if not np.isfinite(score).any():
+                print(f"Fold {fold}: no point with {self.min_trades}+ trades, skipped")
+                continue
+            best = int(np.argmax(score))
+            test_rows = (trade_days >= day_index[test[0]]) & (trade_days <= day_index[test[-1]]) & \
+                        (trades['params'].to_numpy() == best)
+            test_trades = trades[test_rows]
+            test_signals = int(signals[day_index[test[0]]:day_index[test[-1]] + 1, best].sum())
+            stats = summarize(test_trades, test_signals)
+            folds.append(dict(fold=fold, train_start=train[0], test_start=test[0], test_end=test[-1],
+                              params=best, train_score=score[best], train_trades=int(count[best]),
+                              **{f'test_{key}': value for key, value in stats.items()},
+                              **{key: points[best][key] for key in PARAM_SPACE if key in points[best]}))
+            oos.append(test_trades.assign(fold=fold))
+
+        summary = []
+        for index, point in enumerate(points):
+            stats = summarize(trades[trades['params'] == index], int(signals[:, index].sum()))
+            summary.append(dict(point, **stats))
+        oos = pd.concat(oos, ignore_index=True) if oos else trades.iloc[:0]
+        return pd.DataFrame(folds), oos, pd.DataFrame(summary)
+
+
+if __name__ == "__main__":
+    import argparse
+    from bar_store import to_datetime_index
+
+    parser = argparse.ArgumentParser(description="첫 봉 매수 규칙 파라미터 최적화 (walk-forward)")
+    parser.add_argument('cond_name', help="조건식 이름")
+    parser.add_argument('start', help="시작일 YYYY-MM-DD")
+    parser.add_argument('end', help="종료일 YYYY-MM-DD (포함)")
+    parser.add_argument('--store', default=BAR_STORE_PATH)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cache', default=None, help="column_cache.py 로 내보낸 폴더")
+    parser.add_argument('--random', type=int, default=0, help="격자 전체 대신 무작위로 고를 조합 수")
+    parser.add_argument('--train-days', type=int, default=20)
+    parser.add_argument('--test-days', type=int, default=5)
+    parser.add_argument('--objective', default='total_return', choices=OBJECTIVES)
+    parser.add_argument('--min-trades', type=int, default=5)
+    args = parser.parse_args()
+
+    points = random_points(count=args.random) if args.random else grid_points()
+    optimizer = WalkForwardOptimizer(args.cond_name, args.store, args.workers, args.objective, args.min_trades,
+                                     args.cache)
+    started = time.perf_counter()
+    folds, oos, summary = optimizer.run(args.start, args.end, points, args.train_days, args.test_days)
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_columns', 30)
+    if len(folds):
+        for column in ('train_start', 'test_start', 'test_end'):
+            folds[column] = to_datetime_index(folds[column]).date
+        print(folds)
+        print(f"Out-of-sample: {summarize(oos, int(folds['test_signals'].sum()))}")
+    print(summary.sort_values(args.objective, ascending=False).head(10)[list(PARAM_SPACE) + list(OBJECTIVES) + ['trades']])
+    print(f"{len(points)} points in {time.perf_counter() - started:.1f}s")
@@ -1,49 +1,161 @@
-import sqlite3
+import sys
+import numpy as np
 import pandas as pd
-import mplfinance as mpf
-import re
 import os
 from datetime import datetime, timedelta  # Import datetime module
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bar_store import BarStore, BAR_STORE_PATH, day_range, parse_db_name, to_epoch, timeframe_label
+from chart_render import ChartRenderer, make_job
+from column_cache import ColumnCache
+
+FIRST_HOUR = (9 * 3600, 10 * 3600)
+SIGNAL_COLUMNS = ['symbol', 'date', 'bars', 'first_open', 'first_close', 'bullish_candles', 'one_price',
+                  'first_bullish', 'no_buy', 'signal', 'buy_price', 'price_0786', 'price_1618']
+
+
+def scan_entry_signals(bars, max_candles=5, entry_ratio=0.382):
+    # analyze_table 의 규칙을 모든 (종목, 날짜) 에 대해 한 번에 계산한다.
+    # bars: symbol, date, open, low, close 컬럼 (fetch_session_bars 결과)
+    if bars.empty:
+        return pd.DataFrame(columns=SIGNAL_COLUMNS)
+    bars = bars.sort_values(['symbol', 'date'], kind='stable')
+    symbol = bars['symbol'].to_numpy()
+    day = bars['date'].dt.normalize().to_numpy()
+
+    # (종목, 날짜) 그룹 번호와 그룹 안에서의 순서
+    new_group = np.ones(len(bars), dtype=bool)
+    new_group[1:] = (symbol[1:] != symbol[:-1]) | (day[1:] != day[:-1])
+    group = np.cumsum(new_group) - 1
+    starts = np.flatnonzero(new_group)
+    pos = np.arange(len(bars)) - starts[group]
+    n_groups = len(starts)
+
+    # 그룹마다 앞의 max_candles 개 봉을 (그룹, 순서) 2차원 배열로
+    keep = pos < max_candles
+    shape = (n_groups, max_candles)
+    opens, closes, lows = np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, np.nan)
+    opens[group[keep], pos[keep]] = bars['open'].to_numpy(dtype=float)[keep]
+    closes[group[keep], pos[keep]] = bars['close'].to_numpy(dtype=float)[keep]
+    lows[group[keep], pos[keep]] = bars['low'].to_numpy(dtype=float)[keep]
+    counts = np.bincount(group, minlength=n_groups)
+
+    levels = entry_levels(opens, closes, lows, counts, entry_ratio)
+    levels['symbol'] = symbol[starts]
+    levels['date'] = day[starts]
+    levels['bars'] = counts
+    return pd.DataFrame(levels, columns=SIGNAL_COLUMNS)
+
+
+def entry_levels(opens, closes, lows, counts, entry_ratio=0.382):
+    # (종목, 날짜) x 앞쪽 봉 2차원 배열 (빈칸 NaN) 로 규칙을 계산한다 (백테스트/최적화에서 재사용)
+    n_groups = len(opens)
+
+    # 첫 번째 봉은 양봉이어야 하고, 2번째 봉부터 연속 양봉 (종가 >= 시가) 의 마지막 종가가 1 가격
+    first_open, first_close = opens[:, 0], closes[:, 0]
+    first_bullish = first_close > first_open
+    bullish = closes[:, 1:] >= opens[:, 1:]
+    run = np.cumprod(bullish, axis=1).sum(axis=1)
+    one_price = closes[np.arange(n_groups), run]
+
+    # 2번째 봉이 음봉이고 저가가 첫 번째 봉의 시가보다 낮으면 매수하지 않음
+    no_buy = (counts > 1) & (closes[:, 1] < opens[:, 1]) & (lows[:, 1] < first_open)
+    signal = first_bullish & ~no_buy
+
+    zero_price = first_open
+    spread = np.where(signal, one_price - zero_price, np.nan)
+    return {
+        'first_open': first_open,
+        'first_close': first_close,
+        'bullish_candles': np.where(first_bullish, run + 1, 0),
+        'one_price': one_price,
+        'first_bullish': first_bullish,
+        'no_buy': no_buy,
+        'signal': signal,
+        'buy_price': zero_price + entry_ratio * spread,
+        'price_0786': zero_price + 0.786 * spread,
+        'price_1618': zero_price + 1.618 * spread,
+    }
+
+
+def signals_from_features(features, entry_ratio=0.382):
+    # session_features 행 (fetch_session_features 결과) 로 scan_entry_signals 와 같은 표를 만든다 (앞쪽 5개 봉 규칙)
+    first_open, first_close = features['first_open'].to_numpy(float), features['first_close'].to_numpy(float)
+    first_bullish = first_close > first_open
+    no_buy = ((features['bars'].to_numpy() > 1) & (features['second_close'].to_numpy(float) < features['second_open'].to_numpy(float))
+              & (features['second_low'].to_numpy(float) < first_open))
+    signal = first_bullish & ~no_buy
+    one_price = features['one_price'].to_numpy(float)
+    spread = np.where(signal, one_price - first_open, np.nan)
+    return pd.DataFrame({
+        'symbol': features['symbol'],
+        'date': features['date'],
+        'bars': features['bars'],
+        'first_open': first_open,
+        'first_close': first_close,
+        'bullish_candles': np.where(first_bullish, features['bullish_run'].to_numpy() + 1, 0),
+        'one_price': one_price,
+        'first_bullish': first_bullish,
+        'no_buy': no_buy,
+        'signal': signal,
+        'buy_price': first_open + entry_ratio * spread,
+        'price_0786': first_open + 0.786 * spread,
+        'price_1618': first_open + 1.618 * spread,
+    }, columns=SIGNAL_COLUMNS)
+
 
 class StockAnalyzer:
-    def __init__(self, db_file):
+    def __init__(self, db_file, store_path=BAR_STORE_PATH, timeframe=180, preset='screen', workers=None,
+                 cache_dir=None):
         self.db_file = db_file
         self.date_str = self.extract_date_from_filename(db_file)
-        self.conn = sqlite3.connect(db_file)
-        self.tables = self.get_tables()
+        self.cond_name = parse_db_name(db_file)[1]
+        self.timeframe = timeframe
+        self.store = BarStore(store_path)
+        self.renderer = ChartRenderer(preset, workers)
+        self.cache = ColumnCache(cache_dir) if cache_dir else None   # column_cache.py 로 내보낸 폴더
 
     def extract_date_from_filename(self, filename):
-        match = re.search(r'\d{8}', filename)
-        if match:
-            date_str = match.group(0)
-            formatted_date = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:]}"
-            return formatted_date
-        else:
-            raise ValueError("Filename does not contain a valid date")
+        date_str = parse_db_name(filename)[0]
+        return f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:]}"
 
-    def get_tables(self):
-        query = "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE '3분%';"
-        tables = pd.read_sql_query(query, self.conn)
-        return tables['name'].tolist()
-
-    def analyze_table(self, table_name, save_dir):
+    def fetch_bars(self):
         # Define time range: 9 AM to 10 AM
         start_time = datetime.strptime(self.date_str + '090000', '%Y-%m-%d%H%M%S')
         end_time = start_time + timedelta(hours=1)
-        
-        # Construct SQL query to fetch data within the specified time range
-        query = f'SELECT * FROM "{table_name}" WHERE date >= ? AND date < ?;'
-        df = pd.read_sql_query(query, self.conn, params=(start_time, end_time))
-        
+
+        # 그날 조건식에 편입된 종목 + 예전 DB 파일에 테이블이 있던 종목 (DBVisualizer 와 같은 종목)의 봉을
+        # 한 번의 쿼리로 조회 (내보낸 캐시가 있으면 mmap 에서)
+        day_start, day_end = day_range(self.date_str)
+        codes = self.store.chart_symbols(self.cond_name, self.db_file, day_start, day_end)
+        if self.cache is not None and self.cache.has_day(self.timeframe, day_start):
+            return self.cache.frame(self.timeframe, to_epoch(start_time), to_epoch(end_time), codes)
+        return self.store.fetch_bars(self.timeframe, to_epoch(start_time), to_epoch(end_time), symbols=codes)
+
+    def scan(self, start_date=None, end_date=None, session=FIRST_HOUR):
+        # 여러 날짜를 한 번의 쿼리로 읽고 모든 종목/날짜의 매수 신호와 가격을 표로 돌려준다
+        start_date = start_date or self.date_str
+        end_date = end_date or start_date
+        bars = self.store.fetch_session_bars(self.timeframe, day_range(start_date)[0], day_range(end_date)[1],
+                                             session, cond_name=self.cond_name)
+        return scan_entry_signals(bars)
+
+    def screen(self, start_date=None, end_date=None):
+        # scan() 과 같은 결과를 봉 대신 미리 계산된 session_features 에서 읽는다 (종목/날짜당 한 행)
+        start_date = start_date or self.date_str
+        end_date = end_date or start_date
+        features = self.store.fetch_session_features(self.timeframe, day_range(start_date)[0], day_range(end_date)[1],
+                                                     cond_name=self.cond_name)
+        return signals_from_features(features)
+
+    def analyze_table(self, table_name, df, save_dir):
+        # 분석 결과를 차트 작업으로 돌려준다 (그리는 것은 analyze_all 에서 한 번에)
         if df.empty:
-            print(f"No data found for {table_name} between {start_time} and {end_time}")
+            print(f"No data found for {table_name}")
             return
-        
-        # Convert date format to datetime and set as index
-        df['date'] = pd.to_datetime(df['date'])
-        df.set_index('date', inplace=True)
-        
+
+        df = df.set_index('date')
+
         # Perform candlestick pattern analysis and generate overlays
         first_open, first_close = df.iloc[0]['open'], df.iloc[0]['close']
         last_close = df.iloc[-1]['close']
@@ -74,9 +186,9 @@ class StockAnalyzer:
         zero_price = first_open
         one_price = last_close
         
-        addplots = [
-            mpf.make_addplot(pd.Series([zero_price]*len(df), index=df.index), type='line', linestyle='-', width=2, color='b', label='0 Price'),
-            mpf.make_addplot(pd.Series([one_price]*len(df), index=df.index), type='line', linestyle='-', width=2, color='g', label='1 Price')
+        hlines = [
+            (zero_price, 'b', 2, '0 Price'),
+            (one_price, 'g', 2, '1 Price'),
         ]
 
         if no_buy:
@@ -89,25 +201,33 @@ class StockAnalyzer:
             price_0786 = zero_price + 0.786 * (one_price - zero_price)
             price_1618 = zero_price + 1.618 * (one_price - zero_price)
             
-            addplots.append(mpf.make_addplot(pd.Series([buy_price]*len(df), index=df.index), type='line', linestyle='-', width=1, color='r', label='Buy Order (0.382)'))
-            addplots.append(mpf.make_addplot(pd.Series([price_0786]*len(df), index=df.index), type='line', linestyle='-', width=1, color='purple', label='0.786 Price'))
-            addplots.append(mpf.make_addplot(pd.Series([price_1618]*len(df), index=df.index), type='line', linestyle='-', width=1, color='orange', label='1.618 Price'))
+            hlines.append((buy_price, 'r', 1, 'Buy Order (0.382)'))
+            hlines.append((price_0786, 'purple', 1, '0.786 Price'))
+            hlines.append((price_1618, 'orange', 1, '1.618 Price'))
 
-        # Save the plot
-        os.makedirs(save_dir, exist_ok=True)
         filename = f"{table_name}.jpg"
         file_path = os.path.join(save_dir, filename)
-        
-        mpf.plot(df, type='candle', addplot=addplots, title=f"{table_name} - {self.date_str}", style='charles', ylabel='Price', savefig=file_path, figscale=2.0, tight_layout=True)
-        print(f"{table_name} analysis saved to {file_path}")
+        return make_job(file_path, df[['open', 'high', 'low', 'close', 'volume']], f"{table_name} - {self.date_str}",
+                        hlines=hlines, ylabel='Price', figscale=2.0, tight_layout=True)
 
 
     def analyze_all(self, save_dir):
-        for table_name in self.tables:
-            self.analyze_table(table_name, save_dir)
+        df_all = self.fetch_bars()
+        if df_all.empty:
+            print(f"No data found for {self.cond_name} on {self.date_str}")
+            return
+        jobs = []
+        for symbol, df in df_all.groupby('symbol'):
+            job = self.analyze_table(f"{timeframe_label(self.timeframe)}_{symbol}", df, save_dir)
+            if job is not None:
+                jobs.append(job)
+
+        # 프로세스 풀에서 병렬로 그리고, 데이터가 바뀌지 않은 차트는 건너뜀
+        result = self.renderer.render(jobs)
+        print(f"{save_dir}: {result['rendered']} charts saved, {result['unchanged']} unchanged, {result['failed']} failed")
 
     def close_connection(self):
-        self.conn.close()
+        self.store.close()
 
 if __name__ == "__main__":
     db_file = '20240716_시가갭검색식_돌파.db'
@@ -1,139 +1,184 @@
+import os
+import sys
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
-import yfinance as yf
 import hdbscan
-import numpy as np
-import matplotlib.pyplot as plt
 from sklearn.preprocessing import MinMaxScaler
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.patches as mpatches
 from datetime import datetime
 
-def fetch_and_plot_data():
-    global df, support_resistance_lines, confidence
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from daily_cache import DailyCache
+from support_resistance import cluster_stats
+
+MIN_CLUSTER_SIZE = 5
+
+# (ticker, start, end, source, min_cluster_size) -> (df, support_resistance_lines, confidence)
+cluster_cache = {}
+# 작업 스레드 -> Tk 메인 스레드: ('progress', 퍼센트, 메시지) / ('done', key, 결과) / ('error', 제목, 메시지)
+worker_events = queue.Queue()
+
+
+def compute_levels(key, report):
+    # 작업 스레드에서 실행 (Tk 위젯은 건드리지 않는다). sqlite 연결도 이 스레드에서 따로 연다
+    ticker_symbol, start_date, end_date, source, min_cluster_size = key
+    report(10, "Fetching data")
+    daily_cache = DailyCache()
+    try:
+        # 받아 둔 날짜는 캐시에서 읽고 빠진 날짜만 받는다 (로컬 봉 사용 시 네트워크 없이)
+        df_minute = daily_cache.daily(ticker_symbol, start_date, end_date, source=source)
+    finally:
+        daily_cache.close()
+    if df_minute.empty:
+        if source == 'local':
+            raise ValueError("No recorded bars found for the given ticker symbol and date range.")
+        raise ValueError("No data found for the given ticker symbol and date range in both KOSPI and KOSDAQ.")
+
+    print("Data fetched successfully.")
+
+    # Extract closing prices
+    df = df_minute[['Close']]
+
+    if df.empty:
+        raise ValueError("No closing price data available.")
+
+    # Data normalization
+    report(40, "Normalizing")
+    scaler = MinMaxScaler()
+    data_normalized = scaler.fit_transform(df['Close'].values.reshape(-1, 1))
+
+    # Clustering for support and resistance lines
+    report(50, "Clustering")
+    clusterer = hdbscan.HDBSCAN(min_cluster_size=min_cluster_size)
+    cluster_labels = clusterer.fit_predict(data_normalized)
+
+    print("Clustering completed.")
+
+    # Find median and size of each cluster to determine support/resistance lines (한 번에 집계)
+    report(90, "Calculating levels")
+    _, medians, cluster_sizes, _ = cluster_stats(data_normalized, cluster_labels)
+    if not len(medians):
+        raise ValueError("No clusters found. Try a longer date range.")
+
+    # Inverse transform to original scale
+    support_resistance_lines = scaler.inverse_transform(medians.reshape(-1, 1)).flatten()
+
+    # Calculate confidence
+    confidence = cluster_sizes / cluster_sizes.max()
+
+    print("Support and resistance lines calculated.")
+    return df, support_resistance_lines, confidence
 
-    ticker_symbol = entry_ticker.get()
-    start_date = entry_start_date.get()
-    end_date = entry_end_date.get()
 
-    # Attempt to fetch data from KOSPI first
-    ticker_symbol_ks = ticker_symbol + ".KS"
-    ticker_symbol_kq = ticker_symbol + ".KQ"
+def run_worker(key):
+    def report(percent, message):
+        worker_events.put(('progress', percent, message))
 
     try:
-        print(f"Fetching data for {ticker_symbol_ks} from {start_date} to {end_date}")
-        # Fetch historical data for KOSPI
-        ticker = yf.Ticker(ticker_symbol_ks)
-        df_minute = ticker.history(interval='1d', start=start_date, end=end_date, actions=True, auto_adjust=True)
-
-        if df_minute.empty:
-            print(f"No data found for {ticker_symbol_ks}. Trying {ticker_symbol_kq}")
-            # Fetch historical data for KOSDAQ
-            ticker = yf.Ticker(ticker_symbol_kq)
-            df_minute = ticker.history(interval='1d', start=start_date, end=end_date, actions=True, auto_adjust=True)
-            if df_minute.empty:
-                raise ValueError("No data found for the given ticker symbol and date range in both KOSPI and KOSDAQ.")
-        
-        print("Data fetched successfully.")
-        
-        # Extract closing prices
-        df = df_minute[['Close']]
-
-        if df.empty:
-            raise ValueError("No closing price data available.")
-        
-        print("Closing price data extracted.")
-
-        # Data normalization
-        scaler = MinMaxScaler()
-        data_normalized = scaler.fit_transform(df['Close'].values.reshape(-1, 1))
-        
-        print("Data normalized.")
-
-        # Clustering for support and resistance lines
-        clusterer = hdbscan.HDBSCAN(min_cluster_size=5)
-        cluster_labels = clusterer.fit_predict(data_normalized)
-        
-        print("Clustering completed.")
-
-        # Find median of each cluster to determine support/resistance lines
-        unique_labels = set(cluster_labels)
-        support_resistance_lines_normalized = [np.median(data_normalized[cluster_labels == label])
-                                               for label in unique_labels if label != -1]
-
-        # Inverse transform to original scale
-        support_resistance_lines = scaler.inverse_transform(np.array(support_resistance_lines_normalized).reshape(-1, 1)).flatten()
-        
-        print("Support and resistance lines calculated.")
-
-        # Calculate confidence
-        cluster_sizes = [np.sum(cluster_labels == label) for label in unique_labels if label != -1]
-        confidence = [size / np.max(cluster_sizes) for size in cluster_sizes]
-        
-        print("Confidence calculated.")
-
-        update_charts()
-        
+        worker_events.put(('done', key, compute_levels(key, report)))
     except ValueError as e:
-        messagebox.showerror("Error", str(e))
         print(f"ValueError: {str(e)}")
+        worker_events.put(('error', "Error", str(e)))
     except Exception as e:
-        messagebox.showerror("Unexpected Error", str(e))
         print(f"Unexpected Error: {str(e)}")
+        worker_events.put(('error', "Unexpected Error", str(e)))
 
-def update_charts(*args):
-    # Get the confidence threshold from the slider
-    confidence_threshold = slider_threshold.get() / 100
-    
-    high_confidence_lines = [(line, conf) for line, conf in zip(support_resistance_lines, confidence) if conf >= confidence_threshold]
-    
-    # Plot the closing prices and support/resistance lines
-    fig, ax = plt.subplots(figsize=(14, 7))
-    ax.plot(df.index, df['Close'], label='Close Price')
 
-    for line, conf in high_confidence_lines:
-        ax.axhline(line, linestyle='--', linewidth=2, color=(1 - conf, 0, conf), alpha=0.7)
-        ax.text(df.index[-1], line, f'{line:.2f}', verticalalignment='bottom', horizontalalignment='right', color='black', fontsize=10)
+def fetch_and_plot_data():
+    key = (entry_ticker.get(), entry_start_date.get(), entry_end_date.get(),
+           'local' if use_local_bars.get() else 'yahoo', MIN_CLUSTER_SIZE)
+    if key in cluster_cache:
+        # 같은 조건으로 이미 계산한 결과는 다시 계산하지 않는다
+        show_result(key, cluster_cache[key])
+        return
+    button_fetch.config(state=tk.DISABLED)
+    set_progress(0, "Starting")
+    threading.Thread(target=run_worker, args=(key,), daemon=True).start()
+    root.after(100, poll_worker)
+
+
+def poll_worker():
+    # 작업 스레드가 보낸 진행 상황/결과를 메인 스레드에서 처리
+    while True:
+        try:
+            event = worker_events.get_nowait()
+        except queue.Empty:
+            root.after(100, poll_worker)
+            return
+        if event[0] == 'progress':
+            set_progress(event[1], event[2])
+            continue
+        button_fetch.config(state=tk.NORMAL)
+        if event[0] == 'done':
+            cluster_cache[event[1]] = event[2]
+            show_result(event[1], event[2])
+        else:
+            set_progress(0, "Failed")
+            messagebox.showerror(event[1], event[2])
+        return
+
+
+def set_progress(percent, message):
+    progress_bar['value'] = percent
+    label_progress.config(text=message)
+
+
+def show_result(key, result):
+    global df, support_resistance_lines, confidence
+    df, support_resistance_lines, confidence = result
+    set_progress(100, "Done")
+    draw_levels(key[0])
+
+
+def draw_levels(ticker_symbol):
+    # 새 결과가 들어왔을 때만 축을 다시 만든다. 선은 모두 그려 두고 슬라이더는 보이기/색만 바꾼다
+    level_artists.clear()
+    ax_price.clear()
+    ax_price.plot(df.index, df['Close'], label='Close Price')
+    for line in support_resistance_lines:
+        hline = ax_price.axhline(line, linestyle='--', linewidth=2, alpha=0.7)
+        text = ax_price.text(df.index[-1], line, f'{line:.2f}', verticalalignment='bottom',
+                             horizontalalignment='right', color='black', fontsize=10)
+        level_artists.append((hline, text))
 
     # Add legend
     red_patch = mpatches.Patch(color='red', label='Low Confidence')
     blue_patch = mpatches.Patch(color='blue', label='High Confidence')
-    ax.legend(handles=[red_patch, blue_patch])
+    ax_price.legend(handles=[red_patch, blue_patch])
 
-    ax.set_title(f'{entry_ticker.get()} High Confidence Support and Resistance Lines')
-    ax.set_xlabel('Date')
-    ax.set_ylabel('Price')
+    ax_price.set_title(f'{ticker_symbol} High Confidence Support and Resistance Lines')
+    ax_price.set_xlabel('Date')
+    ax_price.set_ylabel('Price')
 
-    # Clear the previous plot
-    for widget in frame_plot.winfo_children():
-        widget.destroy()
+    ax_confidence.clear()
+    confidence_bars[:] = ax_confidence.bar(range(len(confidence)), confidence, color='blue')
+    ax_confidence.set_title('Confidence Levels of Support and Resistance Lines')
+    ax_confidence.set_xlabel('Line Index')
+    ax_confidence.set_ylabel('Confidence')
 
-    # Display the plot in the Tkinter window
-    canvas = FigureCanvasTkAgg(fig, master=frame_plot)
-    canvas.draw()
-    canvas.get_tk_widget().pack()
-    
+    update_charts()
     print("Plot displayed successfully.")
 
-    # Update confidence bar chart
-    update_confidence_bar_chart(confidence)
-
-def update_confidence_bar_chart(confidence):
-    # Clear the previous bar chart
-    for widget in frame_confidence.winfo_children():
-        widget.destroy()
-    
-    # Create a new figure for the bar chart
-    fig, ax = plt.subplots(figsize=(6, 3))
-    ax.bar(range(len(confidence)), confidence, color='blue')
-    ax.set_title('Confidence Levels of Support and Resistance Lines')
-    ax.set_xlabel('Line Index')
-    ax.set_ylabel('Confidence')
-    
-    # Display the bar chart in the Tkinter window
-    canvas = FigureCanvasTkAgg(fig, master=frame_confidence)
-    canvas.draw()
-    canvas.get_tk_widget().pack()
+
+def update_charts(*args):
+    # Get the confidence threshold from the slider
+    if not level_artists:
+        return
+    confidence_threshold = slider_threshold.get() / 100
+
+    for (hline, text), bar, conf in zip(level_artists, confidence_bars, confidence):
+        visible = conf >= confidence_threshold
+        hline.set_visible(visible)
+        hline.set_color((1 - conf, 0, conf))
+        text.set_visible(visible)
+        bar.set_alpha(1.0 if visible else 0.3)
+
+    canvas_price.draw_idle()
+    canvas_confidence.draw_idle()
 
 def set_end_date_to_today():
     today = datetime.today().strftime('%Y-%m-%d')
@@ -170,9 +215,19 @@ entry_end_date.pack()
 button_set_today = tk.Button(root, text="Set End Date to Today", command=set_end_date_to_today)
 button_set_today.pack()
 
+use_local_bars = tk.BooleanVar(value=False)
+check_local = tk.Checkbutton(root, text="Use Recorded Bars (offline)", variable=use_local_bars)
+check_local.pack()
+
 button_fetch = tk.Button(root, text="Fetch and Plot Data", command=fetch_and_plot_data)
 button_fetch.pack()
 
+progress_bar = ttk.Progressbar(root, length=200, maximum=100)
+progress_bar.pack()
+
+label_progress = tk.Label(root, text="")
+label_progress.pack()
+
 label_slider = tk.Label(root, text="Confidence Threshold:")
 label_slider.pack()
 
@@ -188,6 +243,20 @@ frame_plot.pack(fill=tk.BOTH, expand=True)
 frame_confidence = tk.Frame(root)
 frame_confidence.pack(fill=tk.BOTH, expand=True)
 
+# Figure/캔버스는 한 번만 만들어서 계속 쓴다 (pyplot 에 등록하지 않으므로 닫지 않아도 쌓이지 않음)
+fig_price = Figure(figsize=(14, 7))
+ax_price = fig_price.add_subplot()
+canvas_price = FigureCanvasTkAgg(fig_price, master=frame_plot)
+canvas_price.get_tk_widget().pack()
+
+fig_confidence = Figure(figsize=(6, 3))
+ax_confidence = fig_confidence.add_subplot()
+canvas_confidence = FigureCanvasTkAgg(fig_confidence, master=frame_confidence)
+canvas_confidence.get_tk_widget().pack()
+
+level_artists = []     # [(axhline, text)], support_resistance_lines 와 같은 순서
+confidence_bars = []
+
 # Set the protocol for the window close button
 root.protocol("WM_DELETE_WINDOW", on_closing)
 